@@ -5,7 +5,9 @@ from flask import Flask
 from flask_cors import CORS
 
 from app.config.loader import load_config
-from app.services import update_comfyui_runtime
+from app.utils import prune_site_cache
+from app.utils.filters import configure_filter_log
+from app.services import update_comfyui_runtime, update_executor_workers, update_task_retention, resume_unfinished_tasks, configure_llm_cache, prune_llm_cache, configure_gemini_pool, configure_gemini_limiter, configure_context_cache
 
 
 def create_app():
@@ -23,6 +25,18 @@ def create_app():
     # 加载配置并初始化服务
     config = load_config()
     update_comfyui_runtime(config)
+    update_executor_workers(config.get('max_concurrent_tasks', 3), config.get('stage_pool_sizes'))
+    update_task_retention(config)
+    configure_llm_cache(config)
+    prune_llm_cache()
+    prune_site_cache()
+    configure_gemini_pool(config)
+    configure_gemini_limiter(config)
+    configure_context_cache(config)
+    configure_filter_log(config)
+
+    # 恢复上次运行中断的生成任务
+    resume_unfinished_tasks(config)
 
     # 注册 blueprints
     from app.views import pages_bp
@@ -3,8 +3,9 @@
 from flask import Blueprint, request, jsonify
 from app.config.loader import load_config, save_config, get_comfyui_settings, get_gemini_image_settings
 from app.config import IMAGE_STYLE_TEMPLATES
-from app.services import update_comfyui_runtime, get_available_models
-from app.services.task_service import update_executor_workers
+from app.services import update_comfyui_runtime, get_available_models, configure_llm_cache, configure_gemini_pool, get_gemini_pool_stats, configure_gemini_limiter, configure_context_cache
+from app.services.task_service import update_executor_workers, update_task_retention
+from app.utils.filters import configure_filter_log
 from app.services.gemini_image_service import (
     test_gemini_image_api,
     get_gemini_image_models,
@@ -54,6 +55,8 @@ def handle_config():
             'gemini_image_api_key_set': bool(config.get('gemini_image_settings', {}).get('api_key')),
             # 检查是否配置了独立的 Gemini 图像 Base URL（不包括回退的主模型 Base URL）
             'gemini_image_base_url_set': bool(config.get('gemini_image_settings', {}).get('base_url')),
+            # 密钥池中各密钥的用量和冷却状态（密钥只显示末 4 位）
+            'gemini_key_pool_usage': get_gemini_pool_stats(),
             'gemini_image_style_presets': [
                 {'id': key, 'name': value['name']}
                 for key, value in GEMINI_IMAGE_STYLE_PRESETS.items()
@@ -73,8 +76,41 @@ def handle_config():
             'temperature': float(new_config.get('temperature', old_config.get('temperature', 1.0))),
             'top_p': float(new_config.get('top_p', old_config.get('top_p', 0.95))),
             'enable_google_search': new_config.get('enable_google_search', old_config.get('enable_google_search', True)),
+            # 流式生成正文、合并图片规划请求，仅支持在 config.json 中调整
+            'stream_article': new_config.get('stream_article', old_config.get('stream_article', True)),
+            'fuse_image_planning': new_config.get('fuse_image_planning', old_config.get('fuse_image_planning', True)),
+            'image_planning_model': new_config.get('image_planning_model', old_config.get('image_planning_model', '')),
             'append_citations': new_config.get('append_citations', old_config.get('append_citations', False)),
+            # 引用解析的总时限（秒），仅支持在 config.json 中调整
+            'citation_deadline_seconds': float(new_config.get('citation_deadline_seconds', old_config.get('citation_deadline_seconds', 30))),
+            # 过滤日志格式和单个文件大小上限，仅支持在 config.json 中调整
+            'filter_log_format': new_config.get('filter_log_format', old_config.get('filter_log_format', 'text')),
+            'filter_log_max_bytes': int(new_config.get('filter_log_max_bytes', old_config.get('filter_log_max_bytes', 10 * 1024 * 1024))),
             'max_concurrent_tasks': int(new_config.get('max_concurrent_tasks', old_config.get('max_concurrent_tasks', 3))),
+            # 各阶段线程池大小（默认随 max_concurrent_tasks 缩放），仅支持在 config.json 中调整
+            'stage_pool_sizes': new_config.get('stage_pool_sizes', old_config.get('stage_pool_sizes', {})),
+            'max_retry_attempts': int(new_config.get('max_retry_attempts', old_config.get('max_retry_attempts', 10))),
+            # 自动重试退避时间（秒），仅支持在 config.json 中调整
+            'retry_backoff_base': float(new_config.get('retry_backoff_base', old_config.get('retry_backoff_base', 5))),
+            'retry_backoff_max': float(new_config.get('retry_backoff_max', old_config.get('retry_backoff_max', 300))),
+            # 已完成任务的内存保留策略，仅支持在 config.json 中调整
+            'task_retention_seconds': int(new_config.get('task_retention_seconds', old_config.get('task_retention_seconds', 6 * 3600))),
+            'max_tasks_in_memory': int(new_config.get('max_tasks_in_memory', old_config.get('max_tasks_in_memory', 50))),
+            # LLM 响应缓存，仅支持在 config.json 中调整
+            'llm_cache_enabled': new_config.get('llm_cache_enabled', old_config.get('llm_cache_enabled', True)),
+            'llm_cache_ttls': new_config.get('llm_cache_ttls', old_config.get('llm_cache_ttls', {})),
+            'llm_cache_memory_entries': int(new_config.get('llm_cache_memory_entries', old_config.get('llm_cache_memory_entries', 256))),
+            'llm_cache_max_entries': int(new_config.get('llm_cache_max_entries', old_config.get('llm_cache_max_entries', 5000))),
+            'cache_article_responses': new_config.get('cache_article_responses', old_config.get('cache_article_responses', False)),
+            'gemini_context_cache': new_config.get('gemini_context_cache', old_config.get('gemini_context_cache', False)),
+            'gemini_context_cache_ttl': int(new_config.get('gemini_context_cache_ttl', old_config.get('gemini_context_cache_ttl', 3600))),
+            # Gemini 密钥池和速率上限，仅支持在 config.json 中调整
+            'gemini_key_pool': new_config.get('gemini_key_pool', old_config.get('gemini_key_pool', [])),
+            'gemini_image_key_pool': new_config.get('gemini_image_key_pool', old_config.get('gemini_image_key_pool', [])),
+            'gemini_rpm_limit': int(new_config.get('gemini_rpm_limit', old_config.get('gemini_rpm_limit', 0))),
+            'gemini_tpm_limit': int(new_config.get('gemini_tpm_limit', old_config.get('gemini_tpm_limit', 0))),
+            'adaptive_concurrency': new_config.get('adaptive_concurrency', old_config.get('adaptive_concurrency', True)),
+            'gemini_concurrency_limits': new_config.get('gemini_concurrency_limits', old_config.get('gemini_concurrency_limits', {})),
             'image_source_priority': new_config.get('image_source_priority', old_config.get('image_source_priority', [])),
             'local_image_directories': new_config.get('local_image_directories', old_config.get('local_image_directories', [])),
             'enable_user_upload': new_config.get('enable_user_upload', old_config.get('enable_user_upload', True)),
@@ -143,7 +179,13 @@ def handle_config():
             final_config['comfyui_summary_model'] = final_config.get('default_model', 'gemini-pro')
 
         save_config(final_config)
-        update_executor_workers(final_config.get('max_concurrent_tasks', 3))
+        update_executor_workers(final_config.get('max_concurrent_tasks', 3), final_config.get('stage_pool_sizes'))
+        update_task_retention(final_config)
+        configure_llm_cache(final_config)
+        configure_gemini_pool(final_config)
+        configure_gemini_limiter(final_config)
+        configure_context_cache(final_config)
+        configure_filter_log(final_config)
         update_comfyui_runtime(final_config)
 
         return jsonify({'success': True, 'message': '配置保存成功'})
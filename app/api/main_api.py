@@ -1,18 +1,23 @@
 """主要API路由（图片、生成、历史记录等）"""
 
 import os
+import json
+import queue
 import shutil
 import subprocess
 import sys
+import time
+import threading
 from datetime import datetime
 
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, Response, request, jsonify, send_file
 from werkzeug.utils import secure_filename
 
 from app.config.loader import load_config
 from app.config import ALLOWED_EXTENSIONS
 from app.utils.file_helpers import allowed_file, generate_safe_filename
 from app.utils.network import download_image_from_url as util_download_image
+from app.utils.filters import get_keyword_hit_stats, get_filter_log_stats
 from app.services import (
     test_unsplash_connection,
     test_pexels_connection,
@@ -23,10 +28,31 @@ from app.services import (
     list_uploaded_images,
     list_generated_documents,
     create_generation_task,
+    cancel_generation_task,
     get_task_status,
+    get_task_version,
+    get_task_memory_report,
+    get_llm_cache_stats,
+    clear_llm_cache,
+    get_context_cache_stats,
+    get_gemini_limiter_stats,
+    get_gemini_pool_stats,
+    get_citation_filter_stats,
     retry_failed_topics_in_task
 )
 
+from app.services.scheduler import SchedulerBusyError
+from app.services.task_events import subscribe_task_events, unsubscribe_task_events, get_last_event_id
+
+# SSE 心跳间隔（秒），用于保持连接并及时发现断开的客户端
+SSE_KEEPALIVE_SECONDS = 15
+# 同时保持的 SSE 连接上限：每个连接独占一个工作线程，上限低于 app_stable.py 中
+# waitress 的 8 个线程，保证普通请求始终有线程可用；超出上限返回 503，前端改用轮询
+SSE_MAX_STREAMS = 4
+# 单个 SSE 连接的最长保持时间（秒），到期后服务端结束响应，浏览器按 Last-Event-ID 重连
+SSE_MAX_STREAM_SECONDS = 600
+_sse_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+
 main_api_bp = Blueprint('main_api', __name__, url_prefix='/api')
 
 
@@ -135,17 +161,131 @@ def generate_article():
     if not config.get('pandoc_path'):
         return jsonify({'error': '请先在配置页面设置 Pandoc 可执行文件路径！'}), 400
 
-    task_id = create_generation_task(topics, topic_images, config)
+    try:
+        priority = int(data.get('priority', 0))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'priority 必须是整数'}), 400
+
+    try:
+        task_id = create_generation_task(topics, topic_images, config, priority)
+    except SchedulerBusyError as e:
+        return jsonify({'error': str(e)}), 429
     return jsonify({'success': True, 'task_id': task_id})
 
 
 @main_api_bp.route('/generate/status/<task_id>', methods=['GET'])
 def get_generation_status(task_id):
-    """获取生成任务的状态"""
-    task = get_task_status(task_id)
+    """获取生成任务的状态
+
+    响应带有 ETag（任务版本号），客户端携带 If-None-Match 且任务未变化时返回 304；
+    ?since=<version> 只返回该版本之后变化的结果和错误。
+    """
+    since = request.args.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return jsonify({'error': 'since 必须是整数版本号'}), 400
+
+    version = get_task_version(task_id)
+    if version is None:
+        return jsonify({'error': '任务不存在'}), 404
+    if request.if_none_match.contains(str(version)):
+        response = Response(status=304)
+        response.set_etag(str(version))
+        return response
+
+    task = get_task_status(task_id, since)
     if not task:
         return jsonify({'error': '任务不存在'}), 404
-    return jsonify(task)
+    response = jsonify(task)
+    response.set_etag(str(task.get('version', version)))
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def _format_sse(event, data, event_id=None):
+    """格式化一条 SSE 消息"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, ensure_ascii=False, default=str)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+@main_api_bp.route('/generate/stream/<task_id>', methods=['GET'])
+def stream_generation_status(task_id):
+    """以 Server-Sent Events 推送任务的增量事件
+
+    首次连接先发送一次完整快照（snapshot），之后只推送 topic_started、
+    stage_changed、topic_retrying、topic_finished、topic_failed、
+    topics_requeued 和 task_completed 事件；断线重连时按 Last-Event-ID 补发。
+    同时保持的连接数超过 SSE_MAX_STREAMS 时返回 503，单个连接最长保持
+    SSE_MAX_STREAM_SECONDS 秒。
+    """
+    # 长连接会独占工作线程，单线程服务器下改用轮询接口
+    if not request.environ.get('wsgi.multithread'):
+        return jsonify({'error': '当前服务器为单线程模式，不支持实时推送，请使用轮询接口'}), 501
+
+    if not _sse_slots.acquire(blocking=False):
+        response = jsonify({'error': '实时推送连接数已达上限，请使用轮询接口'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(SSE_KEEPALIVE_SECONDS)
+        return response
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    subscriber, backlog = subscribe_task_events(task_id, last_event_id)
+    snapshot = None
+    if backlog is None:
+        snapshot_id = get_last_event_id(task_id)
+        snapshot = get_task_status(task_id)
+        if not snapshot:
+            unsubscribe_task_events(task_id, subscriber)
+            _sse_slots.release()
+            return jsonify({'error': '任务不存在'}), 404
+
+    deadline = time.monotonic() + SSE_MAX_STREAM_SECONDS
+
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            if snapshot is not None:
+                yield _format_sse('snapshot', snapshot, snapshot_id)
+                if snapshot.get('status') == 'completed':
+                    return
+            for event_id, event, data in backlog or ():
+                yield _format_sse(event, data, event_id)
+                if event == 'task_completed':
+                    return
+            while True:
+                # 到达最长保持时间后结束响应，释放工作线程；浏览器会自动重连并补发事件
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    event_id, event, data = subscriber.get(timeout=min(SSE_KEEPALIVE_SECONDS, remaining))
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield _format_sse(event, data, event_id)
+                if event == 'task_completed':
+                    return
+        finally:
+            unsubscribe_task_events(task_id, subscriber)
+
+    response = Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # 服务器关闭响应时释放连接名额（客户端在开始读取前断开时生成器不会执行 finally）
+    response.call_on_close(_sse_slots.release)
+    return response
 
 
 @main_api_bp.route('/generate/retry', methods=['POST'])
@@ -182,6 +322,70 @@ def retry_failed_topics():
         return jsonify({'error': '重试失败'}), 500
 
 
+@main_api_bp.route('/generate/cancel', methods=['POST'])
+def cancel_generation():
+    """取消整个批次或其中部分主题"""
+    data = request.json or {}
+    task_id = data.get('task_id')
+    topics = data.get('topics')
+
+    if not task_id:
+        return jsonify({'error': '缺少 task_id'}), 400
+    if topics is not None and not isinstance(topics, list):
+        return jsonify({'error': 'topics 必须是数组'}), 400
+
+    result = cancel_generation_task(task_id, topics)
+    if not result['found']:
+        return jsonify({'error': '任务不存在'}), 404
+    return jsonify({
+        'success': True,
+        'task_id': task_id,
+        'cancelled': result['cancelled'],
+        'message': f"已取消 {len(result['cancelled'])} 个主题"
+    })
+
+
+# ====================
+# 管理 API
+# ====================
+
+@main_api_bp.route('/admin/tasks/memory', methods=['GET'])
+def get_task_memory():
+    """报告内存中任务记录的数量、占用和保留策略"""
+    return jsonify(get_task_memory_report())
+
+
+@main_api_bp.route('/admin/llm-cache', methods=['GET', 'DELETE'])
+def get_llm_cache():
+    """报告 LLM 响应缓存的命中率和条目数，以及 Gemini 上下文缓存的使用情况；DELETE 清空 LLM 响应缓存"""
+    if request.method == 'DELETE':
+        removed = clear_llm_cache()
+        return jsonify({'success': True, 'removed': removed})
+    return jsonify({
+        **get_llm_cache_stats(),
+        'context_cache': get_context_cache_stats()
+    })
+
+
+@main_api_bp.route('/admin/filters', methods=['GET'])
+def get_filter_stats():
+    """报告引用过滤规则的命中情况"""
+    return jsonify({
+        'keywords': get_keyword_hit_stats(),
+        'citation_rules': get_citation_filter_stats(),
+        'event_log': get_filter_log_stats()
+    })
+
+
+@main_api_bp.route('/admin/gemini-limits', methods=['GET'])
+def get_gemini_limits():
+    """报告各类 Gemini 接口的自适应并发上限、延迟和密钥用量"""
+    return jsonify({
+        'limits': get_gemini_limiter_stats(),
+        'keys': get_gemini_pool_stats()
+    })
+
+
 # ====================
 # 历史记录 API
 # ====================
@@ -6,7 +6,10 @@ from .defaults import (
     VISUAL_TEMPLATE_PRESETS,
     IMAGE_STYLE_TEMPLATES,
     SUMMARY_MODEL_SPECIAL_OPTIONS,
-    CONFIG_FILE
+    CONFIG_FILE,
+    TASK_STORE_FILE,
+    LLM_CACHE_FILE,
+    SITE_CACHE_FILE
 )
 
 from .loader import (
@@ -22,6 +25,9 @@ __all__ = [
     'IMAGE_STYLE_TEMPLATES',
     'SUMMARY_MODEL_SPECIAL_OPTIONS',
     'CONFIG_FILE',
+    'TASK_STORE_FILE',
+    'LLM_CACHE_FILE',
+    'SITE_CACHE_FILE',
     'load_config',
     'save_config',
     'get_comfyui_settings'
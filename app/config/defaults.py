@@ -99,3 +99,12 @@ SUMMARY_MODEL_SPECIAL_OPTIONS = ['__default__']
 
 # 配置文件路径
 CONFIG_FILE = 'config.json'
+
+# 任务持久化存储路径（SQLite）
+TASK_STORE_FILE = 'tasks.db'
+
+# LLM 响应缓存路径（SQLite）
+LLM_CACHE_FILE = 'llm_cache.db'
+
+# 引用来源解析缓存路径（SQLite）
+SITE_CACHE_FILE = 'site_cache.db'
@@ -5,8 +5,10 @@ from .gemini_service import (
     generate_visual_blueprint,
     build_visual_prompts,
     summarize_paragraph_for_image,
+    summarize_paragraphs_for_images,
     test_gemini_model,
-    get_available_models
+    get_available_models,
+    get_citation_filter_stats
 )
 
 from .image_service import (
@@ -30,9 +32,36 @@ from .document_service import (
 
 from .task_service import (
     create_generation_task,
+    cancel_generation_task,
     get_task_status,
+    get_task_version,
     retry_failed_topics_in_task,
-    update_executor_workers
+    resume_unfinished_tasks,
+    update_executor_workers,
+    update_task_retention,
+    get_task_memory_report
+)
+
+from .llm_cache import (
+    configure_llm_cache,
+    prune_llm_cache,
+    clear_llm_cache,
+    get_llm_cache_stats
+)
+
+from .gemini_pool import (
+    configure_gemini_pool,
+    get_gemini_pool_stats
+)
+
+from .gemini_limiter import (
+    configure_gemini_limiter,
+    get_gemini_limiter_stats
+)
+
+from .gemini_context_cache import (
+    configure_context_cache,
+    get_context_cache_stats
 )
 
 __all__ = [
@@ -40,8 +69,10 @@ __all__ = [
     'generate_visual_blueprint',
     'build_visual_prompts',
     'summarize_paragraph_for_image',
+    'summarize_paragraphs_for_images',
     'test_gemini_model',
     'get_available_models',
+    'get_citation_filter_stats',
     'list_local_images',
     'list_uploaded_images',
     'test_unsplash_connection',
@@ -53,7 +84,22 @@ __all__ = [
     'create_word_document',
     'list_generated_documents',
     'create_generation_task',
+    'cancel_generation_task',
     'get_task_status',
+    'get_task_version',
     'retry_failed_topics_in_task',
-    'update_executor_workers'
+    'resume_unfinished_tasks',
+    'update_executor_workers',
+    'update_task_retention',
+    'get_task_memory_report',
+    'configure_llm_cache',
+    'prune_llm_cache',
+    'clear_llm_cache',
+    'get_llm_cache_stats',
+    'configure_gemini_pool',
+    'get_gemini_pool_stats',
+    'configure_gemini_limiter',
+    'get_gemini_limiter_stats',
+    'configure_context_cache',
+    'get_context_cache_stats'
 ]
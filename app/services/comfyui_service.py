@@ -12,6 +12,7 @@ from datetime import datetime
 from pathlib import Path
 from app.config import IMAGE_STYLE_TEMPLATES, DEFAULT_COMFYUI_CONFIG
 from app.config.loader import get_comfyui_settings
+from app.utils.concurrency import ResizableSemaphore, TaskCancelledError
 
 
 # ComfyUI 并发控制
@@ -19,7 +20,8 @@ comfyui_lock = threading.Lock()
 
 # ComfyUI 运行时配置
 comfyui_runtime = {
-    'semaphore': threading.BoundedSemaphore(DEFAULT_COMFYUI_CONFIG['queue_size']),
+    # 可在线调整上限：修改 queue_size 时原地调整，占用中的许可仍归还到同一实例
+    'semaphore': ResizableSemaphore(DEFAULT_COMFYUI_CONFIG['queue_size']),
     'queue_size': DEFAULT_COMFYUI_CONFIG['queue_size'],
     'config': DEFAULT_COMFYUI_CONFIG.copy()
 }
@@ -32,7 +34,7 @@ def update_comfyui_runtime(config):
 
     with comfyui_lock:
         if queue_size != comfyui_runtime['queue_size']:
-            comfyui_runtime['semaphore'] = threading.BoundedSemaphore(queue_size)
+            comfyui_runtime['semaphore'].resize(queue_size)
             comfyui_runtime['queue_size'] = queue_size
         comfyui_runtime['config'] = settings
 
@@ -130,16 +132,50 @@ def submit_comfyui_prompt(payload, settings):
     return server, prompt_id
 
 
-def poll_comfyui_history(server, prompt_id, settings):
-    """轮询 ComfyUI 历史记录，等待任务完成"""
+def cancel_comfyui_prompt(server, prompt_id):
+    """取消 ComfyUI 中的 prompt：排队中的从队列删除，执行中的发送中断"""
+    try:
+        queue_resp = requests.get(f'{server}/queue', timeout=10)
+        queue_resp.raise_for_status()
+        queue_data = queue_resp.json() or {}
+        running_ids = {
+            item[1] for item in queue_data.get('queue_running', [])
+            if isinstance(item, (list, tuple)) and len(item) > 1
+        }
+        if prompt_id in running_ids:
+            # 新版 ComfyUI 支持按 prompt_id 中断；旧版忽略参数，中断当前执行的（即本任务）
+            requests.post(f'{server}/interrupt', json={'prompt_id': prompt_id}, timeout=10)
+            print(f"⏹️  已中断 ComfyUI 正在执行的任务 {prompt_id}")
+        else:
+            requests.post(f'{server}/queue', json={'delete': [prompt_id]}, timeout=10)
+            print(f"⏹️  已从 ComfyUI 队列移除任务 {prompt_id}")
+    except requests.RequestException as e:
+        print(f"⚠️  取消 ComfyUI 任务失败: {e}")
+
+
+def poll_comfyui_history(server, prompt_id, settings, cancel_token=None):
+    """轮询 ComfyUI 历史记录，等待任务完成；取消时中断 ComfyUI 中的任务"""
     timeout = settings.get('timeout_seconds', 180)
     start = time.time()
 
+    def wait(seconds):
+        if cancel_token is None:
+            time.sleep(seconds)
+            return
+        try:
+            cancel_token.sleep(seconds)
+        except TaskCancelledError:
+            cancel_comfyui_prompt(server, prompt_id)
+            raise
+
     while time.time() - start < timeout:
+        if cancel_token is not None and cancel_token.cancelled:
+            cancel_comfyui_prompt(server, prompt_id)
+            cancel_token.raise_if_cancelled()
         try:
             history_resp = requests.get(f'{server}/history/{prompt_id}', timeout=10)
             if history_resp.status_code == 404:
-                time.sleep(2)
+                wait(2)
                 continue
             history_resp.raise_for_status()
             history = history_resp.json() or {}
@@ -170,12 +206,12 @@ def poll_comfyui_history(server, prompt_id, settings):
                     return outputs
 
                 if status_value in ('completed', 'success'):
-                    time.sleep(1.5)
+                    wait(1.5)
                     continue
 
         except requests.RequestException:
             pass
-        time.sleep(2)
+        wait(2)
 
     raise TimeoutError('等待 ComfyUI 生成图片超时')
 
@@ -248,8 +284,11 @@ def apply_style_to_prompts(prompts, config):
     return merged
 
 
-def generate_image_with_comfyui(topic, prompts, blueprint, config, settings_override=None, semaphore_override=None, test_mode=False):
-    """调度 ComfyUI 自动生成图片"""
+def generate_image_with_comfyui(topic, prompts, blueprint, config, settings_override=None, semaphore_override=None, test_mode=False, cancel_token=None):
+    """调度 ComfyUI 自动生成图片
+
+    cancel_token 被取消时停止排队等待，并中断已提交到 ComfyUI 的任务。
+    """
     if not prompts:
         return None, {}
 
@@ -258,7 +297,15 @@ def generate_image_with_comfyui(topic, prompts, blueprint, config, settings_over
         return None, {}
 
     semaphore = semaphore_override or comfyui_runtime['semaphore']
-    acquired = semaphore.acquire(timeout=settings.get('timeout_seconds', 180))
+    if cancel_token is None:
+        acquired = semaphore.acquire(timeout=settings.get('timeout_seconds', 180))
+    else:
+        # 分段等待队列许可，以便及时响应取消
+        deadline = time.time() + settings.get('timeout_seconds', 180)
+        acquired = False
+        while not acquired and time.time() < deadline:
+            cancel_token.raise_if_cancelled()
+            acquired = semaphore.acquire(timeout=min(1.0, max(0.0, deadline - time.time())))
     if not acquired:
         print("ComfyUI 队列繁忙，放弃生成")
         return None, {}
@@ -279,7 +326,7 @@ def generate_image_with_comfyui(topic, prompts, blueprint, config, settings_over
             try:
                 payload = build_comfyui_workflow_payload(styled_prompts, settings)
                 server, prompt_id = submit_comfyui_prompt(payload, settings)
-                outputs = poll_comfyui_history(server, prompt_id, settings)
+                outputs = poll_comfyui_history(server, prompt_id, settings, cancel_token)
 
                 # 处理outputs结构
                 if isinstance(outputs, list):
@@ -330,10 +377,15 @@ def generate_image_with_comfyui(topic, prompts, blueprint, config, settings_over
 
                 raise Exception('未在 ComfyUI 输出中找到图片节点')
 
+            except TaskCancelledError:
+                raise
             except Exception as e:
                 print(f"ComfyUI 生成失败（第 {attempt} 次）: {e}")
                 metadata.setdefault('errors', []).append(str(e))
-                time.sleep(3)
+                if cancel_token is not None:
+                    cancel_token.sleep(3)
+                else:
+                    time.sleep(3)
 
         return None, metadata
 
@@ -0,0 +1,158 @@
+"""Gemini 上下文缓存模块（cachedContents）
+
+正文写作要求、段落摘要的安全规则和主题分析规则在每次请求中都完整发送。
+开启 gemini_context_cache 后，这些固定指令作为 systemInstruction 存入
+Gemini 的 cachedContents，请求只携带主题、段落等变化部分：
+- 按 (接口地址, API Key, 模型, 指令内容哈希) 创建一次，多个请求共享
+- 距离过期不足 CONTEXT_CACHE_REFRESH_MARGIN 秒时延长有效期，延长失败则重新创建
+- 创建失败（指令 Token 数低于模型下限、代理不支持等）时记录下来，
+  CONTEXT_CACHE_FAILURE_RETRY 秒内直接发送完整提示词，不再尝试
+
+cachedContents 属于创建它的 API Key，因此由密钥池在选定密钥后再解析。
+"""
+
+import time
+import hashlib
+import threading
+
+from app.services.gemini_limiter import limited_request
+
+DEFAULT_CONTEXT_CACHE_TTL = 3600
+# 距离过期不足该秒数时刷新
+CONTEXT_CACHE_REFRESH_MARGIN = 300
+# 创建失败后多久再尝试
+CONTEXT_CACHE_FAILURE_RETRY = 3600
+
+_entries_lock = threading.Lock()
+_entries = {}       # 缓存标识 -> {'name', 'expire_at'} 或 {'failed_until'}
+_key_locks = {}     # 缓存标识 -> 创建/刷新用的锁，避免并发重复创建
+_settings = {'enabled': False, 'ttl': DEFAULT_CONTEXT_CACHE_TTL}
+_stats = {'requests': 0, 'created': 0, 'refreshed': 0, 'failures': 0, 'fallbacks': 0}
+
+
+def _count(field):
+    with _entries_lock:
+        _stats[field] += 1
+
+
+def configure_context_cache(config):
+    """根据配置更新上下文缓存开关和有效期"""
+    with _entries_lock:
+        _settings['enabled'] = bool(config.get('gemini_context_cache', False))
+        _settings['ttl'] = max(CONTEXT_CACHE_REFRESH_MARGIN * 2, int(config.get('gemini_context_cache_ttl', DEFAULT_CONTEXT_CACHE_TTL)))
+
+
+def make_prompt_context(model, system_text, user_text, tools=None):
+    """描述可以缓存的请求：固定指令 system_text 和变化部分 user_text
+
+    未开启上下文缓存时返回 None，调用方照常发送完整提示词。
+    """
+    if not _settings['enabled']:
+        return None
+    return {'model': model, 'system_text': system_text, 'user_text': user_text, 'tools': tools}
+
+
+def _cache_id(api_key, base_url, context):
+    digest = hashlib.sha256(
+        f"{context['model']}\n{context['tools']}\n{context['system_text']}".encode('utf-8')
+    ).hexdigest()
+    return f"{base_url.rstrip('/')}|{api_key}|{digest}"
+
+
+def _create(api_key, base_url, context, ttl):
+    body = {
+        'model': f"models/{context['model']}",
+        'systemInstruction': {'parts': [{'text': context['system_text']}]},
+        'ttl': f'{ttl}s'
+    }
+    if context['tools']:
+        body['tools'] = context['tools']
+    response = limited_request(
+        'text', 'POST', f"{base_url.rstrip('/')}/v1beta/cachedContents?key={api_key}",
+        headers={'Content-Type': 'application/json'}, json=body, timeout=30
+    )
+    if response.status_code != 200:
+        raise Exception(f'HTTP {response.status_code}: {response.text[:200]}')
+    return response.json()['name']
+
+
+def _refresh(api_key, base_url, name, ttl):
+    response = limited_request(
+        'text', 'PATCH', f"{base_url.rstrip('/')}/v1beta/{name}?key={api_key}&updateMask=ttl",
+        headers={'Content-Type': 'application/json'}, json={'ttl': f'{ttl}s'}, timeout=30
+    )
+    return response.status_code == 200
+
+
+def _resolve_name(api_key, base_url, context):
+    """返回可用的 cachedContents 名称，无法使用时返回 None"""
+    cache_id = _cache_id(api_key, base_url, context)
+    with _entries_lock:
+        lock = _key_locks.setdefault(cache_id, threading.Lock())
+        ttl = _settings['ttl']
+
+    with lock:
+        now = time.time()
+        with _entries_lock:
+            entry = _entries.get(cache_id)
+        if entry and entry.get('failed_until', 0) > now:
+            return None
+        if entry and entry.get('name') and entry['expire_at'] - now > CONTEXT_CACHE_REFRESH_MARGIN:
+            return entry['name']
+
+        try:
+            if entry and entry.get('name') and entry['expire_at'] > now and _refresh(api_key, base_url, entry['name'], ttl):
+                name = entry['name']
+                _count('refreshed')
+            else:
+                name = _create(api_key, base_url, context, ttl)
+                _count('created')
+                print(f"🗂️  已创建 Gemini 上下文缓存: {context['model']}（{len(context['system_text'])} 字符）")
+            entry = {'name': name, 'expire_at': now + ttl}
+        except Exception as e:
+            _count('failures')
+            print(f"⚠️  Gemini 上下文缓存不可用，改为发送完整提示词: {e}")
+            entry = {'failed_until': now + CONTEXT_CACHE_FAILURE_RETRY}
+
+        with _entries_lock:
+            _entries[cache_id] = entry
+        return entry.get('name')
+
+
+def build_context_payload(context, payload, api_key, base_url):
+    """把完整请求改写为引用 cachedContents 的请求；无法使用缓存时返回 None
+
+    payload 中的 generationConfig 等参数保留，tools 已存入缓存，不再重复发送。
+    """
+    if not context:
+        return None
+    name = _resolve_name(api_key, base_url, context)
+    if not name:
+        _count('fallbacks')
+        return None
+    _count('requests')
+    cached_payload = {key: value for key, value in payload.items() if key not in ('contents', 'tools', 'systemInstruction')}
+    cached_payload['cachedContent'] = name
+    cached_payload['contents'] = [{'role': 'user', 'parts': [{'text': context['user_text']}]}]
+    return cached_payload
+
+
+def invalidate_context(context, api_key, base_url):
+    """缓存已被服务端删除或失效时丢弃本地记录，下次请求重新创建"""
+    with _entries_lock:
+        _entries.pop(_cache_id(api_key, base_url, context), None)
+
+
+def get_context_cache_stats():
+    """返回上下文缓存的条目数和使用情况"""
+    now = time.time()
+    with _entries_lock:
+        active = sum(1 for entry in _entries.values() if entry.get('name') and entry['expire_at'] > now)
+        failed = sum(1 for entry in _entries.values() if entry.get('failed_until', 0) > now)
+        return {
+            'enabled': _settings['enabled'],
+            'ttl': _settings['ttl'],
+            'active_entries': active,
+            'failed_entries': failed,
+            **_stats
+        }
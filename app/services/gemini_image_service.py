@@ -1,12 +1,18 @@
 """Gemini 图像生成服务模块"""
 
 import os
+import time
 import base64
 import requests
+from app.services.gemini_pool import post_gemini, retry_delay
+from app.services.gemini_limiter import limited_request
+from app.services.gemini_context_cache import make_prompt_context
+from app.services.llm_cache import make_cache_key, get_cached_response, put_cached_response
 import uuid
 import json
 from datetime import datetime
 from app.config.loader import load_config
+from app.utils.concurrency import TaskCancelledError
 
 
 # Gemini 图像生成比例预设
@@ -206,48 +212,13 @@ def get_smart_safety_prompt(topic_analysis=None):
 SAFETY_NEGATIVE_PROMPT = get_smart_safety_prompt()
 
 
-def analyze_topic_for_image_generation(topic, article_content, api_key, base_url='https://generativelanguage.googleapis.com', model='gemini-pro'):
-    """
-    智能分析文章主题，自动推荐图片生成参数
+# 主题分析的可选值
+TOPIC_ETHNICITY_OPTIONS = ['chinese', 'japanese', 'korean', 'caucasian', 'african', 'latino', 'diverse', 'auto']
+TOPIC_STYLE_OPTIONS = ['realistic', 'anime', 'illustration', 'cyberpunk', 'business', 'watercolor', 'minimalist', 'fantasy']
+TOPIC_SENSITIVITY_OPTIONS = ['high', 'medium', 'low']
 
-    Args:
-        topic: 文章主题
-        article_content: 文章内容（可选，用于更精确的分析）
-        api_key: Gemini API Key
-        base_url: API 基础 URL
-        model: 使用的分析模型
-
-    Returns:
-        dict: 包含推荐参数的字典
-        {
-            'ethnicity': 'chinese|caucasian|japanese|korean|diverse|auto',
-            'style': 'realistic|anime|illustration|...',
-            'sensitivity_level': 'high|medium|low',
-            'reasoning': '分析理由',
-            'detected_topics': ['主题标签列表']
-        }
-    """
-    try:
-        print("\n🔍 智能分析主题，推荐图片生成参数...")
-
-        # 构建分析提示词
-        analysis_prompt = f"""请分析以下文章主题和内容，为AI图片生成推荐最佳参数。
-
-文章主题：{topic}
-
-文章内容摘要：{article_content[:500] if article_content else '无'}
-
-请以JSON格式返回分析结果（只返回JSON，不要其他文字）：
-
-{{
-    "ethnicity": "推荐的人物种族（chinese/japanese/korean/caucasian/african/latino/diverse/auto）",
-    "style": "推荐的图片风格（realistic/anime/illustration/cyberpunk/business/watercolor/minimalist/fantasy）",
-    "sensitivity_level": "敏感度等级（high/medium/low）",
-    "reasoning": "推荐理由（简短说明）",
-    "detected_topics": ["检测到的主题标签"]
-}}
-
-分析规则：
+# 主题分析规则（单独的主题分析请求和合并的图片规划请求共用）
+TOPIC_ANALYSIS_RULES = """分析规则：
 
 **核心原则：默认中国人，除非明确是外国人物或动漫主题**
 
@@ -291,23 +262,60 @@ def analyze_topic_for_image_generation(topic, article_content, api_key, base_url
    - low: 娱乐、科技、艺术、生活方式
 
 示例：
-- "特朗普最新演讲" → {{"ethnicity": "caucasian", "style": "realistic", "sensitivity_level": "high"}}
-- "马斯克收购推特" → {{"ethnicity": "caucasian", "style": "realistic", "sensitivity_level": "medium"}}
-- "《原神》新角色介绍" → {{"ethnicity": "auto", "style": "anime", "sensitivity_level": "low"}}
-- "国产动漫崛起" → {{"ethnicity": "chinese", "style": "anime", "sensitivity_level": "low"}}
-- "人工智能发展趋势" → {{"ethnicity": "chinese", "style": "realistic", "sensitivity_level": "medium"}}（科技话题，默认中国人）
-- "美国科技公司裁员潮" → {{"ethnicity": "chinese", "style": "realistic", "sensitivity_level": "medium"}}（虽然是美国企业，但无具体人物，默认中国人）
-- "职场内卷现象" → {{"ethnicity": "chinese", "style": "realistic", "sensitivity_level": "medium"}}（社会话题，默认中国人）
-- "中国科技创新突破" → {{"ethnicity": "chinese", "style": "realistic", "sensitivity_level": "medium"}}
+- "特朗普最新演讲" → {"ethnicity": "caucasian", "style": "realistic", "sensitivity_level": "high"}
+- "马斯克收购推特" → {"ethnicity": "caucasian", "style": "realistic", "sensitivity_level": "medium"}
+- "《原神》新角色介绍" → {"ethnicity": "auto", "style": "anime", "sensitivity_level": "low"}
+- "国产动漫崛起" → {"ethnicity": "chinese", "style": "anime", "sensitivity_level": "low"}
+- "人工智能发展趋势" → {"ethnicity": "chinese", "style": "realistic", "sensitivity_level": "medium"}（科技话题，默认中国人）
+- "美国科技公司裁员潮" → {"ethnicity": "chinese", "style": "realistic", "sensitivity_level": "medium"}（虽然是美国企业，但无具体人物，默认中国人）
+- "职场内卷现象" → {"ethnicity": "chinese", "style": "realistic", "sensitivity_level": "medium"}（社会话题，默认中国人）
+- "中国科技创新突破" → {"ethnicity": "chinese", "style": "realistic", "sensitivity_level": "medium"}
 """
 
-        # 构建请求 URL
-        if base_url.endswith('/'):
-            base_url = base_url[:-1]
+# 单独主题分析请求的固定部分：输出格式 + 分析规则
+TOPIC_ANALYSIS_INSTRUCTIONS = f"""请以JSON格式返回分析结果（只返回JSON，不要其他文字）：
 
-        url = f"{base_url}/v1beta/models/{model}:generateContent?key={api_key}"
+{{
+    "ethnicity": "推荐的人物种族（chinese/japanese/korean/caucasian/african/latino/diverse/auto）",
+    "style": "推荐的图片风格（realistic/anime/illustration/cyberpunk/business/watercolor/minimalist/fantasy）",
+    "sensitivity_level": "敏感度等级（high/medium/low）",
+    "reasoning": "推荐理由（简短说明）",
+    "detected_topics": ["检测到的主题标签"]
+}}
+
+{TOPIC_ANALYSIS_RULES}"""
+
+def analyze_topic_for_image_generation(topic, article_content, api_key, base_url='https://generativelanguage.googleapis.com', model='gemini-pro'):
+    """
+    智能分析文章主题，自动推荐图片生成参数
+
+    Args:
+        topic: 文章主题
+        article_content: 文章内容（可选，用于更精确的分析）
+        api_key: Gemini API Key
+        base_url: API 基础 URL
+        model: 使用的分析模型
+
+    Returns:
+        dict: 包含推荐参数的字典
+        {
+            'ethnicity': 'chinese|caucasian|japanese|korean|diverse|auto',
+            'style': 'realistic|anime|illustration|...',
+            'sensitivity_level': 'high|medium|low',
+            'reasoning': '分析理由',
+            'detected_topics': ['主题标签列表']
+        }
+    """
+    try:
+        print("\n🔍 智能分析主题，推荐图片生成参数...")
+
+        # 构建分析提示词：变化的主题部分 + 固定的输出格式和分析规则
+        topic_text = f"""请分析以下文章主题和内容，为AI图片生成推荐最佳参数。
 
-        headers = {'Content-Type': 'application/json'}
+文章主题：{topic}
+
+文章内容摘要：{article_content[:500] if article_content else '无'}"""
+        analysis_prompt = f"{topic_text}\n\n{TOPIC_ANALYSIS_INSTRUCTIONS}"
 
         payload = {
             'contents': [{
@@ -323,12 +331,19 @@ def analyze_topic_for_image_generation(topic, article_content, api_key, base_url
             }
         }
 
-        response = requests.post(url, headers=headers, json=payload, timeout=15)
-
-        print(f"   API响应状态: {response.status_code}")
+        cache_key = make_cache_key(base_url, model, payload)
+        cached_result = get_cached_response('analysis', cache_key)
+        if cached_result is not None:
+            print(f"   ♻️  命中主题分析缓存")
+            status_code, result = 200, cached_result
+        else:
+            context = make_prompt_context(model, TOPIC_ANALYSIS_INSTRUCTIONS, topic_text)
+            response = post_gemini('text', api_key, base_url, f'/v1beta/models/{model}:generateContent', payload, timeout=15, context=context)
+            status_code = response.status_code
+            print(f"   API响应状态: {response.status_code}")
+            result = response.json() if status_code == 200 else None
 
-        if response.status_code == 200:
-            result = response.json()
+        if status_code == 200:
 
             # 提取文本内容 - 按照官方文档的响应格式
             if 'candidates' in result and len(result['candidates']) > 0:
@@ -362,6 +377,8 @@ def analyze_topic_for_image_generation(topic, article_content, api_key, base_url
                                 json_str = json_match.group(0)
                                 try:
                                     analysis_result = json.loads(json_str)
+                                    if cached_result is None:
+                                        put_cached_response('analysis', cache_key, result)
 
                                     print(f"✓ 主题分析完成")
                                     print(f"  推荐人物种族: {analysis_result.get('ethnicity', 'auto')}")
@@ -390,7 +407,7 @@ def analyze_topic_for_image_generation(topic, article_content, api_key, base_url
                 print(f"   响应keys: {list(result.keys())}")
                 print(f"   完整响应: {result}")
         else:
-            print(f"   API请求失败: {response.status_code}")
+            print(f"   API请求失败: {status_code}")
             print(f"   错误信息: {response.text[:200]}")
 
         # 如果分析失败，返回默认值
@@ -489,7 +506,8 @@ def generate_image_with_gemini(
     ethnicity='auto',
     max_retries=3,
     timeout=30,
-    topic_analysis=None
+    topic_analysis=None,
+    cancel_token=None
 ):
     """
     使用 Gemini API 生成图像
@@ -510,6 +528,7 @@ def generate_image_with_gemini(
         max_retries: 最大重试次数
         timeout: 请求超时时间（秒）
         topic_analysis: 主题分析结果，用于智能调整安全过滤
+        cancel_token: 取消令牌（可选），每次尝试前检查，取消时抛出 TaskCancelledError
 
     Returns:
         tuple: (image_path, metadata) 成功时返回图片路径和元数据，失败返回 (None, None)
@@ -531,27 +550,7 @@ def generate_image_with_gemini(
         topic_analysis=topic_analysis
     )
 
-    # 构建请求 URL
-    if base_url.endswith('/'):
-        base_url = base_url[:-1]
-
-    # 尝试多种 API endpoint 格式
-    # 1. 使用 generateContent API (Gemini 标准方式)
-    # 2. 使用 generateImage API (某些代理可能支持)
-
-    # 首先尝试标准的 generateContent API
-    url = f"{base_url}/v1beta/models/{model}:generateContent"
-
-    headers = {
-        'Content-Type': 'application/json'
-    }
-
-    # 添加 API Key
-    if '?' in url:
-        url = f"{url}&key={api_key}"
-    else:
-        url = f"{url}?key={api_key}"
-
+    # 使用 generateContent API (Gemini 标准方式)，经由密钥池选择 API Key 和地址
     # 使用 generateContent 格式请求图像生成
     # 根据官方文档：https://ai.google.dev/gemini-api/docs/image-generation
     # aspectRatio 应该放在 generationConfig.imageConfig 中
@@ -585,6 +584,8 @@ def generate_image_with_gemini(
     last_error = None
 
     while retry_count < max_retries:
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
         try:
             print(f"尝试使用 Gemini 生成图像 (第 {retry_count + 1}/{max_retries} 次)...")
             print(f"使用模型: {model}")
@@ -597,7 +598,7 @@ def generate_image_with_gemini(
                 image_config = payload['generationConfig']['imageConfig']
                 print(f"  ✓ imageConfig.aspectRatio: {image_config.get('aspectRatio')}")
 
-            response = requests.post(url, headers=headers, json=payload, timeout=timeout)
+            response = post_gemini('image', api_key, base_url, f'/v1beta/models/{model}:generateContent', payload, timeout=timeout)
 
             # 打印响应以便调试
             print(f"API 响应状态: {response.status_code}")
@@ -727,9 +728,15 @@ def generate_image_with_gemini(
                     continue
 
             elif response.status_code == 429:
-                print(f"API 请求频率限制，等待后重试...")
                 last_error = "请求频率超限"
                 retry_count += 1
+                if retry_count < max_retries:
+                    delay = retry_delay('image', api_key, response, retry_count)
+                    print(f"API 请求频率限制，等待 {delay:.0f} 秒后重试...")
+                    if cancel_token is not None:
+                        cancel_token.sleep(delay)
+                    else:
+                        time.sleep(delay)
                 continue
 
             elif response.status_code == 400:
@@ -797,6 +804,9 @@ def generate_image_with_gemini(
                 retry_count += 1
                 continue
 
+        except TaskCancelledError:
+            raise
+
         except requests.exceptions.Timeout:
             print(f"请求超时 (timeout={timeout}s)")
             last_error = "请求超时"
@@ -891,7 +901,7 @@ def get_gemini_image_models(api_key, base_url='https://generativelanguage.google
         # 尝试获取模型列表
         url = f"{base_url}/v1beta/models?key={api_key}"
 
-        response = requests.get(url, timeout=10)
+        response = limited_request('models', 'GET', url, timeout=10)
         response.raise_for_status()
 
         result = response.json()
@@ -0,0 +1,196 @@
+"""Gemini 自适应并发控制模块
+
+按接口类型（'text' 文本模型、'image' 图像模型、'models' 模型列表）分别限制
+同时发往 Gemini 的请求数，并按 AIMD（加性增、乘性减）自动调整上限：
+- 请求成功、延迟未明显变慢且并发已用满时，上限每轮增加约 1
+- 返回 429/503 时上限减半，其他 5xx 和网络错误时降为 0.8 倍
+- 同一轮中并发失败的请求只降一次（请求开始时间早于上次下调的不再计入）
+- 记录每类接口的当前上限、排队数和延迟，供管理接口查看
+
+流式请求在响应读取完毕或关闭时才归还名额，整个传输期间计入并发；
+流式请求不参与延迟统计。
+"""
+
+import time
+import threading
+from collections import deque
+
+import requests
+
+from app.utils import http_client
+
+# 等待并发名额的最长时间（秒）
+LIMITER_ACQUIRE_TIMEOUT = 300
+
+# 各类接口的默认并发：初始值、下限、上限
+DEFAULT_CONCURRENCY_LIMITS = {
+    'text': {'initial': 4, 'min': 1, 'max': 16},
+    'image': {'initial': 2, 'min': 1, 'max': 8},
+    'models': {'initial': 2, 'min': 1, 'max': 4}
+}
+
+# 延迟超过基线的倍数时视为变慢，不再增加并发
+LATENCY_TOLERANCE = 2.0
+# 延迟滑动平均系数
+LATENCY_EWMA_ALPHA = 0.2
+# 限流（429/503）和其他错误时的下调系数
+THROTTLE_DECREASE_FACTOR = 0.5
+ERROR_DECREASE_FACTOR = 0.8
+THROTTLE_STATUS_CODES = (429, 503)
+# 延迟采样窗口，用于计算 p50/p95
+LATENCY_SAMPLES = 200
+
+
+class AdaptiveLimiter:
+    """单类接口的 AIMD 并发限制器"""
+
+    def __init__(self, name, initial=4, min_limit=1, max_limit=16, enabled=True):
+        self.name = name
+        self._cond = threading.Condition()
+        self.enabled = enabled
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit))
+        self.limit = float(min(self.max_limit, max(self.min_limit, int(initial))))
+        self.in_flight = 0
+        self.waiting = 0
+        self.last_decrease_at = 0.0
+        self.latency_ewma = None
+        self.latency_baseline = None
+        self._samples = deque(maxlen=LATENCY_SAMPLES)
+        self.stats = {'requests': 0, 'success': 0, 'throttled': 0, 'errors': 0, 'increases': 0, 'decreases': 0}
+
+    def configure(self, initial, min_limit, max_limit, enabled):
+        """更新上下限；当前上限超出新范围时收回到范围内"""
+        with self._cond:
+            self.enabled = enabled
+            self.min_limit = max(1, int(min_limit))
+            self.max_limit = max(self.min_limit, int(max_limit))
+            self.limit = float(min(self.max_limit, max(self.min_limit, self.limit if self.stats['requests'] else int(initial))))
+            self._cond.notify_all()
+
+    def acquire(self):
+        """占用一个并发名额，返回 (开始时间, 是否已用满并发)"""
+        deadline = time.monotonic() + LIMITER_ACQUIRE_TIMEOUT
+        with self._cond:
+            self.waiting += 1
+            try:
+                while self.enabled and self.in_flight >= int(self.limit):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise Exception(f'Gemini {self.name} 请求排队超时（当前并发上限 {int(self.limit)}）')
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+            self.stats['requests'] += 1
+            return time.monotonic(), self.in_flight >= int(self.limit)
+
+    def release(self, ticket, status=None, error=None, measure_latency=True):
+        """归还名额，并根据响应状态和延迟调整并发上限"""
+        started_at, saturated = ticket
+        now = time.monotonic()
+        latency = now - started_at
+        with self._cond:
+            self.in_flight -= 1
+
+            if status in THROTTLE_STATUS_CODES:
+                self.stats['throttled'] += 1
+                self._decrease_locked(started_at, now, THROTTLE_DECREASE_FACTOR, status)
+            elif error is not None or (status is not None and status >= 500):
+                self.stats['errors'] += 1
+                self._decrease_locked(started_at, now, ERROR_DECREASE_FACTOR, status or type(error).__name__)
+            elif status is not None and status < 400:
+                self.stats['success'] += 1
+                healthy = True
+                if measure_latency:
+                    healthy = self._record_latency_locked(latency)
+                if healthy and saturated and self.limit < self.max_limit:
+                    # 每个成功请求增加 1/limit，整体约为每轮 +1
+                    self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+                    self.stats['increases'] += 1
+            self._cond.notify_all()
+
+    def _record_latency_locked(self, latency):
+        """记录延迟，返回本次延迟是否在基线的容忍范围内"""
+        self._samples.append(latency)
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+            self.latency_baseline = latency
+            return True
+        self.latency_ewma += LATENCY_EWMA_ALPHA * (latency - self.latency_ewma)
+        # 基线跟随最低延迟，并缓慢上浮以适应服务端的长期变化
+        self.latency_baseline = min(latency, self.latency_baseline + 0.01 * (latency - self.latency_baseline))
+        return latency <= self.latency_baseline * LATENCY_TOLERANCE
+
+    def _decrease_locked(self, started_at, now, factor, reason):
+        if started_at < self.last_decrease_at:
+            return
+        previous = int(self.limit)
+        self.limit = max(float(self.min_limit), self.limit * factor)
+        self.last_decrease_at = now
+        self.stats['decreases'] += 1
+        if int(self.limit) != previous:
+            print(f"🐢 Gemini {self.name} 并发上限 {previous} → {int(self.limit)}（{reason}）")
+
+    def snapshot(self):
+        with self._cond:
+            samples = sorted(self._samples)
+
+            def percentile(p):
+                return round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1000) if samples else None
+
+            return {
+                'enabled': self.enabled,
+                'limit': int(self.limit),
+                'limit_exact': round(self.limit, 2),
+                'min_limit': self.min_limit,
+                'max_limit': self.max_limit,
+                'in_flight': self.in_flight,
+                'waiting': self.waiting,
+                'latency_ewma_ms': round(self.latency_ewma * 1000) if self.latency_ewma is not None else None,
+                'latency_baseline_ms': round(self.latency_baseline * 1000) if self.latency_baseline is not None else None,
+                'latency_p50_ms': percentile(0.5),
+                'latency_p95_ms': percentile(0.95),
+                **self.stats
+            }
+
+
+_limiters = {
+    kind: AdaptiveLimiter(kind, limits['initial'], limits['min'], limits['max'])
+    for kind, limits in DEFAULT_CONCURRENCY_LIMITS.items()
+}
+
+
+def configure_gemini_limiter(config):
+    """根据配置更新各类接口的并发范围和开关"""
+    enabled = bool(config.get('adaptive_concurrency', True))
+    overrides = config.get('gemini_concurrency_limits') or {}
+    for kind, limiter in _limiters.items():
+        limits = {**DEFAULT_CONCURRENCY_LIMITS[kind], **(overrides.get(kind) or {})}
+        limiter.configure(limits['initial'], limits['min'], limits['max'], enabled)
+
+
+def limited_request(kind, method, url, stream=False, **kwargs):
+    """在 kind 类接口的并发限制内发送请求，返回 requests.Response"""
+    limiter = _limiters[kind]
+    ticket = limiter.acquire()
+    try:
+        response = http_client.request(method, url, stream=stream, **kwargs)
+    except requests.RequestException as e:
+        limiter.release(ticket, error=e)
+        raise
+    except Exception:
+        limiter.release(ticket)
+        raise
+    if stream and response.status_code == 200:
+        status = response.status_code
+        return http_client.release_on_close(
+            response, lambda: limiter.release(ticket, status, measure_latency=False)
+        )
+    limiter.release(ticket, response.status_code, measure_latency=not stream)
+    return response
+
+
+def get_gemini_limiter_stats():
+    """返回各类接口的当前并发上限、排队数和延迟"""
+    return {kind: limiter.snapshot() for kind, limiter in _limiters.items()}
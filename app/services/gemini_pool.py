@@ -0,0 +1,313 @@
+"""Gemini 密钥池模块
+
+把配置中的多个 API Key / 接口地址组成密钥池，正文、摘要、图片等请求
+从池中选择端点发送，批量吞吐随密钥数量增长：
+- 每个端点独立的令牌桶限速（RPM 请求数 / TPM Token 数，0 表示不限）
+- 返回 429 时按 Retry-After 或指数时间进入冷却，期间不再分配请求，
+  当前请求立即换用池中其他密钥重发
+- 在可用端点中选择进行中请求最少的一个（相同时选择最久未使用的）
+- 记录每个端点的请求数、限流次数和 Token 用量，供配置页展示
+
+密钥池按用途分组：'text'（文本模型）和 'image'（图像模型）。调用方传入的
+密钥不在池中时（例如配置页测试新密钥），请求直接发送，不经过密钥池。
+所有请求仍受 gemini_limiter 的自适应并发限制。
+"""
+
+import time
+import threading
+
+from app.config.loader import get_gemini_image_settings
+from app.utils import http_client
+from app.services.gemini_limiter import limited_request
+from app.services.gemini_context_cache import build_context_payload, invalidate_context
+
+# 等待可用端点的最长时间（秒）
+POOL_ACQUIRE_TIMEOUT = 300
+# 429 冷却时间：未提供 Retry-After 时按 base * 2^(n-1) 增长，不超过 max
+COOLDOWN_BASE_SECONDS = 5
+COOLDOWN_MAX_SECONDS = 60
+# 密钥无效或无权限（401/403）时的冷却时间
+AUTH_FAILURE_COOLDOWN_SECONDS = 600
+
+
+class _TokenBucket:
+    """按分钟额度匀速补充的令牌桶，limit 为 0 表示不限"""
+
+    def __init__(self, per_minute):
+        self.limit = max(0, int(per_minute or 0))
+        self.tokens = float(self.limit)
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now):
+        if self.limit:
+            self.tokens = min(self.limit, self.tokens + (now - self.updated_at) * self.limit / 60.0)
+        self.updated_at = now
+
+    def wait_time(self, amount, now):
+        """返回还需等待多久才有 amount 个令牌（0 表示立即可用）"""
+        if not self.limit:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.limit)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * 60.0 / self.limit
+
+    def consume(self, amount):
+        if self.limit:
+            self.tokens -= amount
+
+
+class _Endpoint:
+    """密钥池中的单个端点（API Key + 接口地址）"""
+
+    def __init__(self, name, api_key, base_url, rpm=0, tpm=0):
+        self.name = name
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.rpm = _TokenBucket(rpm)
+        self.tpm = _TokenBucket(tpm)
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.strikes = 0
+        self.last_used = 0.0
+        self.stats = {'requests': 0, 'success': 0, 'errors': 0, 'throttled': 0, 'tokens': 0, 'last_status': None}
+
+
+_pool_cond = threading.Condition()
+_pools = {}  # group -> list[_Endpoint]
+
+
+def _mask_key(api_key):
+    return f'***{api_key[-4:]}' if api_key and len(api_key) > 4 else '***'
+
+
+def _build_group(primary_key, primary_url, primary_rpm, primary_tpm, extra_entries):
+    endpoints = []
+    seen = set()
+    entries = [{'api_key': primary_key, 'base_url': primary_url, 'rpm': primary_rpm, 'tpm': primary_tpm}]
+    entries.extend(extra_entries or [])
+    for index, entry in enumerate(entries):
+        api_key = (entry.get('api_key') or '').strip()
+        base_url = (entry.get('base_url') or primary_url or '').strip()
+        if not api_key or not base_url or (api_key, base_url.rstrip('/')) in seen:
+            continue
+        seen.add((api_key, base_url.rstrip('/')))
+        name = entry.get('name') or ('primary' if index == 0 else f'key-{index}')
+        endpoints.append(_Endpoint(name, api_key, base_url, entry.get('rpm', 0), entry.get('tpm', 0)))
+    return endpoints
+
+
+def configure_gemini_pool(config):
+    """根据配置重建密钥池；保留原有端点的用量统计和冷却状态"""
+    default_url = config.get('gemini_base_url', 'https://generativelanguage.googleapis.com')
+    # 与图像生成调用方使用同样的回退规则：未单独配置时使用主密钥和主地址
+    image_settings = get_gemini_image_settings(config)
+    groups = {
+        'text': _build_group(
+            config.get('gemini_api_key', ''), default_url,
+            config.get('gemini_rpm_limit', 0), config.get('gemini_tpm_limit', 0),
+            config.get('gemini_key_pool')
+        ),
+        'image': _build_group(
+            image_settings.get('api_key', ''), image_settings.get('base_url', ''),
+            image_settings.get('rpm_limit', 0), image_settings.get('tpm_limit', 0),
+            config.get('gemini_image_key_pool')
+        )
+    }
+    with _pool_cond:
+        for group, endpoints in groups.items():
+            previous = {(e.api_key, e.base_url): e for e in _pools.get(group, [])}
+            merged = []
+            for endpoint in endpoints:
+                old = previous.get((endpoint.api_key, endpoint.base_url))
+                if old is None:
+                    merged.append(endpoint)
+                    continue
+                # 沿用原端点对象，进行中的请求仍归还到同一个实例
+                old.name = endpoint.name
+                if old.rpm.limit != endpoint.rpm.limit:
+                    old.rpm = endpoint.rpm
+                if old.tpm.limit != endpoint.tpm.limit:
+                    old.tpm = endpoint.tpm
+                merged.append(old)
+            _pools[group] = merged
+        _pool_cond.notify_all()
+    sizes = {group: len(endpoints) for group, endpoints in groups.items()}
+    if any(size > 1 for size in sizes.values()):
+        print(f"🔑 Gemini 密钥池: 文本 {sizes['text']} 个, 图像 {sizes['image']} 个")
+
+
+def _acquire(group, api_key, estimated_tokens):
+    """选择端点并占用一个并发名额；密钥不在池中时返回 None"""
+    deadline = time.monotonic() + POOL_ACQUIRE_TIMEOUT
+    with _pool_cond:
+        while True:
+            endpoints = _pools.get(group) or []
+            if not any(endpoint.api_key == api_key for endpoint in endpoints):
+                return None
+
+            now = time.monotonic()
+            ready, next_wait = [], None
+            for endpoint in endpoints:
+                wait_seconds = max(
+                    endpoint.cooldown_until - now,
+                    endpoint.rpm.wait_time(1, now),
+                    endpoint.tpm.wait_time(estimated_tokens, now)
+                )
+                if wait_seconds <= 0:
+                    ready.append(endpoint)
+                elif next_wait is None or wait_seconds < next_wait:
+                    next_wait = wait_seconds
+
+            if ready:
+                endpoint = min(ready, key=lambda e: (e.in_flight, e.last_used))
+                endpoint.rpm.consume(1)
+                endpoint.tpm.consume(estimated_tokens)
+                endpoint.in_flight += 1
+                endpoint.last_used = now
+                endpoint.stats['requests'] += 1
+                return endpoint
+
+            remaining = deadline - now
+            if remaining <= 0:
+                raise Exception('Gemini 密钥池中没有可用的密钥（均在冷却中或已达到速率上限）')
+            _pool_cond.wait(min(remaining, next_wait if next_wait is not None else remaining))
+
+
+def _release(endpoint, estimated_tokens, status=None, headers=None, usage=None, error=None):
+    """归还并发名额，并根据响应状态更新冷却状态和用量"""
+    with _pool_cond:
+        endpoint.in_flight -= 1
+        now = time.monotonic()
+        endpoint.stats['last_status'] = status if status is not None else type(error).__name__
+
+        if status == 429:
+            endpoint.strikes += 1
+            endpoint.stats['throttled'] += 1
+            retry_after = (headers or {}).get('Retry-After', '')
+            if retry_after.isdigit():
+                cooldown = int(retry_after)
+            else:
+                cooldown = min(COOLDOWN_MAX_SECONDS, COOLDOWN_BASE_SECONDS * (2 ** (endpoint.strikes - 1)))
+            endpoint.cooldown_until = now + cooldown
+            print(f"⏸️  Gemini 密钥 {endpoint.name} 触发限流，冷却 {cooldown} 秒")
+        elif status in (401, 403) and any(len(group) > 1 and endpoint in group for group in _pools.values()):
+            # 池中还有其他密钥时才暂停，单个密钥的错误直接交给调用方处理
+            endpoint.stats['errors'] += 1
+            endpoint.cooldown_until = now + AUTH_FAILURE_COOLDOWN_SECONDS
+            print(f"⏸️  Gemini 密钥 {endpoint.name} 无效或无权限（{status}），暂停使用 {AUTH_FAILURE_COOLDOWN_SECONDS} 秒")
+        elif status is not None and status < 400:
+            endpoint.strikes = 0
+            endpoint.stats['success'] += 1
+        else:
+            endpoint.stats['errors'] += 1
+
+        # 有 usageMetadata 时用实际 Token 数修正预估值
+        tokens = estimated_tokens
+        if usage and usage.get('totalTokenCount'):
+            tokens = usage['totalTokenCount']
+            endpoint.tpm.consume(tokens - estimated_tokens)
+        endpoint.stats['tokens'] += tokens
+        _pool_cond.notify_all()
+
+
+def retry_delay(group, api_key, response, attempt=1):
+    """返回请求被限流（429）后重试前应等待的秒数
+
+    密钥在池中时等到池中最早恢复的密钥可用；否则按 Retry-After，
+    没有该响应头时按 base * 2^(attempt-1) 计算。
+    """
+    now = time.monotonic()
+    with _pool_cond:
+        endpoints = _pools.get(group) or []
+        if any(endpoint.api_key == api_key for endpoint in endpoints):
+            return max(0.0, min(endpoint.cooldown_until - now for endpoint in endpoints))
+    retry_after = (response.headers or {}).get('Retry-After', '')
+    if retry_after.isdigit():
+        return float(retry_after)
+    return float(min(COOLDOWN_MAX_SECONDS, COOLDOWN_BASE_SECONDS * (2 ** (max(1, attempt) - 1))))
+
+
+def post_gemini(group, api_key, base_url, path, payload, timeout=None, stream=False, context=None):
+    """通过密钥池发送 Gemini 请求
+
+    Args:
+        group: 密钥池分组（'text' 或 'image'）
+        api_key / base_url: 调用方配置的密钥和地址；密钥不在池中时直接使用
+        path: 接口路径，如 '/v1beta/models/gemini-pro:generateContent'
+        payload: 请求体
+        stream: 是否流式读取响应；流式响应在读取完毕或关闭时才归还并发名额，
+            Token 用量按预估值记录
+        context: make_prompt_context() 的结果；按选定的密钥改用 cachedContents 发送，
+            缓存不可用或已失效时发送完整的 payload
+
+    Returns:
+        requests.Response
+    """
+    # 按字符数粗略预估输入 Token，用于 TPM 限速
+    estimated_tokens = max(1, len(str(payload)) // 3)
+    with _pool_cond:
+        attempts = max(1, len(_pools.get(group) or []))
+
+    # 某个密钥返回 429 时换用池中其他密钥，最多把池中每个密钥各试一次
+    for attempt in range(attempts):
+        endpoint = _acquire(group, api_key, estimated_tokens)
+        request_key, request_url = (endpoint.api_key, endpoint.base_url) if endpoint is not None else (api_key, base_url)
+        separator = '&' if '?' in path else '?'
+        url = f"{request_url.rstrip('/')}{path}{separator}key={request_key}"
+
+        try:
+            request_payload = build_context_payload(context, payload, request_key, request_url) or payload
+            response = limited_request(group, 'POST', url, headers={'Content-Type': 'application/json'}, json=request_payload, timeout=timeout, stream=stream)
+            if request_payload is not payload and response.status_code in (400, 403, 404):
+                # 上下文缓存已过期或被删除，丢弃记录并改用完整提示词重发
+                print(f"⚠️  Gemini 上下文缓存请求失败（{response.status_code}），改为发送完整提示词")
+                invalidate_context(context, request_key, request_url)
+                response.close()
+                response = limited_request(group, 'POST', url, headers={'Content-Type': 'application/json'}, json=payload, timeout=timeout, stream=stream)
+        except Exception as e:
+            if endpoint is not None:
+                _release(endpoint, estimated_tokens, error=e)
+            raise
+
+        if endpoint is None:
+            return response
+
+        if response.status_code == 200 and stream:
+            # 流式响应在读取完毕或关闭时才归还名额，进行中请求数包含正在传输的流
+            status, headers = response.status_code, response.headers
+            return http_client.release_on_close(
+                response, lambda: _release(endpoint, estimated_tokens, status, headers)
+            )
+
+        usage = None
+        if response.status_code == 200 and not stream:
+            try:
+                usage = response.json().get('usageMetadata')
+            except ValueError:
+                usage = None
+        _release(endpoint, estimated_tokens, response.status_code, response.headers, usage)
+
+        if response.status_code != 429 or attempt == attempts - 1:
+            return response
+        response.close()
+
+
+def get_gemini_pool_stats():
+    """返回各密钥的用量、并发和冷却状态（密钥只显示末 4 位）"""
+    now = time.monotonic()
+    with _pool_cond:
+        return {
+            group: [{
+                'name': endpoint.name,
+                'api_key': _mask_key(endpoint.api_key),
+                'base_url': endpoint.base_url,
+                'rpm_limit': endpoint.rpm.limit,
+                'tpm_limit': endpoint.tpm.limit,
+                'in_flight': endpoint.in_flight,
+                'cooldown_seconds': round(max(0.0, endpoint.cooldown_until - now), 1),
+                **endpoint.stats
+            } for endpoint in endpoints]
+            for group, endpoints in _pools.items()
+        }
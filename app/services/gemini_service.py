@@ -1,30 +1,31 @@
 """Gemini API 服务模块"""
 
+import re
+import json
+import time
 import requests
-from app.utils.parsers import parse_json_response
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from app.services.gemini_pool import post_gemini
+from app.services.gemini_limiter import limited_request
+from app.services.gemini_context_cache import make_prompt_context
+from app.services.llm_cache import make_cache_key, get_cached_response, put_cached_response
+from app.utils.parsers import parse_json_response, strip_json_text
 from app.utils.filters import (
     is_domain_blacklisted, is_tld_whitelisted, is_static_url,
     contains_blacklisted_keyword, contains_chinese, contains_traditional_chinese,
     log_filtered_event
 )
+from app.utils.filter_pipeline import FilterPipeline, FilterRule, STAGE_OFFLINE, STAGE_URL, STAGE_CONTENT
 from app.utils.validators import normalize_field
 from app.config import VISUAL_TEMPLATE_PRESETS
 from app.utils.network import fetch_real_url_and_title
+from app.services.gemini_image_service import (
+    TOPIC_ANALYSIS_RULES, TOPIC_ETHNICITY_OPTIONS, TOPIC_STYLE_OPTIONS, TOPIC_SENSITIVITY_OPTIONS
+)
 
 
-def generate_article_with_gemini(topic, api_key, base_url, model_name, custom_prompt='', temperature=1.0, top_p=0.95, enable_search=True):
-    """使用 Gemini API 生成文章，支持 Google 搜索和思考过程展示"""
-    import json
-
-    # 构建提示词
-    if custom_prompt:
-        prompt = custom_prompt.replace('{topic}', topic)
-    else:
-        prompt = f"""请根据以下标题或内容写一篇详细的文章：
-
-{topic}
-
-要求：
+# 默认提示词中的写作要求（固定部分）
+DEFAULT_ARTICLE_REQUIREMENTS = """要求：
 1. 第一行必须是文章的标题，使用 # 标记（Markdown 格式）
 2. 文章要有明确的结构，使用 ## 标记小标题
 3. 内容要详实、有深度
@@ -35,6 +36,31 @@ def generate_article_with_gemini(topic, api_key, base_url, model_name, custom_pr
 
 请直接开始写文章，不需要额外的说明。"""
 
+# 自定义提示词放入上下文缓存时，{topic} 替换为对用户消息的引用
+ARTICLE_TOPIC_REFERENCE = '（用户消息中给出的标题或内容）'
+
+
+def generate_article_with_gemini(topic, api_key, base_url, model_name, custom_prompt='', temperature=1.0, top_p=0.95, enable_search=True, stream=False, on_chunk=None, use_cache=False):
+    """使用 Gemini API 生成文章，支持 Google 搜索和思考过程展示
+
+    stream 为 True 时使用 streamGenerateContent（SSE）边生成边接收，每收到一段正文调用
+    on_chunk(新增文本, 已生成的全部正文, usageMetadata)；API 地址不支持流式时自动改用非流式请求。
+    use_cache 为 True 时，提示词和生成参数完全相同的请求直接复用缓存的正文。
+    """
+    import json
+
+    # 构建提示词；同时拆分出固定的写作要求和变化的标题，供上下文缓存使用
+    if custom_prompt:
+        prompt = custom_prompt.replace('{topic}', topic)
+        system_text = custom_prompt.replace('{topic}', ARTICLE_TOPIC_REFERENCE)
+        user_text = topic
+    else:
+        user_text = f"""请根据以下标题或内容写一篇详细的文章：
+
+{topic}"""
+        system_text = DEFAULT_ARTICLE_REQUIREMENTS
+        prompt = f"{user_text}\n\n{DEFAULT_ARTICLE_REQUIREMENTS}"
+
     # 打印参数信息
     print(f"\n{'='*60}")
     print(f"🔧 Gemini API 调用参数:")
@@ -50,9 +76,8 @@ def generate_article_with_gemini(topic, api_key, base_url, model_name, custom_pr
     print(prompt[:500] + "..." if len(prompt) > 500 else prompt)
     print(f"{'='*60}\n")
 
-    # 构建请求数据（使用非流式 API）
+    # 构建请求数据（实际请求经由密钥池发送；流式请求使用 streamGenerateContent）
     url = f'{base_url}/v1beta/models/{model_name}:generateContent?key={api_key}'
-    headers = {'Content-Type': 'application/json'}
 
     data = {
         'contents': [{
@@ -70,6 +95,7 @@ def generate_article_with_gemini(topic, api_key, base_url, model_name, custom_pr
             'googleSearch': {}
         }]
         print(f"🔍 已启用 Google 搜索功能\n")
+    context = make_prompt_context(model_name, system_text, user_text, data.get('tools'))
 
     # 打印请求配置
     print(f"📤 实际发送给 Gemini API 的配置:")
@@ -82,60 +108,34 @@ def generate_article_with_gemini(topic, api_key, base_url, model_name, custom_pr
     try:
         # 发送请求
         print(f"⏳ 正在生成文章...\n")
-        response = requests.post(url, headers=headers, json=data, timeout=120)
+        cache_key = make_cache_key(base_url, model_name, data) if use_cache else None
+        collected = get_cached_response('article', cache_key) if use_cache else None
+        from_cache = collected is not None
+        if from_cache:
+            print(f"♻️  命中正文缓存，跳过生成请求\n")
+        elif stream:
+            collected = _stream_article_response(api_key, base_url, model_name, data, on_chunk, context)
+            if collected is None:
+                print(f"⚠️  API 地址不支持流式输出，改用非流式请求\n")
 
-        if response.status_code != 200:
-            print(f"\n❌ Gemini API 返回错误:")
-            print(f"   状态码: {response.status_code}")
-            print(f"   错误响应:")
-            try:
-                error_detail = response.json()
-                print(json.dumps(error_detail, indent=6, ensure_ascii=False))
-            except:
-                print(f"   {response.text}")
-            print(f"{'='*60}\n")
+        if collected is None:
+            response = post_gemini('text', api_key, base_url, f'/v1beta/models/{model_name}:generateContent', data, timeout=120, context=context)
 
-        response.raise_for_status()
+            if response.status_code != 200:
+                _print_error_response(response)
 
-        # 解析响应
-        result = response.json()
+            response.raise_for_status()
 
-        # 提取文章内容
-        article_text = ""
-        search_queries = []
-        grounding_sources = []
-        thinking_text = ""
+            # 解析响应
+            collected = _new_article_collector()
+            _collect_article_parts(response.json(), collected)
 
-        if 'candidates' in result and len(result['candidates']) > 0:
-            candidate = result['candidates'][0]
-
-            # 提取文本内容
-            if 'content' in candidate and 'parts' in candidate['content']:
-                for part in candidate['content']['parts']:
-                    if 'text' in part:
-                        article_text += part['text']
-
-                    # 检查是否有思考过程
-                    if 'thought' in part and part['thought']:
-                        thinking_text += part['thought'] + "\n"
-
-            # 提取搜索元数据
-            if 'groundingMetadata' in candidate:
-                metadata = candidate['groundingMetadata']
-
-                # 提取搜索查询
-                if 'webSearchQueries' in metadata:
-                    search_queries = metadata['webSearchQueries']
-
-                # 提取引用来源
-                if 'groundingChunks' in metadata:
-                    for chunk_item in metadata['groundingChunks']:
-                        if 'web' in chunk_item:
-                            source = {
-                                'uri': chunk_item['web'].get('uri', ''),
-                                'title': chunk_item['web'].get('title', '')
-                            }
-                            grounding_sources.append(source)
+        # 提取文章内容
+        article_text = collected['text']
+        search_queries = collected['search_queries']
+        grounding_sources = collected['grounding_sources']
+        thinking_text = collected['thinking']
+        usage = collected['usage']
 
         # 显示思考过程
         if thinking_text:
@@ -163,6 +163,8 @@ def generate_article_with_gemini(topic, api_key, base_url, model_name, custom_pr
         print(f"  - Temperature: {temperature}")
         print(f"  - Top-P: {top_p}")
         print(f"  - 文章长度: {len(article_text)} 字符")
+        if usage.get('candidatesTokenCount'):
+            print(f"  - 输出 Token: {usage['candidatesTokenCount']}")
         if search_queries:
             print(f"  - 搜索次数: {len(search_queries)}")
         if grounding_sources:
@@ -171,6 +173,8 @@ def generate_article_with_gemini(topic, api_key, base_url, model_name, custom_pr
 
         if not article_text:
             raise Exception('无法从 API 响应中提取文章内容')
+        if use_cache and not from_cache:
+            put_cached_response('article', cache_key, collected)
 
         # 返回文章内容和引用来源（元组形式）
         return article_text, grounding_sources
@@ -185,111 +189,328 @@ def generate_article_with_gemini(topic, api_key, base_url, model_name, custom_pr
         raise
 
 
-def format_article_with_citations(article_text, grounding_sources):
+def _new_article_collector():
+    """创建用于累积文章响应内容的字典"""
+    return {'text': '', 'thinking': '', 'search_queries': [], 'grounding_sources': [], 'usage': {}}
+
+
+def _collect_article_parts(result, collected):
+    """从 generateContent 响应（或流式响应的单个分片）中累积正文、思考过程和搜索元数据
+
+    Returns:
+        str: 本次新增的正文
     """
-    在文章末尾添加参考资料引用链接，并进行智能排序和筛选
+    if result.get('usageMetadata'):
+        collected['usage'] = result['usageMetadata']
+
+    if 'candidates' not in result or len(result['candidates']) == 0:
+        return ''
+    candidate = result['candidates'][0]
+
+    # 提取文本内容
+    text = ''
+    if 'content' in candidate and 'parts' in candidate['content']:
+        for part in candidate['content']['parts']:
+            if 'text' in part:
+                text += part['text']
+
+            # 检查是否有思考过程
+            if 'thought' in part and part['thought']:
+                collected['thinking'] += part['thought'] + "\n"
+    collected['text'] += text
+
+    # 提取搜索元数据
+    if 'groundingMetadata' in candidate:
+        metadata = candidate['groundingMetadata']
+
+        # 提取搜索查询
+        if 'webSearchQueries' in metadata:
+            collected['search_queries'] = metadata['webSearchQueries']
+
+        # 提取引用来源（流式响应的多个分片可能重复携带同一来源，按 URI 去重）
+        if 'groundingChunks' in metadata:
+            seen_uris = {source['uri'] for source in collected['grounding_sources']}
+            for chunk_item in metadata['groundingChunks']:
+                if 'web' in chunk_item:
+                    uri = chunk_item['web'].get('uri', '')
+                    if uri in seen_uris:
+                        continue
+                    seen_uris.add(uri)
+                    collected['grounding_sources'].append({
+                        'uri': uri,
+                        'title': chunk_item['web'].get('title', '')
+                    })
+    return text
+
+
+def _print_error_response(response):
+    """打印 Gemini API 返回的错误详情"""
+    import json
+
+    print(f"\n❌ Gemini API 返回错误:")
+    print(f"   状态码: {response.status_code}")
+    print(f"   错误响应:")
+    try:
+        error_detail = response.json()
+        print(json.dumps(error_detail, indent=6, ensure_ascii=False))
+    except:
+        print(f"   {response.text}")
+    print(f"{'='*60}\n")
+
+
+def _stream_article_response(api_key, base_url, model_name, data, on_chunk=None, context=None):
+    """以 SSE 流式接收文章内容
+
+    代理忽略 alt=sse、以 200 返回普通 JSON 响应体时，直接解析该响应体，
+    不再重新发送非流式请求（避免同一篇文章生成并计费两次）。
+
+    Returns:
+        dict: 累积的响应内容；API 地址不支持流式输出（404/405/501）时返回 None
     """
-    if not grounding_sources:
-        return article_text
+    import json
+
+    # 读取超时作用于相邻两个分片之间的间隔
+    response = post_gemini(
+        'text', api_key, base_url, f'/v1beta/models/{model_name}:streamGenerateContent?alt=sse', data,
+        timeout=(10, 120), stream=True, context=context
+    )
+    with response:
+        if response.status_code in (404, 405, 501):
+            return None
+        if response.status_code != 200:
+            _print_error_response(response)
+        response.raise_for_status()
+
+        collected = _new_article_collector()
+        received = False
+        plain_body = []
+        for raw_line in response.iter_lines():
+            # SSE 数据行格式: "data: {json}"，其余行（空行、注释）忽略
+            if not raw_line or not raw_line.startswith(b'data:'):
+                if raw_line and not received:
+                    plain_body.append(raw_line)
+                continue
+            payload = raw_line[5:].strip()
+            if not payload:
+                continue
+            received = True
+            chunk = json.loads(payload.decode('utf-8'))
+            if 'error' in chunk:
+                raise Exception(f"Gemini API 流式响应错误: {chunk['error'].get('message', chunk['error'])}")
+            text = _collect_article_parts(chunk, collected)
+            if text and on_chunk:
+                on_chunk(text, collected['text'], collected['usage'])
+
+    if not received:
+        # 代理返回了非 SSE 格式的响应：按非流式响应解析已收到的响应体
+        # （generateContent 返回单个对象，未加 alt=sse 的流式接口返回对象数组）
+        print(f"⚠️  API 地址返回了非 SSE 格式的响应，按非流式响应解析\n")
+        try:
+            result = json.loads(b'\n'.join(plain_body).decode('utf-8'))
+        except ValueError as e:
+            raise Exception(f"无法解析 Gemini API 响应: {e}")
+        for chunk in (result if isinstance(result, list) else [result]):
+            if 'error' in chunk:
+                raise Exception(f"Gemini API 响应错误: {chunk['error'].get('message', chunk['error'])}")
+            _collect_article_parts(chunk, collected)
+        if collected['text'] and on_chunk:
+            on_chunk(collected['text'], collected['text'], collected['usage'])
+    return collected
+
+
+# 无效页面标题的关键词黑名单
+INVALID_TITLE_KEYWORDS = [
+    '404', 'not found', '页面不存在', '找不到', 'page verification',
+    'are you a robot', 'just a moment', 'checking your browser',
+    '安全验证', '人机验证', '访问验证', 'login', '登录', 'error', '错误'
+]
+
+# 引用解析：并发数、每篇文章的总时限（秒）和保留的引用数量
+CITATION_WORKERS = 4
+CITATION_DEADLINE_SECONDS = 30
+MAX_CITATIONS = 5
+
+
+# 搜索结果附带的 web.title 通常是来源站点的域名，可在解析前预筛
+DOMAIN_HINT_PATTERN = re.compile(r'^(?:[a-z0-9-]+\.)+[a-z]{2,}$', re.IGNORECASE)
+
+
+def _check_gfwlist(candidate):
+    matched_rule = is_domain_blacklisted(candidate['url'])
+    return f"Matched: {matched_rule}" if matched_rule else None
 
-    print(f"\n🔍 开始处理 {len(grounding_sources)} 个原始引用来源...")
+
+def _check_tld(candidate):
+    return None if is_tld_whitelisted(candidate['url']) else f"URL: {candidate['url']}"
+
+
+def _check_static(candidate):
+    return None if is_static_url(candidate['url']) else f"URL: {candidate['url']}"
+
+
+def _check_title_keyword(candidate):
+    return f"Title: {candidate['title']}" if contains_blacklisted_keyword(candidate['title']) else None
+
+
+def _check_site_name_chinese(candidate):
+    return None if contains_chinese(candidate['site_name']) else f"Site Name: {candidate['site_name']}"
+
+
+def _check_site_name_traditional(candidate):
+    return f"Site Name: {candidate['site_name']}" if contains_traditional_chinese(candidate['site_name']) else None
+
+
+def _check_title_chinese(candidate):
+    return None if contains_chinese(candidate['title']) else f"Title: {candidate['title']}"
+
+
+def _check_title_traditional(candidate):
+    return f"Title: {candidate['title']}" if contains_traditional_chinese(candidate['title']) else None
+
+
+def _check_invalid_page(candidate):
+    lower_title = (candidate['title'] or '').lower()
+    if any(keyword in lower_title for keyword in INVALID_TITLE_KEYWORDS):
+        return f"Title: {candidate['title']}"
+    return None
+
+
+def _check_duplicate(candidate):
+    return f"URL: {candidate['url']}" if candidate['url'] in candidate['seen_urls'] else None
+
+
+# --- 终极版八层过滤系统（按成本分阶段执行） ---
+# offline: 用搜索结果中的域名预筛，不发起请求
+# url: 跟随跳转得到真实 URL 后、下载文章页和主页之前
+# content: 获取标题和网站名之后
+CITATION_FILTERS = FilterPipeline([
+    FilterRule(STAGE_OFFLINE, '1/8', '1. GFWList Blacklist (Domain Hint)', '域名在 GFWList 黑名单中（预筛）', _check_gfwlist),
+    FilterRule(STAGE_OFFLINE, '2/8', '2. TLD Whitelist (Domain Hint)', '域名后缀不在白名单内（预筛）', _check_tld),
+    FilterRule(STAGE_URL, '1/8', '1. GFWList Blacklist', '域名在 GFWList 黑名单中', _check_gfwlist),
+    FilterRule(STAGE_URL, '2/8', '2. TLD Whitelist', '域名后缀不在白名单内', _check_tld),
+    FilterRule(STAGE_URL, '3/8', '3. Non-Static URL', 'URL 非静态链接 (非 .html/.htm)', _check_static),
+    FilterRule(STAGE_CONTENT, '4/8', '4. Title Keyword Blacklist', '标题包含黑名单关键词', _check_title_keyword),
+    FilterRule(STAGE_CONTENT, '5/8', '5. Invalid Site Name (No Chinese)', '网站名称不含中文 (纯英文或乱码)', _check_site_name_chinese),
+    FilterRule(STAGE_CONTENT, '5/8', '5. Traditional Chinese in Site Name', '网站名称检测到繁体字', _check_site_name_traditional),
+    FilterRule(STAGE_CONTENT, '6/8', '6. Invalid Title (No Chinese)', '文章标题不含中文 (纯英文或乱码)', _check_title_chinese),
+    FilterRule(STAGE_CONTENT, '6/8', '6. Traditional Chinese in Title', '文章标题检测到繁体字', _check_title_traditional),
+    FilterRule(STAGE_CONTENT, '7/8', '7. Invalid Page Content', '页面内容无效 (404/登录页等)', _check_invalid_page),
+    FilterRule(STAGE_CONTENT, '8/8', '8. Duplicate URL', '检测到重复链接', _check_duplicate),
+])
+
+
+def get_citation_filter_stats():
+    """返回引用过滤各规则的检查次数、拒绝次数和耗时"""
+    return CITATION_FILTERS.get_stats()
+
+
+def _report_rejection(url, rejection):
+    rule, detail = rejection
+    print(f"  ✗ [{rule.label}] {rule.message}，已过滤")
+    log_filtered_event(url, rule.reason, detail)
+
+
+def _resolve_citation(uri):
+    """解析单个来源；真实 URL 未通过 url 阶段时不下载页面，返回 (结果, 拒绝信息)"""
+    checked = []
+
+    def url_filter(real_url):
+        checked.append(CITATION_FILTERS.run(STAGE_URL, {'url': real_url}))
+        return checked[-1] is None
+
+    result = fetch_real_url_and_title(uri, url_filter=url_filter)
+    if not checked:
+        # 请求失败时未经过 url 阶段，按返回的链接补做检查
+        url_filter(result[0])
+    return result, checked[0]
+
+
+def resolve_citation_sources(grounding_sources, max_sources=MAX_CITATIONS, deadline_seconds=CITATION_DEADLINE_SECONDS, max_workers=CITATION_WORKERS):
+    """并发解析搜索来源的真实链接、标题和网站名，按原始顺序筛选
+
+    解析前先用搜索结果中的域名预筛；解析在有界线程池中并发进行，真实 URL
+    未通过检查的来源不再下载页面。筛选仍按来源的原始顺序执行；找到 max_sources 条
+    有效引用后取消尚未开始的解析。超过 deadline_seconds 仍未完成的来源直接跳过。
+
+    Returns:
+        list: [{'url', 'title', 'site_name'}, ...]，最多 max_sources 条
+    """
+    sources = [source for source in grounding_sources or [] if source.get('uri')]
+    if not sources:
+        return []
+
+    uris = []
+    for source in sources:
+        domain_hint = (source.get('title') or '').strip().lower()
+        if DOMAIN_HINT_PATTERN.match(domain_hint):
+            rejection = CITATION_FILTERS.run(STAGE_OFFLINE, {'url': f'http://{domain_hint}/'})
+            if rejection:
+                print(f"  → 预筛: {domain_hint}")
+                _report_rejection(source['uri'], rejection)
+                continue
+        uris.append(source['uri'])
+    if not uris:
+        print("\n⭐ 所有引用来源均未通过预筛")
+        return []
+
+    print(f"\n🔍 开始处理 {len(uris)} 个原始引用来源（预筛排除 {len(sources) - len(uris)} 个，并发 {max_workers}，时限 {deadline_seconds} 秒）...")
     processed_sources = []
     seen_urls = set()
+    deadline = time.monotonic() + deadline_seconds
 
-    # 定义无效页面标题的关键词黑名单
-    INVALID_TITLE_KEYWORDS = [
-        '404', 'not found', '页面不存在', '找不到', 'page verification',
-        'are you a robot', 'just a moment', 'checking your browser',
-        '安全验证', '人机验证', '访问验证', 'login', '登录', 'error', '错误'
-    ]
-    for source in grounding_sources:
-        original_uri = source.get('uri', '')
-        if not original_uri:
-            continue
-
-        print(f"  → 正在解析: {original_uri[:70]}...")
-        real_url, title, site_name, lang = fetch_real_url_and_title(original_uri)
-
-        # --- 终极版八层过滤系统 ---
-        # 1. GFWList 黑名单检查
-        matched_rule = is_domain_blacklisted(real_url)
-        if matched_rule:
-            print(f"  ✗ [1/8] 域名在 GFWList 黑名单中，已过滤")
-            log_filtered_event(real_url, "1. GFWList Blacklist", f"Matched: {matched_rule}")
-            continue
-
-        # 2. TLD 白名单检查
-        if not is_tld_whitelisted(real_url):
-            print(f"  ✗ [2/8] 域名后缀不在白名单内，已过滤")
-            log_filtered_event(real_url, "2. TLD Whitelist", f"URL: {real_url}")
-            continue
-
-        # 3. 静态链接格式检查
-        if not is_static_url(real_url):
-            print(f"  ✗ [3/8] URL 非静态链接 (非 .html/.htm)，已过滤")
-            log_filtered_event(real_url, "3. Non-Static URL", f"URL: {real_url}")
-            continue
-
-        # 4. 标题关键词黑名单检查
-        if contains_blacklisted_keyword(title):
-            print(f"  ✗ [4/8] 标题包含黑名单关键词，已过滤")
-            log_filtered_event(real_url, "4. Title Keyword Blacklist", f"Title: {title}")
-            continue
-
-        # 5. 严格独立内容审查 (网站名)
-        if not contains_chinese(site_name):
-            print(f"  ✗ [5/8] 网站名称不含中文 (纯英文或乱码)，已过滤")
-            log_filtered_event(real_url, "5. Invalid Site Name (No Chinese)", f"Site Name: {site_name}")
-            continue
-        if contains_traditional_chinese(site_name):
-            print(f"  ✗ [5/8] 网站名称检测到繁体字，已过滤")
-            log_filtered_event(real_url, "5. Traditional Chinese in Site Name", f"Site Name: {site_name}")
-            continue
-
-        # 6. 严格独立内容审查 (标题)
-        if not contains_chinese(title):
-            print(f"  ✗ [6/8] 文章标题不含中文 (纯英文或乱码)，已过滤")
-            log_filtered_event(real_url, "6. Invalid Title (No Chinese)", f"Title: {title}")
-            continue
-        if contains_traditional_chinese(title):
-            print(f"  ✗ [6/8] 文章标题检测到繁体字，已过滤")
-            log_filtered_event(real_url, "6. Traditional Chinese in Title", f"Title: {title}")
-            continue
-
-        # 7. 无效页面检查 (404, 登录等)
-        is_invalid_title = False
-        if title:
-            lower_title = title.lower()
-            for keyword in INVALID_TITLE_KEYWORDS:
-                if keyword in lower_title:
-                    is_invalid_title = True
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='citation')
+    try:
+        futures = [executor.submit(_resolve_citation, uri) for uri in uris]
+        for uri, future in zip(uris, futures):
+            print(f"  → 正在解析: {uri[:70]}...")
+            try:
+                (real_url, title, site_name, lang), rejection = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FuturesTimeoutError:
+                print(f"  ✗ 解析超时，跳过")
+                continue
+            except Exception as e:
+                print(f"  ✗ 解析出错，跳过: {e}")
+                continue
+
+            if rejection is None:
+                rejection = CITATION_FILTERS.run(STAGE_CONTENT, {
+                    'url': real_url, 'title': title, 'site_name': site_name, 'seen_urls': seen_urls
+                })
+            if rejection:
+                _report_rejection(real_url, rejection)
+                continue
+
+            if real_url and title and site_name:
+                processed_sources.append({
+                    'url': real_url,
+                    'title': title,
+                    'site_name': site_name
+                })
+                # 将新链接添加到已处理集合
+                seen_urls.add(real_url)
+                print(f"  ✓ 解析成功: {site_name} - {title}")
+                if len(processed_sources) >= max_sources:
+                    print(f"  ⏹️  已找到 {max_sources} 条有效引用，停止解析剩余来源")
                     break
-        if is_invalid_title:
-            print(f"  ✗ [7/8] 页面内容无效 (404/登录页等)，已过滤")
-            log_filtered_event(real_url, "7. Invalid Page Content", f"Title: {title}")
-            continue
-
-        # 8. 重复链接检查
-        if real_url in seen_urls:
-            print(f"  ✗ [8/8] 检测到重复链接，已过滤")
-            log_filtered_event(real_url, "8. Duplicate URL", f"URL: {real_url}")
-            continue
-
-        if real_url and title and site_name:
-            processed_sources.append({
-                'url': real_url,
-                'title': title,
-                'site_name': site_name
-            })
-            # 将新链接添加到已处理集合
-            seen_urls.add(real_url)
-            print(f"  ✓ 解析成功: {site_name} - {title}")
-        else:
-            print(f"  ✗ 解析失败或信息不全，跳过")
+            else:
+                print(f"  ✗ 解析失败或信息不全，跳过")
+    finally:
+        # 不等待已超时或不再需要的解析，尚未开始的直接取消
+        executor.shutdown(wait=False, cancel_futures=True)
 
     print(f"\n⭐ 已完成高质量筛选，共找到 {len(processed_sources)} 条有效引用")
+    return processed_sources
 
-    top_sources = processed_sources[:5]
+
+def format_article_with_citations(article_text, grounding_sources, deadline_seconds=CITATION_DEADLINE_SECONDS):
+    """
+    在文章末尾添加参考资料引用链接，并进行智能排序和筛选
+    """
+    if not grounding_sources:
+        return article_text
+
+    processed_sources = resolve_citation_sources(grounding_sources, deadline_seconds=deadline_seconds)
+    top_sources = processed_sources[:MAX_CITATIONS]
     print(f"🔪 已选取最重要的 {len(top_sources)} 条引用")
 
     if not top_sources:
@@ -343,18 +564,20 @@ def generate_visual_blueprint(topic, article, api_key, base_url, model_name):
 4. 只输出 JSON，禁止添加额外解释或 Markdown。
 """
 
-    url = f'{base_url}/v1beta/models/{model_name}:generateContent?key={api_key}'
-    headers = {'Content-Type': 'application/json'}
     data = {
         'contents': [{
             'parts': [{'text': prompt}]
         }]
     }
 
-    response = requests.post(url, headers=headers, json=data)
-    response.raise_for_status()
+    cache_key = make_cache_key(base_url, model_name, data)
+    result = get_cached_response('blueprint', cache_key)
+    cached = result is not None
+    if not cached:
+        response = post_gemini('text', api_key, base_url, f'/v1beta/models/{model_name}:generateContent', data, timeout=60)
+        response.raise_for_status()
+        result = response.json()
 
-    result = response.json()
     if 'candidates' not in result or not result['candidates']:
         raise Exception('视觉描述生成失败：没有候选内容')
 
@@ -364,7 +587,15 @@ def generate_visual_blueprint(topic, article, api_key, base_url, model_name):
         blueprint = parse_json_response(raw_text)
     except ValueError as exc:
         raise Exception(f'视觉描述 JSON 解析失败: {exc}')
+    # 只缓存能成功解析的响应，解析失败的请求重试时仍会重新生成
+    if not cached:
+        put_cached_response('blueprint', cache_key, result)
+
+    return _normalize_blueprint(blueprint, topic)
+
 
+def _normalize_blueprint(blueprint, topic):
+    """校验视觉蓝图字段，缺失或无效的字段使用默认描述"""
     template = blueprint.get('template', 'editorial')
     if template not in VISUAL_TEMPLATE_PRESETS:
         template = 'editorial'
@@ -384,6 +615,104 @@ def generate_visual_blueprint(topic, article, api_key, base_url, model_name):
     return normalized
 
 
+# 视觉蓝图的字段（合并的图片规划请求中与主题分析字段一起返回）
+_BLUEPRINT_FIELDS = ('subject', 'scene', 'mood', 'style', 'lighting', 'composition', 'details', 'negative')
+
+# 合并的图片规划响应结构（Gemini responseSchema）
+_IMAGE_PLAN_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'blueprint': {
+            'type': 'OBJECT',
+            'properties': {
+                'template': {'type': 'STRING', 'enum': ['portrait', 'urban_story', 'technology', 'nature', 'editorial', 'abstract']},
+                **{field: {'type': 'STRING'} for field in _BLUEPRINT_FIELDS}
+            },
+            'required': ['template', *_BLUEPRINT_FIELDS]
+        },
+        'analysis': {
+            'type': 'OBJECT',
+            'properties': {
+                'ethnicity': {'type': 'STRING', 'enum': TOPIC_ETHNICITY_OPTIONS},
+                'style': {'type': 'STRING', 'enum': TOPIC_STYLE_OPTIONS},
+                'sensitivity_level': {'type': 'STRING', 'enum': TOPIC_SENSITIVITY_OPTIONS},
+                'reasoning': {'type': 'STRING'},
+                'detected_topics': {'type': 'ARRAY', 'items': {'type': 'STRING'}}
+            },
+            'required': ['ethnicity', 'style', 'sensitivity_level']
+        }
+    },
+    'required': ['blueprint', 'analysis']
+}
+
+
+def generate_image_plan(topic, article, api_key, base_url, model_name):
+    """一次请求同时生成视觉蓝图和主题分析（人物种族、图片风格、敏感度）
+
+    使用 responseSchema 约束输出结构，响应直接按 JSON 解析。
+
+    Returns:
+        dict: {'blueprint': 规范化后的视觉蓝图, 'analysis': 主题分析结果}
+    """
+    if not api_key:
+        raise Exception('未配置 Gemini API Key')
+
+    prompt = f"""你是一名资深视觉导演，请阅读以下文章内容，一次完成两项任务：为 Stable Diffusion / ComfyUI 产出视觉计划（blueprint），并为AI图片生成推荐参数（analysis）。
+标题：{topic}
+正文片段：{article[:2000]}
+
+一、blueprint（视觉计划）要求：
+1. template 字段只能取 portrait、urban_story、technology、nature、editorial、abstract 之一。
+2. subject、scene、mood、style、lighting、composition、details 写出具体可视化描述，使用英文短语，长度 4-15 个词，用英文逗号分隔。
+3. negative 字段写出不希望出现的画面元素，使用英文。
+
+二、analysis（主题分析）要求：
+ethnicity、style、sensitivity_level 按以下规则选择，reasoning 简短说明推荐理由，detected_topics 列出检测到的主题标签。
+
+{TOPIC_ANALYSIS_RULES}"""
+
+    data = {
+        'contents': [{
+            'parts': [{'text': prompt}]
+        }],
+        'generationConfig': {
+            'responseMimeType': 'application/json',
+            'responseSchema': _IMAGE_PLAN_SCHEMA
+        }
+    }
+
+    cache_key = make_cache_key(base_url, model_name, data)
+    result = get_cached_response('image_plan', cache_key)
+    cached = result is not None
+    if not cached:
+        response = post_gemini('text', api_key, base_url, f'/v1beta/models/{model_name}:generateContent', data, timeout=60)
+        response.raise_for_status()
+        result = response.json()
+
+    if 'candidates' not in result or not result['candidates']:
+        raise Exception('图片规划生成失败：没有候选内容')
+
+    raw_text = result['candidates'][0]['content']['parts'][0]['text']
+    try:
+        plan = json.loads(raw_text)
+    except json.JSONDecodeError as exc:
+        raise Exception(f'图片规划 JSON 解析失败: {exc}')
+    if not isinstance(plan.get('blueprint'), dict) or not isinstance(plan.get('analysis'), dict):
+        raise Exception('图片规划响应缺少 blueprint 或 analysis')
+    if not cached:
+        put_cached_response('image_plan', cache_key, result)
+
+    analysis = plan['analysis']
+    topic_analysis = {
+        'ethnicity': analysis.get('ethnicity') if analysis.get('ethnicity') in TOPIC_ETHNICITY_OPTIONS else 'chinese',
+        'style': analysis.get('style') if analysis.get('style') in TOPIC_STYLE_OPTIONS else 'realistic',
+        'sensitivity_level': analysis.get('sensitivity_level') if analysis.get('sensitivity_level') in TOPIC_SENSITIVITY_OPTIONS else 'medium',
+        'reasoning': analysis.get('reasoning', ''),
+        'detected_topics': analysis.get('detected_topics') or []
+    }
+    return {'blueprint': _normalize_blueprint(plan['blueprint'], topic), 'analysis': topic_analysis}
+
+
 def build_visual_prompts(blueprint):
     """根据视觉蓝图和模板生成正/负向提示词"""
     if not blueprint:
@@ -419,28 +748,8 @@ def build_visual_prompts(blueprint):
     }
 
 
-def summarize_paragraph_for_image(paragraph_text, topic, config):
-    """为段落生成图片摘要（中文视觉描述）"""
-    # 摘要模型独立配置，如果未设置则使用主写作模型作为默认值
-    summary_model = config.get('comfyui_summary_model')
-
-    # 向后兼容：如果是旧的 __default__ 值或未设置，使用主写作模型
-    if not summary_model or summary_model == '__default__':
-        summary_model = config.get('default_model', 'gemini-pro')
-
-    api_key = config.get('gemini_api_key', '')
-    base_url = config.get('gemini_base_url', 'https://generativelanguage.googleapis.com')
-
-    if not api_key:
-        return f"visual representation of {topic}"
-
-    # 限制段落长度
-    truncated_para = paragraph_text[:500]
-
-    prompt = f"""阅读以下关于「{topic}」的文章段落，为其生成适合AI图片生成的中文视觉描述。
-
-核心要求：
-1. 描述段落中的主要主体、动作或场景（15-30个汉字）
+# 段落配图摘要的安全要求（单段和批量摘要共用）
+_IMAGE_SUMMARY_RULES = """1. 描述段落中的主要主体、动作或场景（15-30个汉字）
 2. 要具体且可视化 - 描述你会看到什么，而不是抽象概念
 3. 使用具体的名词、生动的动词和具体细节
 4. 聚焦于视觉元素：物体、人物、地点、动作、氛围、色彩、光线
@@ -472,7 +781,73 @@ def summarize_paragraph_for_image(paragraph_text, topic, config):
 ✗ 危险："军人站岗"（会被封号！）
 ✗ 危险："国旗飘扬"（会被封号！）
 
-5. 只输出中文视觉描述，不要引号、标点或额外说明文字
+"""
+
+# 摘要中出现即替换为安全场景的敏感词
+_SENSITIVE_SUMMARY_KEYWORDS = [
+    '警察', '军人', '军队', '士兵', '警服', '军装', '制服', '警徽', '军徽',
+    '警车', '军车', '坦克', '武器', '枪', '步枪', '手枪',
+    '国旗', '党旗', '国徽', '党徽', '领导', '主席', '总书记',
+    '天安门', '人民大会堂', '政府', '官员', '公务员',
+    '城管', '保安', '执法', '巡逻', '站岗',
+    '战争', '打斗', '冲突', '抗议', '游行', '示威'
+]
+
+# 摘要生成失败时的安全降级描述
+SAFE_SUMMARY_FALLBACK = "现代都市生活场景，穿着便装的平民，日常休闲活动，和平场景，纯视觉场景，无文字无符号无制服"
+
+
+def _get_summary_model(config):
+    """摘要模型独立配置，如果未设置则使用主写作模型作为默认值"""
+    summary_model = config.get('comfyui_summary_model')
+
+    # 向后兼容：如果是旧的 __default__ 值或未设置，使用主写作模型
+    if not summary_model or summary_model == '__default__':
+        summary_model = config.get('default_model', 'gemini-pro')
+    return summary_model
+
+
+def _sanitize_image_summary(summary):
+    """过滤摘要中的敏感词，并追加不含文字和制服的安全提示"""
+    summary = summary.strip().strip('"').strip("'")
+
+    # 如果检测到敏感词，替换为安全的通用场景
+    contains_sensitive = False
+    for keyword in _SENSITIVE_SUMMARY_KEYWORDS:
+        if keyword in summary:
+            contains_sensitive = True
+            print(f"⚠️ 警告：检测到敏感词'{keyword}'，将替换为安全场景")
+            break
+
+    if contains_sensitive:
+        # 替换为安全的通用场景描述
+        summary = "现代都市街景，行人在商业街区漫步，现代建筑林立，温暖的阳光"
+        print(f"✓ 已替换为安全场景: {summary}")
+
+    # 为了进一步确保图片生成时不包含文字和敏感内容，在摘要后添加明确指示
+    enhanced_summary = f"{summary}，穿着便装的平民，日常休闲服饰，和平场景，纯视觉场景，无文字无符号无制服"
+
+    print(f"段落摘要生成成功: {summary}")
+    print(f"增强后的安全提示词: {enhanced_summary}")
+    return enhanced_summary
+
+
+def summarize_paragraph_for_image(paragraph_text, topic, config):
+    """为段落生成图片摘要（中文视觉描述）"""
+    summary_model = _get_summary_model(config)
+    api_key = config.get('gemini_api_key', '')
+    base_url = config.get('gemini_base_url', 'https://generativelanguage.googleapis.com')
+
+    if not api_key:
+        return f"visual representation of {topic}"
+
+    # 限制段落长度
+    truncated_para = paragraph_text[:500]
+
+    prompt = f"""阅读以下关于「{topic}」的文章段落，为其生成适合AI图片生成的中文视觉描述。
+
+核心要求：
+{_IMAGE_SUMMARY_RULES}5. 只输出中文视觉描述，不要引号、标点或额外说明文字
 
 段落内容：
 {truncated_para}
@@ -480,57 +855,118 @@ def summarize_paragraph_for_image(paragraph_text, topic, config):
 视觉描述："""
 
     try:
-        url = f'{base_url}/v1beta/models/{summary_model}:generateContent?key={api_key}'
-        headers = {'Content-Type': 'application/json'}
         data = {
             'contents': [{
                 'parts': [{'text': prompt}]
             }]
         }
 
-        response = requests.post(url, headers=headers, json=data, timeout=30)
-        response.raise_for_status()
+        context = make_prompt_context(
+            summary_model,
+            f"为文章段落生成适合AI图片生成的中文视觉描述。\n\n核心要求：\n{_IMAGE_SUMMARY_RULES}5. 只输出中文视觉描述，不要引号、标点或额外说明文字",
+            f"阅读以下关于「{topic}」的文章段落，为其生成适合AI图片生成的中文视觉描述。\n\n段落内容：\n{truncated_para}\n\n视觉描述："
+        )
+
+        cache_key = make_cache_key(base_url, summary_model, data)
+        result = get_cached_response('summary', cache_key)
+        if result is None:
+            response = post_gemini('text', api_key, base_url, f'/v1beta/models/{summary_model}:generateContent', data, timeout=30, context=context)
+            response.raise_for_status()
+            result = response.json()
+            cached = False
+        else:
+            cached = True
 
-        result = response.json()
         if 'candidates' in result and len(result['candidates']) > 0:
             summary = result['candidates'][0]['content']['parts'][0]['text']
-            summary = summary.strip().strip('"').strip("'")
-
-            # 安全过滤：检查并移除敏感词汇
-            sensitive_keywords = [
-                '警察', '军人', '军队', '士兵', '警服', '军装', '制服', '警徽', '军徽',
-                '警车', '军车', '坦克', '武器', '枪', '步枪', '手枪',
-                '国旗', '党旗', '国徽', '党徽', '领导', '主席', '总书记',
-                '天安门', '人民大会堂', '政府', '官员', '公务员',
-                '城管', '保安', '执法', '巡逻', '站岗',
-                '战争', '打斗', '冲突', '抗议', '游行', '示威'
-            ]
-
-            # 如果检测到敏感词，替换为安全的通用场景
-            contains_sensitive = False
-            for keyword in sensitive_keywords:
-                if keyword in summary:
-                    contains_sensitive = True
-                    print(f"⚠️ 警告：检测到敏感词'{keyword}'，将替换为安全场景")
-                    break
-
-            if contains_sensitive:
-                # 替换为安全的通用场景描述
-                summary = "现代都市街景，行人在商业街区漫步，现代建筑林立，温暖的阳光"
-                print(f"✓ 已替换为安全场景: {summary}")
-
-            # 为了进一步确保图片生成时不包含文字和敏感内容，在摘要后添加明确指示
-            enhanced_summary = f"{summary}，穿着便装的平民，日常休闲服饰，和平场景，纯视觉场景，无文字无符号无制服"
-
-            print(f"段落摘要生成成功: {summary}")
-            print(f"增强后的安全提示词: {enhanced_summary}")
-            return enhanced_summary
+            if not cached:
+                put_cached_response('summary', cache_key, result)
+            return _sanitize_image_summary(summary)
         else:
             raise Exception('无法从API响应中提取摘要')
     except Exception as e:
         print(f"段落摘要生成失败: {e}，使用安全降级方案")
         # 降级：使用安全的通用场景，避免任何可能的敏感内容
-        return f"现代都市生活场景，穿着便装的平民，日常休闲活动，和平场景，纯视觉场景，无文字无符号无制服"
+        return SAFE_SUMMARY_FALLBACK
+
+
+def summarize_paragraphs_for_images(paragraph_texts, topic, config):
+    """一次请求为多个段落生成图片摘要
+
+    安全要求只发送一次，模型按顺序返回 JSON 字符串数组；缺失或无效的条目
+    使用安全降级描述，每条摘要仍单独经过敏感词过滤。
+
+    Returns:
+        list: 与 paragraph_texts 一一对应的摘要
+    """
+    if not paragraph_texts:
+        return []
+    if len(paragraph_texts) == 1:
+        return [summarize_paragraph_for_image(paragraph_texts[0], topic, config)]
+
+    summary_model = _get_summary_model(config)
+    api_key = config.get('gemini_api_key', '')
+    base_url = config.get('gemini_base_url', 'https://generativelanguage.googleapis.com')
+
+    if not api_key:
+        return [f"visual representation of {topic}"] * len(paragraph_texts)
+
+    numbered = '\n\n'.join(
+        f"【段落 {index}】\n{text[:500]}" for index, text in enumerate(paragraph_texts, 1)
+    )
+    prompt = f"""阅读以下关于「{topic}」的 {len(paragraph_texts)} 个文章段落，分别为每个段落生成适合AI图片生成的中文视觉描述。
+
+核心要求（适用于每一条描述）：
+{_IMAGE_SUMMARY_RULES}5. 按段落顺序输出一个 JSON 字符串数组，恰好 {len(paragraph_texts)} 项，每项只包含该段落的中文视觉描述，不要额外说明文字
+
+{numbered}"""
+
+    summaries = [None] * len(paragraph_texts)
+    try:
+        data = {
+            'contents': [{
+                'parts': [{'text': prompt}]
+            }],
+            'generationConfig': {
+                'responseMimeType': 'application/json'
+            }
+        }
+
+        context = make_prompt_context(
+            summary_model,
+            f"为文章段落生成适合AI图片生成的中文视觉描述。\n\n核心要求（适用于每一条描述）：\n{_IMAGE_SUMMARY_RULES}5. 按段落顺序输出一个 JSON 字符串数组，每项只包含该段落的中文视觉描述，不要额外说明文字",
+            f"阅读以下关于「{topic}」的 {len(paragraph_texts)} 个文章段落，分别为每个段落生成中文视觉描述，输出恰好 {len(paragraph_texts)} 项的 JSON 字符串数组。\n\n{numbered}"
+        )
+
+        cache_key = make_cache_key(base_url, summary_model, data)
+        result = get_cached_response('summary', cache_key)
+        cached = result is not None
+        if not cached:
+            response = post_gemini('text', api_key, base_url, f'/v1beta/models/{summary_model}:generateContent', data, timeout=60, context=context)
+            response.raise_for_status()
+            result = response.json()
+
+        if 'candidates' not in result or not result['candidates']:
+            raise Exception('无法从API响应中提取摘要')
+        raw_text = result['candidates'][0]['content']['parts'][0]['text']
+        items = json.loads(strip_json_text(raw_text))
+        if isinstance(items, dict):
+            items = items.get('summaries') or next((v for v in items.values() if isinstance(v, list)), [])
+        if not isinstance(items, list):
+            raise Exception('摘要响应不是 JSON 数组')
+
+        for index, item in enumerate(items[:len(paragraph_texts)]):
+            if isinstance(item, str) and item.strip():
+                summaries[index] = _sanitize_image_summary(item)
+        if not cached and all(summaries):
+            put_cached_response('summary', cache_key, result)
+    except Exception as e:
+        print(f"批量段落摘要生成失败: {e}，使用安全降级方案")
+
+    missing = sum(1 for summary in summaries if summary is None)
+    if missing:
+        print(f"⚠️  {missing}/{len(paragraph_texts)} 条段落摘要缺失，使用安全降级方案")
+    return [summary or SAFE_SUMMARY_FALLBACK for summary in summaries]
 
 
 def test_gemini_model(model_name, api_key, base_url, temperature=1.0, top_p=0.95):
@@ -555,7 +991,7 @@ def test_gemini_model(model_name, api_key, base_url, temperature=1.0, top_p=0.95
     print(json.dumps(payload['generationConfig'], indent=4, ensure_ascii=False))
     print()
 
-    response = requests.post(url, headers=headers, json=payload, timeout=30)
+    response = limited_request('text', 'POST', url, headers=headers, json=payload, timeout=30)
 
     if response.status_code == 401:
         return False, 'API Key 无效或已过期', {}
@@ -583,7 +1019,7 @@ def test_gemini_model(model_name, api_key, base_url, temperature=1.0, top_p=0.95
 def get_available_models(api_key, base_url):
     """获取可用的 Gemini 模型列表"""
     url = f'{base_url}/v1beta/models?key={api_key}'
-    response = requests.get(url)
+    response = limited_request('models', 'GET', url, timeout=30)
     response.raise_for_status()
 
     data = response.json()
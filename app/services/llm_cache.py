@@ -0,0 +1,243 @@
+"""LLM 响应缓存模块
+
+视觉蓝图、主题分析、段落摘要等请求在重试和重复标题时会以完全相同的
+提示词和生成参数再次发送。这里按 (接口地址, 模型, 请求体) 的哈希缓存
+已成功解析的响应：
+- 内存 LRU 层：进程内最近使用的响应
+- SQLite 层（llm_cache.db）：服务重启后仍可命中
+- 每类请求独立的有效期（TTL），磁盘条目数超过上限时按最近访问时间淘汰
+  （磁盘条目数在内存中计数，只在首次写入时统计一次）
+- 命中/未命中计数，供管理接口查看
+
+正文生成的缓存需要在配置中通过 cache_article_responses 显式开启。
+"""
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from app.config import LLM_CACHE_FILE
+
+# 各类请求的默认有效期（秒）
+DEFAULT_CACHE_TTLS = {
+    'blueprint': 7 * 24 * 3600,
+    'analysis': 7 * 24 * 3600,
+    'summary': 7 * 24 * 3600,
+    'image_plan': 7 * 24 * 3600,
+    'article': 24 * 3600
+}
+DEFAULT_MEMORY_ENTRIES = 256
+DEFAULT_DISK_ENTRIES = 5000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    cache_key TEXT PRIMARY KEY,
+    call_type TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache (accessed_at);
+"""
+
+_cache_lock = threading.Lock()
+_connection = None
+_memory = OrderedDict()   # cache_key -> (call_type, 响应 JSON 文本, 写入时间)
+_settings = {
+    'enabled': True,
+    'ttls': dict(DEFAULT_CACHE_TTLS),
+    'memory_entries': DEFAULT_MEMORY_ENTRIES,
+    'disk_entries': DEFAULT_DISK_ENTRIES
+}
+_stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'writes': 0, 'by_type': {}}
+_disk_count = {'entries': None}   # 磁盘条目数；None 表示尚未统计（或写入出错后需重新统计）
+
+
+def _get_connection():
+    """获取（必要时初始化）缓存数据库连接，调用方需持有 _cache_lock"""
+    global _connection
+    if _connection is None:
+        directory = os.path.dirname(os.path.abspath(LLM_CACHE_FILE))
+        os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(LLM_CACHE_FILE, check_same_thread=False, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(_SCHEMA)
+        _connection = conn
+    return _connection
+
+
+def configure_llm_cache(config):
+    """根据配置更新缓存开关、有效期和容量"""
+    ttls = dict(DEFAULT_CACHE_TTLS)
+    for call_type, ttl in (config.get('llm_cache_ttls') or {}).items():
+        ttls[call_type] = int(ttl)
+    with _cache_lock:
+        _settings['enabled'] = bool(config.get('llm_cache_enabled', True))
+        _settings['ttls'] = ttls
+        _settings['memory_entries'] = max(1, int(config.get('llm_cache_memory_entries', DEFAULT_MEMORY_ENTRIES)))
+        _settings['disk_entries'] = max(1, int(config.get('llm_cache_max_entries', DEFAULT_DISK_ENTRIES)))
+        while len(_memory) > _settings['memory_entries']:
+            _memory.popitem(last=False)
+
+
+def make_cache_key(base_url, model, payload):
+    """按接口地址、模型和请求体（提示词、generationConfig 等）计算缓存键"""
+    material = json.dumps(
+        {'endpoint': (base_url or '').rstrip('/'), 'model': model, 'payload': payload},
+        sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+def _count(call_type, field):
+    counters = _stats['by_type'].setdefault(call_type, {'hits': 0, 'misses': 0})
+    counters[field] += 1
+
+
+def get_cached_response(call_type, cache_key):
+    """读取缓存的响应，未命中或已过期时返回 None"""
+    with _cache_lock:
+        if not _settings['enabled']:
+            return None
+        ttl = _settings['ttls'].get(call_type, 0)
+        now = time.time()
+
+        entry = _memory.get(cache_key)
+        if entry is not None:
+            if now - entry[2] <= ttl:
+                _memory.move_to_end(cache_key)
+                _stats['memory_hits'] += 1
+                _count(call_type, 'hits')
+                return json.loads(entry[1])
+            _memory.pop(cache_key, None)
+
+        try:
+            conn = _get_connection()
+            row = conn.execute(
+                'SELECT response, created_at FROM llm_cache WHERE cache_key = ? AND created_at >= ?',
+                (cache_key, now - ttl)
+            ).fetchone()
+            if row is not None:
+                conn.execute('UPDATE llm_cache SET accessed_at = ? WHERE cache_key = ?', (now, cache_key))
+        except Exception as e:
+            print(f"⚠️  LLM 缓存读取失败: {e}")
+            row = None
+
+        if row is None:
+            _stats['misses'] += 1
+            _count(call_type, 'misses')
+            return None
+
+        _remember_locked(cache_key, call_type, row[0], row[1])
+        _stats['disk_hits'] += 1
+        _count(call_type, 'hits')
+        return json.loads(row[0])
+
+
+def put_cached_response(call_type, cache_key, response):
+    """写入缓存（内存和磁盘），磁盘条目超过上限时淘汰最久未访问的条目"""
+    text = json.dumps(response, ensure_ascii=False)
+    now = time.time()
+    with _cache_lock:
+        if not _settings['enabled']:
+            return
+        _remember_locked(cache_key, call_type, text, now)
+        _stats['writes'] += 1
+        try:
+            conn = _get_connection()
+            entries = _disk_entries_locked(conn)
+            exists = conn.execute('SELECT 1 FROM llm_cache WHERE cache_key = ?', (cache_key,)).fetchone() is not None
+            conn.execute(
+                'INSERT OR REPLACE INTO llm_cache (cache_key, call_type, response, created_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (cache_key, call_type, text, now, now)
+            )
+            entries += 0 if exists else 1
+            overflow = entries - _settings['disk_entries']
+            if overflow > 0:
+                entries -= conn.execute(
+                    'DELETE FROM llm_cache WHERE cache_key IN '
+                    '(SELECT cache_key FROM llm_cache ORDER BY accessed_at LIMIT ?)',
+                    (overflow,)
+                ).rowcount
+            _disk_count['entries'] = entries
+        except Exception as e:
+            _disk_count['entries'] = None
+            print(f"⚠️  LLM 缓存写入失败: {e}")
+
+
+def _disk_entries_locked(conn):
+    """返回磁盘条目数，未统计过时执行一次 COUNT(*)，调用方需持有 _cache_lock"""
+    if _disk_count['entries'] is None:
+        _disk_count['entries'] = conn.execute('SELECT COUNT(*) FROM llm_cache').fetchone()[0]
+    return _disk_count['entries']
+
+
+def _remember_locked(cache_key, call_type, text, created_at):
+    _memory[cache_key] = (call_type, text, created_at)
+    _memory.move_to_end(cache_key)
+    while len(_memory) > _settings['memory_entries']:
+        _memory.popitem(last=False)
+
+
+def prune_llm_cache():
+    """删除所有类型中已过期的磁盘条目，返回删除数量"""
+    now = time.time()
+    removed = 0
+    with _cache_lock:
+        try:
+            conn = _get_connection()
+            for call_type, ttl in _settings['ttls'].items():
+                cursor = conn.execute(
+                    'DELETE FROM llm_cache WHERE call_type = ? AND created_at < ?',
+                    (call_type, now - ttl)
+                )
+                removed += cursor.rowcount
+        except Exception as e:
+            print(f"⚠️  LLM 缓存清理失败: {e}")
+        _disk_count['entries'] = None
+    return removed
+
+
+def clear_llm_cache():
+    """清空内存和磁盘缓存，返回删除的磁盘条目数"""
+    with _cache_lock:
+        _memory.clear()
+        removed = 0
+        try:
+            removed = _get_connection().execute('DELETE FROM llm_cache').rowcount
+            _disk_count['entries'] = 0
+        except Exception as e:
+            _disk_count['entries'] = None
+            print(f"⚠️  LLM 缓存清空失败: {e}")
+    return removed
+
+
+def get_llm_cache_stats():
+    """返回缓存命中率、条目数和当前设置"""
+    with _cache_lock:
+        try:
+            disk_entries = _disk_entries_locked(_get_connection())
+        except Exception:
+            disk_entries = None
+        hits = _stats['memory_hits'] + _stats['disk_hits']
+        lookups = hits + _stats['misses']
+        return {
+            'enabled': _settings['enabled'],
+            'memory_entries': len(_memory),
+            'disk_entries': disk_entries,
+            'memory_hits': _stats['memory_hits'],
+            'disk_hits': _stats['disk_hits'],
+            'misses': _stats['misses'],
+            'writes': _stats['writes'],
+            'hit_rate': round(hits / lookups, 3) if lookups else 0.0,
+            'by_type': {call_type: dict(counters) for call_type, counters in _stats['by_type'].items()},
+            'ttls': dict(_settings['ttls']),
+            'max_memory_entries': _settings['memory_entries'],
+            'max_disk_entries': _settings['disk_entries']
+        }
@@ -0,0 +1,101 @@
+"""文章生成流水线执行器模块
+
+单篇文章的生成被拆分为若干阶段：
+    正文 → {视觉蓝图, 主题分析, 段落摘要（单次批量请求）, 引用解析}（并行）→ 图片（并行）→ 文档
+
+每类阶段按其瓶颈在独立的有界线程池中执行（LLM 接口、图片生成、普通网络、Pandoc CPU），
+不同文章的同类阶段共享同一个线程池，互不嵌套等待，避免死锁。
+"""
+
+import math
+import threading
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+
+# 全局并发数（max_concurrent_tasks）为 DEFAULT_CONCURRENT_TASKS 时各阶段线程池的大小，
+# 其他并发数下按比例缩放；config.json 中的 stage_pool_sizes 可单独指定某个阶段
+DEFAULT_CONCURRENT_TASKS = 3
+STAGE_POOL_SIZES = {
+    'llm': 6,        # Gemini 文本请求：正文、视觉蓝图、主题分析、段落摘要
+    'image': 4,      # 图片获取（ComfyUI 另有 GPU 队列信号量限流）
+    'network': 8,    # 引用链接解析等普通网络请求
+    'document': 2    # Pandoc 文档转换（CPU 密集）
+}
+
+_stage_executors = {}
+_stage_pool_sizes = dict(STAGE_POOL_SIZES)
+_stage_lock = threading.Lock()
+
+
+def compute_stage_pool_sizes(max_concurrent_tasks=DEFAULT_CONCURRENT_TASKS, overrides=None):
+    """按全局并发数等比例计算各阶段线程池大小，overrides 中指定的阶段优先"""
+    scale = max(1, int(max_concurrent_tasks)) / DEFAULT_CONCURRENT_TASKS
+    sizes = {stage: max(1, math.ceil(size * scale)) for stage, size in STAGE_POOL_SIZES.items()}
+    for stage, size in (overrides or {}).items():
+        if stage in sizes:
+            sizes[stage] = max(1, int(size))
+    return sizes
+
+
+def configure_stage_pools(max_concurrent_tasks=DEFAULT_CONCURRENT_TASKS, overrides=None):
+    """按配置调整各阶段线程池大小
+
+    ThreadPoolExecutor 不支持调整大小：大小变化的阶段改用新的线程池接收任务，
+    旧线程池执行完已提交的任务后退出。
+
+    Returns:
+        dict: 生效的各阶段线程池大小
+    """
+    sizes = compute_stage_pool_sizes(max_concurrent_tasks, overrides)
+    with _stage_lock:
+        for stage, size in sizes.items():
+            if _stage_pool_sizes.get(stage) == size:
+                continue
+            _stage_pool_sizes[stage] = size
+            old_executor = _stage_executors.pop(stage, None)
+            if old_executor is not None:
+                old_executor.shutdown(wait=False)
+        return dict(_stage_pool_sizes)
+
+
+def _get_stage_executor_locked(stage):
+    stage_executor = _stage_executors.get(stage)
+    if stage_executor is None:
+        if stage not in _stage_pool_sizes:
+            raise ValueError(f'未知的流水线阶段: {stage}')
+        stage_executor = ThreadPoolExecutor(
+            max_workers=_stage_pool_sizes[stage],
+            thread_name_prefix=f'stage-{stage}'
+        )
+        _stage_executors[stage] = stage_executor
+    return stage_executor
+
+
+def get_stage_executor(stage):
+    """获取指定阶段的线程池（按需创建）"""
+    with _stage_lock:
+        return _get_stage_executor_locked(stage)
+
+
+def submit_stage(stage, fn, *args, **kwargs):
+    """将阶段任务提交到对应线程池，返回 Future"""
+    # 持锁提交，避免线程池在取出后、提交前被 configure_stage_pools 替换并关闭
+    with _stage_lock:
+        return _get_stage_executor_locked(stage).submit(fn, *args, **kwargs)
+
+
+def run_stage(stage, fn, *args, **kwargs):
+    """在对应线程池中执行阶段任务并等待结果"""
+    return submit_stage(stage, fn, *args, **kwargs).result()
+
+
+@atexit.register
+def shutdown_stage_executors():
+    """在应用退出时关闭所有阶段线程池"""
+    with _stage_lock:
+        for stage_executor in _stage_executors.values():
+            try:
+                stage_executor.shutdown(wait=False)
+            except Exception as e:
+                print(f"关闭阶段线程池时出现错误（可忽略）: {e}")
+        _stage_executors.clear()
@@ -0,0 +1,268 @@
+"""全局文章调度器模块
+
+所有批量任务的文章生成都经由同一个调度器执行：
+- 全局并发上限（max_workers），不再为每个批次单独创建线程池
+- 批次间按优先级分层，同一优先级内轮询（round-robin），保证公平
+- 准入控制：排队主题数超过上限时拒绝新批次
+- 延迟作业：失败重试按退避时间进入延迟队列，到期后再参与调度，不占用工作线程
+- 取消：移除批次中尚未开始的作业，空出的并发名额立即让给其他批次
+- 统计每个批次的排队深度和等待时间，供任务状态接口展示
+"""
+
+import time
+import heapq
+import itertools
+import threading
+import traceback
+from collections import deque
+
+
+class SchedulerBusyError(Exception):
+    """调度队列已满，拒绝接收新的批次"""
+
+
+class _Job:
+    """调度器中的单个作业"""
+
+    def __init__(self, job_id, batch_id, fn, args, callback, key=None):
+        self.job_id = job_id
+        self.batch_id = batch_id
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.callback = callback
+        self.enqueued_at = time.time()
+
+
+class ArticleScheduler:
+    """按批次公平调度的全局作业调度器"""
+
+    def __init__(self, max_workers=3, name='article'):
+        self.name = name
+        self._cond = threading.Condition()
+        self._max_workers = max(1, int(max_workers))
+        self._thread_count = 0
+        self._running = 0
+        self._shutdown = False
+        self._job_ids = itertools.count(1)
+
+        self._queues = {}          # batch_id -> deque[_Job]
+        self._order = deque()      # 轮询顺序
+        self._priorities = {}      # batch_id -> priority（数值越大越优先）
+        self._batch_stats = {}     # batch_id -> 统计信息
+        self._delayed = []         # 延迟作业堆：(到期时间, job_id, _Job)
+
+    # --- 提交与准入 ---
+    def check_admission(self, count, max_queued):
+        """检查是否还能接收 count 个新作业，否则抛出 SchedulerBusyError"""
+        with self._cond:
+            queued = sum(len(q) for q in self._queues.values()) + len(self._delayed)
+            if max_queued and queued + count > max_queued:
+                raise SchedulerBusyError(
+                    f'当前排队主题 {queued} 个，已达上限 {max_queued}，请稍后再提交'
+                )
+
+    def submit(self, batch_id, fn, args=(), callback=None, priority=None, delay=0, key=None):
+        """提交作业；作业完成后在工作线程中调用 callback(result, error)
+
+        delay 大于 0 时作业先进入延迟队列，到期后才参与调度；
+        key 用于在取消时识别作业（例如主题）。
+        """
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError('调度器已关闭')
+            job = _Job(next(self._job_ids), batch_id, fn, args, callback, key)
+
+            if priority is not None or batch_id not in self._priorities:
+                self._priorities[batch_id] = int(priority or 0)
+
+            if delay and delay > 0:
+                heapq.heappush(self._delayed, (time.time() + delay, job.job_id, job))
+            else:
+                self._enqueue_locked(job)
+
+            self._ensure_workers_locked()
+            self._cond.notify()
+            return job.job_id
+
+    def _enqueue_locked(self, job):
+        batch_id = job.batch_id
+        if batch_id not in self._queues:
+            self._queues[batch_id] = deque()
+            self._order.append(batch_id)
+        job.enqueued_at = time.time()
+        self._queues[batch_id].append(job)
+
+    def _promote_delayed_locked(self):
+        """将已到期的延迟作业移入就绪队列，返回下一个延迟作业的剩余等待时间"""
+        now = time.time()
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, job = heapq.heappop(self._delayed)
+            self._enqueue_locked(job)
+        if self._delayed:
+            return max(0.0, self._delayed[0][0] - now)
+        return None
+
+    def _ensure_workers_locked(self):
+        """按需启动工作线程，线程数不超过 max_workers"""
+        queued = sum(len(q) for q in self._queues.values())
+        if self._delayed and queued == 0:
+            # 至少保留一个线程负责唤醒到期的延迟作业
+            queued = 1
+        idle = self._thread_count - self._running
+        while self._thread_count < self._max_workers and queued > idle:
+            self._thread_count += 1
+            idle += 1
+            threading.Thread(
+                target=self._worker_loop,
+                name=f'{self.name}-worker-{self._thread_count}',
+                daemon=True
+            ).start()
+
+    # --- 调度 ---
+    def _next_job_locked(self):
+        """选择下一个作业：最高优先级的批次之间轮询"""
+        candidates = [batch_id for batch_id in self._order if self._queues.get(batch_id)]
+        if not candidates:
+            return None
+        top_priority = max(self._priorities.get(batch_id, 0) for batch_id in candidates)
+
+        for _ in range(len(self._order)):
+            batch_id = self._order[0]
+            self._order.rotate(-1)
+            queue = self._queues.get(batch_id)
+            if queue and self._priorities.get(batch_id, 0) == top_priority:
+                job = queue.popleft()
+                if not queue:
+                    del self._queues[batch_id]
+                    self._order.remove(batch_id)
+                return job
+        return None
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._shutdown or self._thread_count > self._max_workers:
+                        self._thread_count -= 1
+                        self._cond.notify_all()
+                        return
+                    next_due = self._promote_delayed_locked()
+                    job = self._next_job_locked()
+                    if job is not None:
+                        break
+                    self._cond.wait(next_due)
+
+                wait_seconds = time.time() - job.enqueued_at
+                self._running += 1
+                stats = self._batch_stats.setdefault(job.batch_id, {
+                    'running': 0, 'started': 0, 'total_wait': 0.0, 'max_wait': 0.0
+                })
+                stats['running'] += 1
+                stats['started'] += 1
+                stats['total_wait'] += wait_seconds
+                stats['max_wait'] = max(stats['max_wait'], wait_seconds)
+
+            result, error = None, None
+            try:
+                result = job.fn(*job.args)
+            except Exception as e:
+                error = e
+
+            with self._cond:
+                self._running -= 1
+                stats['running'] -= 1
+
+            if job.callback:
+                try:
+                    job.callback(result, error)
+                except Exception as e:
+                    print(f"⚠️  调度器回调执行出错: {e}")
+                    traceback.print_exc()
+
+    def cancel(self, batch_id, keys=None, error=None):
+        """移除批次中尚未开始的作业（含延迟队列），并以 error 调用其回调
+
+        Args:
+            keys: 只移除 key 在其中的作业；为 None 时移除批次的全部作业
+            error: 传给回调的异常
+
+        Returns:
+            int: 被移除的作业数
+        """
+        def matches(job):
+            return job.batch_id == batch_id and (keys is None or job.key in keys)
+
+        with self._cond:
+            removed = []
+            queue = self._queues.get(batch_id)
+            if queue:
+                kept = deque(job for job in queue if not matches(job))
+                removed.extend(job for job in queue if matches(job))
+                if kept:
+                    self._queues[batch_id] = kept
+                else:
+                    del self._queues[batch_id]
+                    self._order.remove(batch_id)
+
+            delayed = [entry for entry in self._delayed if not matches(entry[2])]
+            if len(delayed) != len(self._delayed):
+                removed.extend(entry[2] for entry in self._delayed if matches(entry[2]))
+                heapq.heapify(delayed)
+                self._delayed = delayed
+            self._cond.notify_all()
+
+        for job in removed:
+            if job.callback:
+                try:
+                    job.callback(None, error)
+                except Exception as e:
+                    print(f"⚠️  调度器回调执行出错: {e}")
+                    traceback.print_exc()
+        return len(removed)
+
+    # --- 统计 ---
+    def get_batch_stats(self, batch_id):
+        """返回批次的排队情况：排队数、运行数、等待时间等"""
+        with self._cond:
+            queue = self._queues.get(batch_id) or ()
+            delayed = [job for _, _, job in self._delayed if job.batch_id == batch_id]
+            stats = self._batch_stats.get(batch_id, {})
+            started = stats.get('started', 0)
+            now = time.time()
+            return {
+                'queued': len(queue),
+                'retry_waiting': len(delayed),
+                'running': stats.get('running', 0),
+                'priority': self._priorities.get(batch_id, 0),
+                'avg_wait_seconds': round(stats.get('total_wait', 0.0) / started, 2) if started else 0.0,
+                'max_wait_seconds': round(stats.get('max_wait', 0.0), 2),
+                'oldest_wait_seconds': round(now - queue[0].enqueued_at, 2) if queue else 0.0,
+                'global_queued': sum(len(q) for q in self._queues.values()),
+                'global_running': self._running,
+                'max_workers': self._max_workers
+            }
+
+    def forget_batch(self, batch_id):
+        """清除已结束批次的统计信息"""
+        with self._cond:
+            if batch_id not in self._queues and not any(job.batch_id == batch_id for _, _, job in self._delayed):
+                self._batch_stats.pop(batch_id, None)
+                self._priorities.pop(batch_id, None)
+
+    # --- 生命周期 ---
+    def set_max_workers(self, max_workers):
+        """调整全局并发上限，立即对新作业生效，不等待运行中的作业"""
+        with self._cond:
+            self._max_workers = max(1, int(max_workers))
+            self._ensure_workers_locked()
+            self._cond.notify_all()
+
+    def shutdown(self):
+        """停止调度，丢弃尚未开始的作业"""
+        with self._cond:
+            self._shutdown = True
+            self._queues.clear()
+            self._order.clear()
+            self._delayed.clear()
+            self._cond.notify_all()
@@ -0,0 +1,79 @@
+"""任务事件推送模块
+
+任务引擎在主题开始、阶段切换、完成、失败等时刻发布增量事件，
+SSE 接口订阅后只推送这些变化，客户端无需反复拉取完整的任务状态。
+每个任务保留最近的事件，断线重连时按 Last-Event-ID 补发。
+"""
+
+import queue
+import threading
+from collections import deque
+
+# 每个任务保留的最近事件数（用于断线重连补发）
+EVENT_HISTORY_SIZE = 500
+
+_events_lock = threading.Lock()
+_subscribers = {}     # task_id -> set[queue.Queue]
+_history = {}         # task_id -> deque[(event_id, event, data)]
+_last_event_ids = {}  # task_id -> 最近一次事件编号
+
+
+def publish_task_event(task_id, event, data):
+    """发布任务事件，推送给该任务的所有订阅者"""
+    with _events_lock:
+        event_id = _last_event_ids.get(task_id, 0) + 1
+        _last_event_ids[task_id] = event_id
+        item = (event_id, event, data)
+        _history.setdefault(task_id, deque(maxlen=EVENT_HISTORY_SIZE)).append(item)
+        subscribers = list(_subscribers.get(task_id, ()))
+    for subscriber in subscribers:
+        subscriber.put(item)
+
+
+def subscribe_task_events(task_id, last_event_id=None):
+    """订阅任务事件
+
+    Returns:
+        tuple: (事件队列, 需补发的事件列表)。未提供 last_event_id 或历史已不完整时，
+               补发列表为 None，调用方应先发送一次完整快照。
+    """
+    subscriber = queue.Queue()
+    with _events_lock:
+        _subscribers.setdefault(task_id, set()).add(subscriber)
+        backlog = None
+        if last_event_id is not None:
+            history = _history.get(task_id) or ()
+            current_id = _last_event_ids.get(task_id, 0)
+            oldest_id = history[0][0] if history else current_id + 1
+            # 只有历史覆盖了断线期间的全部事件时才补发
+            if last_event_id <= current_id and oldest_id <= last_event_id + 1:
+                backlog = [item for item in history if item[0] > last_event_id]
+    return subscriber, backlog
+
+
+def unsubscribe_task_events(task_id, subscriber):
+    """取消订阅"""
+    with _events_lock:
+        subscribers = _subscribers.get(task_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                _subscribers.pop(task_id, None)
+
+
+def get_last_event_id(task_id):
+    """返回任务最近一次事件的编号"""
+    with _events_lock:
+        return _last_event_ids.get(task_id, 0)
+
+
+def clear_task_events(task_id, reset=False):
+    """清除任务的事件历史
+
+    默认保留事件编号，避免任务重新运行时编号倒退；任务被淘汰出内存时
+    传入 reset=True 一并清除编号（重连的客户端会收到完整快照）。
+    """
+    with _events_lock:
+        _history.pop(task_id, None)
+        if reset:
+            _last_event_ids.pop(task_id, None)
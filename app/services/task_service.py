@@ -3,16 +3,20 @@
 import threading
 import requests
 import os
+import time
 import uuid
+import sys
 import random
+import json
+import hashlib
 import atexit
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import wait
 
 from app.config import ALLOWED_EXTENSIONS
 from app.config.loader import load_config, get_comfyui_settings, get_gemini_image_settings
 from app.utils.parsers import extract_article_title, derive_keyword_from_blueprint
-from app.services.gemini_service import generate_article_with_gemini, generate_visual_blueprint, build_visual_prompts, summarize_paragraph_for_image, format_article_with_citations
+from app.services.gemini_service import generate_article_with_gemini, generate_visual_blueprint, generate_image_plan, build_visual_prompts, summarize_paragraphs_for_images, format_article_with_citations, CITATION_DEADLINE_SECONDS
 from app.services.document_service import extract_paragraph_structures, compute_image_slots, create_word_document
 from app.services.comfyui_service import generate_image_with_comfyui
 from app.services.gemini_image_service import generate_image_with_gemini, analyze_topic_for_image_generation
@@ -20,30 +24,70 @@ from app.services.image_service import (
     fetch_unsplash_image_urls, fetch_pexels_image_urls, fetch_pixabay_image_urls,
     get_local_image_paths, _download_and_save_image
 )
+from app.services import task_store
+from app.services.pipeline import submit_stage, run_stage, configure_stage_pools
+from app.services.scheduler import ArticleScheduler
+from app.services.task_events import publish_task_event, clear_task_events
+from app.utils.concurrency import CancellationToken, TaskCancelledError
 
 # --- 全局变量 ---
 generation_tasks = {}
 task_lock = threading.Lock()
-executor = ThreadPoolExecutor(max_workers=3)
+# 全局文章调度器：所有批次共享同一并发上限，批次间公平轮询
+scheduler = ArticleScheduler(max_workers=3)
+# 正在执行的批次：task_id -> {'active': 未结束的主题, 'submitted': 本轮提交过的主题}
+_active_batches = {}
+
+# 主题的阶段状态：(task_id, topic) -> state，失败重试时从失败的阶段继续
+_topic_states = {}
+# 主题的取消令牌：(task_id, topic) -> CancellationToken
+_cancel_tokens = {}
+
+# 排队主题数上限（准入控制）
+DEFAULT_MAX_QUEUED_TOPICS = 500
+# 自动重试的退避时间（秒）：base * 2^(n-1)，不超过 max，并叠加随机抖动
+DEFAULT_RETRY_BACKOFF_BASE = 5
+DEFAULT_RETRY_BACKOFF_MAX = 300
+# 已完成任务在内存中的保留策略：超过保留时间或超过数量上限时，按最近访问时间淘汰
+# （淘汰后记录仍在 tasks.db 中，查询和重试会从存储中读取）
+DEFAULT_TASK_RETENTION_SECONDS = 6 * 3600
+DEFAULT_MAX_TASKS_IN_MEMORY = 50
+_retention = {
+    'ttl_seconds': DEFAULT_TASK_RETENTION_SECONDS,
+    'max_tasks': DEFAULT_MAX_TASKS_IN_MEMORY,
+    'evicted_total': 0
+}
+# 流式生成正文时，每新增多少字符推送一次进度；预览保留正文末尾的字符数
+ARTICLE_PROGRESS_STEP_CHARS = 200
+ARTICLE_PREVIEW_CHARS = 120
+# 下游阶段只读取正文前若干字：正文流式生成到这个长度后即可提前开始
+ANALYSIS_PREFIX_CHARS = 500     # analyze_topic_for_image_generation 读取前 500 字
+BLUEPRINT_PREFIX_CHARS = 2000   # generate_visual_blueprint 读取前 2000 字
+# 蓝图需要完整的 2000 字前缀才能保证结果不变，因此不足 2000 字的文章（默认篇幅 800~1200 字）
+# 没有蓝图预取，只预取主题分析；蓝图在正文生成完成、进入图片阶段时立即提交
+# 阶段检查点保留时间（秒）
+CHECKPOINT_MAX_AGE = 7 * 24 * 3600
+# 影响生成产出的配置项；任一项变化后旧检查点不再复用
+_CHECKPOINT_CONFIG_KEYS = (
+    'gemini_base_url', 'default_model', 'default_prompt', 'temperature', 'top_p',
+    'enable_google_search', 'append_citations', 'enable_image', 'comfyui_image_count',
+    'comfyui_summary_model', 'image_planning_model', 'comfyui_positive_style', 'comfyui_negative_style',
+    'comfyui_style_template', 'image_source_priority'
+)
 
 @atexit.register
 def shutdown_executor():
-    """在应用退出时安全关闭线程池"""
-    global executor
-    if executor:
-        try:
-            print("正在关闭后台任务线程池...")
-            # 使用 wait=False 避免在关闭时阻塞过久
-            executor.shutdown(wait=False)
-            print("线程池已关闭。")
-        except Exception as e:
-            print(f"关闭线程池时出现错误（可忽略）: {e}")
-        finally:
-            executor = None
+    """在应用退出时安全关闭调度器"""
+    try:
+        print("正在关闭后台任务调度器...")
+        scheduler.shutdown()
+        print("调度器已关闭。")
+    except Exception as e:
+        print(f"关闭调度器时出现错误（可忽略）: {e}")
 
 class ImageProvider:
     """为单篇文章管理图片获取，确保图片唯一性"""
-    def __init__(self, keyword, config, topic, visual_prompts, blueprint, topic_analysis=None):
+    def __init__(self, keyword, config, topic, visual_prompts, blueprint, topic_analysis=None, cancel_token=None):
         self.keyword = keyword
         self.config = config
         self.topic = topic
@@ -56,6 +100,8 @@ class ImageProvider:
         self.tags = keyword.lower().split() if keyword else []
         self.candidates = {}  # 按需获取，缓存已获取的候选
         self.used_candidates = set()  # 记录已使用的图片，避免重复
+        self._candidates_lock = threading.Lock()  # 多张图片并行获取时保护候选列表
+        self.cancel_token = cancel_token  # 取消后不再尝试后续图片源
 
     def _fetch_candidates_for_source(self, source):
         """按需获取指定源的候选图片"""
@@ -119,6 +165,8 @@ class ImageProvider:
             self._priority_logged = True
 
         for source in self.priority:
+            if self.cancel_token is not None:
+                self.cancel_token.raise_if_cancelled()
             try:
                 # Gemini 图片生成
                 if source == 'gemini_image':
@@ -157,7 +205,7 @@ class ImageProvider:
                         'timeout': self.gemini_image_settings.get('timeout', 30),
                         'topic_analysis': self.topic_analysis  # 传递主题分析结果
                     }
-                    image_path, metadata = generate_image_with_gemini(prompt=prompt, **gemini_params)
+                    image_path, metadata = generate_image_with_gemini(prompt=prompt, cancel_token=self.cancel_token, **gemini_params)
                     if image_path:
                         print(f"✓ 使用 Gemini 生成图片成功")
                         return image_path, 'gemini_image', metadata
@@ -185,7 +233,7 @@ class ImageProvider:
 
                     # 所有条件满足，尝试生成
                     print(f"→ 尝试使用 ComfyUI 生成图片...")
-                    image_path, metadata = generate_image_with_comfyui(self.topic, custom_prompts, self.blueprint, self.config, self.comfy_settings)
+                    image_path, metadata = generate_image_with_comfyui(self.topic, custom_prompts, self.blueprint, self.config, self.comfy_settings, cancel_token=self.cancel_token)
                     if image_path:
                         print(f"✓ 使用 ComfyUI 生成图片成功")
                         return image_path, 'comfyui', metadata
@@ -207,28 +255,35 @@ class ImageProvider:
                     }
 
                     # 按需获取候选图片
-                    candidates = self._fetch_candidates_for_source(source)
+                    with self._candidates_lock:
+                        candidates = self._fetch_candidates_for_source(source)
 
                     if not candidates:
                         print(f"  ✗ {source_name_map.get(source, source)} 无可用图片，跳过")
                         continue
 
                     # 从候选中选择一张未使用的图片
-                    while candidates:
-                        candidate = candidates.pop(0)
-                        if candidate not in self.used_candidates:
+                    while True:
+                        with self._candidates_lock:
+                            if not candidates:
+                                break
+                            candidate = candidates.pop(0)
+                            if candidate in self.used_candidates:
+                                continue
                             self.used_candidates.add(candidate)
-                            if source == 'local':
+                        if source == 'local':
+                            print(f"  ✓ 使用 {source_name_map.get(source, source)} 图片")
+                            return candidate, 'local', {}
+                        else:
+                            image_path = _download_and_save_image(candidate)
+                            if image_path:
                                 print(f"  ✓ 使用 {source_name_map.get(source, source)} 图片")
-                                return candidate, 'local', {}
-                            else:
-                                image_path = _download_and_save_image(candidate)
-                                if image_path:
-                                    print(f"  ✓ 使用 {source_name_map.get(source, source)} 图片")
-                                    return image_path, source, {}
+                                return image_path, source, {}
 
                     # 如果所有候选都已使用
                     print(f"  ✗ {source_name_map.get(source, source)} 的图片已全部使用，跳过")
+            except TaskCancelledError:
+                raise
             except Exception as e:
                 source_name = source_names.get(source, source)
                 print(f"✗ {source_name} 发生异常: {e}")
@@ -240,29 +295,376 @@ class ImageProvider:
         print(f"   已尝试的顺序: {' > '.join([source_names.get(s, s) for s in self.priority])}\n")
         return None, 'none', {}
 
-def update_executor_workers(max_workers=3):
-    """更新线程池的工作线程数"""
-    global executor
-    if executor:
-        executor.shutdown(wait=True)
-    executor = ThreadPoolExecutor(max_workers=max_workers)
-    print(f"线程池已更新，最大并发数: {max_workers}")
+def update_executor_workers(max_workers=3, stage_pool_sizes=None):
+    """更新全局调度器的最大并发数，并按同一并发数调整各阶段线程池大小"""
+    scheduler.set_max_workers(max_workers)
+    sizes = configure_stage_pools(max_workers, stage_pool_sizes)
+    print(f"调度器已更新，全局最大并发数: {max_workers}，阶段线程池: {sizes}")
+
+def update_task_retention(config):
+    """更新已完成任务的内存保留策略，并立即按新策略淘汰"""
+    with task_lock:
+        _retention['ttl_seconds'] = max(0, int(config.get('task_retention_seconds', DEFAULT_TASK_RETENTION_SECONDS)))
+        _retention['max_tasks'] = max(1, int(config.get('max_tasks_in_memory', DEFAULT_MAX_TASKS_IN_MEMORY)))
+    _evict_finished_tasks()
+
+def _evict_finished_tasks():
+    """淘汰过期或超出数量上限的已完成任务（最久未访问的优先）"""
+    now = time.time()
+    evicted = []
+    with task_lock:
+        finished = [
+            (task_id, task) for task_id, task in generation_tasks.items()
+            if task.get('status') == 'completed' and task_id not in _active_batches
+        ]
+        finished.sort(key=lambda item: item[1].get('_last_access', 0))
+        excess = len(generation_tasks) - _retention['max_tasks']
+        for task_id, task in finished:
+            expired = now - task.get('_last_access', 0) > _retention['ttl_seconds']
+            if not expired and excess <= 0:
+                break
+            del generation_tasks[task_id]
+            evicted.append(task_id)
+            excess -= 1
+        _retention['evicted_total'] += len(evicted)
+
+    for task_id in evicted:
+        clear_task_events(task_id, reset=True)
+    if evicted:
+        print(f"🧹 已从内存中淘汰 {len(evicted)} 个已完成任务（记录仍保存在 tasks.db）")
+    return evicted
+
+def _deep_sizeof(obj, seen=None):
+    """粗略估算对象及其内容占用的内存（字节）"""
+    seen = seen if seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_sizeof(k, seen) + _deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(_deep_sizeof(item, seen) for item in obj)
+    return size
+
+def get_task_memory_report(top=5):
+    """统计内存中任务记录的数量与占用，供管理接口展示"""
+    with task_lock:
+        sizes = [
+            {
+                'task_id': task_id,
+                'status': task.get('status'),
+                'results': len(task.get('results', [])),
+                'errors': len(task.get('errors', [])),
+                'bytes': _deep_sizeof(task),
+                'idle_seconds': round(time.time() - task.get('_last_access', time.time()), 1)
+            }
+            for task_id, task in generation_tasks.items()
+        ]
+        topic_state_bytes = _deep_sizeof(_topic_states)
+        report = {
+            'tasks_in_memory': len(sizes),
+            'running': sum(1 for item in sizes if item['status'] != 'completed'),
+            'completed': sum(1 for item in sizes if item['status'] == 'completed'),
+            'task_bytes': sum(item['bytes'] for item in sizes),
+            'topic_states': len(_topic_states),
+            'topic_state_bytes': topic_state_bytes,
+            'retention': dict(_retention)
+        }
+    report['largest'] = sorted(sizes, key=lambda item: item['bytes'], reverse=True)[:top]
+    return report
+
+def _build_visual_plan(topic, article, api_key, base_url, model_name):
+    """视觉蓝图阶段：生成蓝图、提示词和备用图片源关键词"""
+    try:
+        visual_blueprint = generate_visual_blueprint(topic, article, api_key, base_url, model_name)
+        visual_prompts = build_visual_prompts(visual_blueprint)
+        image_keyword = derive_keyword_from_blueprint(visual_blueprint)
+        return visual_blueprint, visual_prompts, image_keyword
+    except Exception:
+        return None, None, ''
+
+def _analysis_model(config):
+    """主题分析使用的模型：配置中的摘要模型"""
+    return config.get('comfyui_summary_model', 'gemini-2.0-flash-exp')
+
+def _image_planning_model(config):
+    """合并的图片规划请求使用的模型
+
+    默认与单独的主题分析相同（摘要模型），开启合并请求不会改变分析所用的模型和费用；
+    可通过 image_planning_model 单独指定。
+    """
+    return config.get('image_planning_model') or _analysis_model(config)
+
+def _plan_images(topic, article, config):
+    """图片规划阶段：一次请求同时生成视觉蓝图和主题分析
+
+    Returns:
+        dict: {'visual_plan': ..., 'topic_analysis': ...}；请求失败时返回 None，由调用方分别请求
+    """
+    try:
+        plan = generate_image_plan(
+            topic,
+            article,
+            config.get('gemini_api_key', ''),
+            config.get('gemini_base_url', 'https://generativelanguage.googleapis.com'),
+            _image_planning_model(config)
+        )
+        blueprint = plan['blueprint']
+        print(f"✓ 图片规划完成（视觉蓝图 + 主题分析）")
+        return {
+            'visual_plan': {
+                'blueprint': blueprint,
+                'prompts': build_visual_prompts(blueprint),
+                'keyword': derive_keyword_from_blueprint(blueprint)
+            },
+            'topic_analysis': plan['analysis']
+        }
+    except Exception as e:
+        print(f"⚠️  合并的图片规划请求失败，改为分别请求视觉蓝图和主题分析: {e}")
+        return None
+
+def _analyze_topic(topic, article, config):
+    """主题分析阶段：智能推荐人物种族和图片风格"""
+    try:
+        # 使用配置中的摘要模型
+        analysis_model = _analysis_model(config)
+
+        print(f"\n🔍 智能主题分析...")
+        print(f"   主题: {topic}")
+        print(f"   使用模型: {analysis_model}")
+        topic_analysis = analyze_topic_for_image_generation(
+            topic,
+            article,
+            config.get('gemini_api_key', ''),
+            config.get('gemini_base_url', 'https://generativelanguage.googleapis.com'),
+            analysis_model
+        )
+        if topic_analysis:
+            print(f"✓ 主题分析成功")
+        else:
+            print(f"⚠️  主题分析返回None，使用默认参数")
+        return topic_analysis
+    except Exception as e:
+        print(f"⚠️  主题分析失败，使用默认参数")
+        print(f"   错误详情: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+def _prepare_images(topic, article, paragraphs, image_slots, config, user_uploaded_images=None, state=None, cancel_token=None, prefetched=None):
+    """图片阶段：并行执行视觉规划，再并行获取每张图片
+
+    已完成的视觉规划、主题分析、段落摘要和单张图片会记录在 state 中，
+    重试时直接复用，只补齐缺失的部分。视觉蓝图和主题分析都需要时，默认
+    合并为一次图片规划请求（fuse_image_planning），失败后再分别请求。
+    prefetched 中是正文流式生成期间已提前提交的 'visual_plan' / 'topic_analysis'
+    Future，直接等待其结果；其中任一项已提前提交时不再发起合并请求。
+
+    Returns:
+        tuple: (image_list, images_metadata)
+    """
+    state = state if state is not None else {}
+    prefetched = prefetched or {}
+    gemini_api_key = config.get('gemini_api_key', '')
+    gemini_base_url = config.get('gemini_base_url', 'https://generativelanguage.googleapis.com')
+    model_name = config.get('default_model') or 'gemini-pro'
+    target_image_count = config.get('comfyui_image_count', 1)
+
+    image_list, images_metadata = [], []
 
-def execute_single_article_generation(topic, config, user_uploaded_images=None):
+    print(f"\n🖼️  准备生成 {target_image_count} 张图片...")
+    user_image_count = len(user_uploaded_images) if user_uploaded_images else 0
+    need_generate_count = target_image_count - user_image_count
+
+    for i, user_img in enumerate(user_uploaded_images or []):
+        if i < len(image_slots):
+            image_list.append({
+                'path': user_img.get('path'),
+                'summary': user_img.get('summary', '配图'),
+                'insert_line': image_slots[i],  # 使用行号而不是段落索引
+                'source': 'user_uploaded',
+                'order': i
+            })
+            images_metadata.append({'source': 'user_uploaded', 'path': user_img.get('path'), 'order': i})
+
+    if need_generate_count <= 0:
+        return image_list, images_metadata
+
+    # 已完成的单张图片和段落摘要（键为图片序号字符串，便于序列化）
+    image_results = state.setdefault('image_results', {})
+    summaries = state.setdefault('summaries', {})
+    pending_indexes = [i for i in range(user_image_count, target_image_count) if str(i) not in image_results]
+
+    # --- 阶段 2：视觉蓝图、主题分析、段落摘要并行执行 ---
+    need_visual_plan = 'visual_plan' not in state and bool(pending_indexes)
+    need_analysis = False
+    gemini_image_settings = get_gemini_image_settings(config)
+    if not gemini_image_settings.get('auto_detect_topic', True):  # 默认启用
+        print(f"\n💡 智能主题检测已关闭，使用手动配置")
+    else:
+        need_analysis = 'topic_analysis' not in state and bool(pending_indexes)
+
+    # 两者都需要时合并为一次图片规划请求
+    plan_future = None
+    if (need_visual_plan and need_analysis
+            and 'visual_plan' not in prefetched and 'topic_analysis' not in prefetched
+            and config.get('fuse_image_planning', True)):
+        plan_future = submit_stage('llm', _plan_images, topic, article, config)
+
+    # 第一张图使用全文主题，其余使用段落主题；所有段落摘要合并为一次请求
+    summary_indexes = []
+    for i in pending_indexes:
+        if i == user_image_count or str(i) in summaries:
+            continue
+        slot_index = image_slots[i] if i < len(image_slots) else None
+        if slot_index is not None and slot_index < len(paragraphs):
+            summary_indexes.append(i)
+    summary_future = None
+    if summary_indexes:
+        summary_texts = [paragraphs[image_slots[i]]['text'] for i in summary_indexes]
+        summary_future = submit_stage('llm', summarize_paragraphs_for_images, summary_texts, topic, config)
+
+    if plan_future is not None:
+        image_plan = plan_future.result()
+        if image_plan is not None:
+            state.update(image_plan)
+
+    blueprint_future = None
+    if need_visual_plan and 'visual_plan' not in state:
+        blueprint_future = prefetched.get('visual_plan') or submit_stage('llm', _build_visual_plan, topic, article, gemini_api_key, gemini_base_url, model_name)
+    analysis_future = None
+    if need_analysis and 'topic_analysis' not in state:
+        analysis_future = prefetched.get('topic_analysis') or submit_stage('llm', _analyze_topic, topic, article, config)
+
+    if blueprint_future is not None:
+        visual_blueprint, visual_prompts, image_keyword = blueprint_future.result()
+        state['visual_plan'] = {'blueprint': visual_blueprint, 'prompts': visual_prompts, 'keyword': image_keyword}
+    if analysis_future is not None:
+        state['topic_analysis'] = analysis_future.result()
+
+    visual_plan = state.get('visual_plan') or {}
+    visual_blueprint = visual_plan.get('blueprint')
+    visual_prompts = visual_plan.get('prompts')
+    image_keyword = visual_plan.get('keyword', '')
+    topic_analysis = state.get('topic_analysis')
+
+    # --- 阶段 3：图片并行获取 ---
+    image_provider = ImageProvider(image_keyword, config, topic, visual_prompts, visual_blueprint, topic_analysis, cancel_token)
+    negative_prompt = visual_prompts.get('negative_prompt', 'lowres, blurry, watermark') if visual_prompts else 'lowres, blurry, watermark'
+
+    def fetch_image(i):
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        print(f"\n  [{i+1}/{target_image_count}] 获取图片...")
+        is_first_image = (i == user_image_count)
+        if is_first_image:
+            # 第一张图：使用全文主题
+            para_summary = f"visual representation of {topic}"
+            print(f"  📰 第一张图使用全文主题")
+            # 第一张图增强：添加高质量、电影感、专业摄影等关键词
+            enhanced_prompt = (
+                f"stunning masterpiece, award-winning photography, cinematic lighting, "
+                f"ultra detailed, 8k uhd, professional camera, dramatic composition, "
+                f"{para_summary}, "
+                f"high dynamic range, sharp focus, perfect exposure, magazine cover quality"
+            )
+            print(f"  🌟 使用增强质量提示词")
+        else:
+            # 其余图片：使用段落主题
+            para_summary = f"visual representation of {topic}"
+            if i in summary_indexes:
+                para_summary = summary_future.result()[summary_indexes.index(i)]
+                summaries[str(i)] = para_summary
+                print(f"  📄 使用段落主题")
+            elif str(i) in summaries:
+                para_summary = summaries[str(i)]
+                print(f"  📄 使用段落主题")
+            enhanced_prompt = para_summary
+
+        custom_prompts = {
+            'positive_prompt': enhanced_prompt,
+            'negative_prompt': negative_prompt,
+            'is_first_image': is_first_image  # 标记是否第一张图
+        }
+        image_path, image_source, image_metadata = image_provider.get_image(custom_prompts)
+        image_results[str(i)] = {'summary': para_summary, 'path': image_path, 'source': image_source, 'metadata': image_metadata}
+
+    image_futures = [submit_stage('image', fetch_image, i) for i in pending_indexes]
+    # 等待全部图片结束后再抛出异常，确保成功的图片都记录进检查点
+    wait(image_futures)
+    for future in image_futures:
+        future.result()
+
+    if len(pending_indexes) < need_generate_count:
+        print(f"♻️  复用此前已获取的 {need_generate_count - len(pending_indexes)} 张图片")
+
+    for i in range(user_image_count, target_image_count):
+        entry = image_results.get(str(i)) or {}
+        image_path = entry.get('path')
+        if image_path:
+            para_summary = entry.get('summary')
+            image_source = entry.get('source')
+            # 获取对应的插入行号
+            insert_line = image_slots[i] if i < len(image_slots) else None
+            image_list.append({
+                'path': image_path,
+                'summary': para_summary,
+                'insert_line': insert_line,  # 使用行号而不是段落索引
+                'source': image_source,
+                'order': i
+            })
+            images_metadata.append({
+                'source': image_source,
+                'path': image_path,
+                'summary': para_summary,
+                'insert_line': insert_line,
+                'order': i,
+                'metadata': entry.get('metadata')
+            })
+            print(f"  ✓ 图片 {i+1} 获取成功（插入位置: 第{insert_line}行后）")
+
+    return image_list, images_metadata
+
+def execute_single_article_generation(topic, config, user_uploaded_images=None, state=None, checkpoint=None, on_stage=None, cancel_token=None, on_progress=None):
     """
     生成单篇文章
 
+    各阶段通过 pipeline 模块在独立的有界线程池中执行：
+    正文 → {视觉蓝图, 主题分析, 段落摘要, 引用解析} 并行 → 图片并行 → 文档
+
     Args:
         topic: 文章主题
         config: 配置信息
         user_uploaded_images: 用户上传的图片列表
+        state: 阶段状态字典（可选）。每个阶段完成后把产出写入其中，
+               'stage' 记录当前所处阶段；失败后用同一字典重试时，
+               已完成的阶段会被跳过，从失败的阶段继续执行。
+        checkpoint: 每个阶段完成后调用的回调（可选），用于持久化 state
+        on_stage: 进入新阶段时调用的回调 on_stage(stage)（可选），用于推送进度
+        cancel_token: 取消令牌（可选），在阶段之间、图片获取和轮询中检查，
+                      取消时抛出 TaskCancelledError
+        on_progress: 正文流式生成时的进度回调 on_progress(info)（可选），
+                     info 包含 chars、prompt_tokens、output_tokens、preview
 
     Returns:
         dict: 生成结果
     """
+    state = state if state is not None else {}
+    resuming = bool(state.get('stage'))
+
+    def enter_stage(stage):
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        state['stage'] = stage
+        if on_stage:
+            on_stage(stage)
+
     print(f"\n{'='*60}")
     print(f"📝 开始生成文章")
     print(f"   主题: {topic}")
+    if resuming:
+        print(f"   从失败的阶段继续: {state.get('stage')}")
     print(f"{'='*60}\n")
 
     gemini_api_key = config.get('gemini_api_key', '')
@@ -275,10 +677,52 @@ def execute_single_article_generation(topic, config, user_uploaded_images=None):
     enable_image = config.get('enable_image', True)
     target_image_count = config.get('comfyui_image_count', 1)
     enable_search = config.get('enable_google_search', True)  # 默认启用搜索
-
-    print(f"📄 生成文章内容...")
-    print(f"   使用参数: Temperature={temperature}, Top-P={top_p}, 启用搜索={enable_search}")
-    article, grounding_sources = generate_article_with_gemini(topic, gemini_api_key, gemini_base_url, model_name, custom_prompt, temperature, top_p, enable_search)
+    stream_article = config.get('stream_article', True)  # 默认流式生成正文
+    cache_article = config.get('cache_article_responses', False)  # 正文缓存需显式开启
+
+    # 正文流式生成期间提前提交的下游阶段（视觉蓝图、主题分析）
+    prefetched = {}
+    need_images = enable_image and target_image_count > len(user_uploaded_images or [])
+    prefetch_analysis = need_images and get_gemini_image_settings(config).get('auto_detect_topic', True)
+    progress = {'reported': 0, 'info': None}
+
+    def on_chunk(text, article_so_far, usage):
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        # 下游阶段只读取正文前缀，前缀写完即可开始，结果与等全文生成后一致。
+        # 流式生成时主题分析总是在 500 字时单独提前提交（不等合并的图片规划），
+        # 视觉蓝图随后单独请求；合并请求只用于非流式生成
+        if prefetch_analysis and 'topic_analysis' not in prefetched and len(article_so_far) >= ANALYSIS_PREFIX_CHARS:
+            print(f"⚡ 正文已生成 {len(article_so_far)} 字，提前开始主题分析")
+            prefetched['topic_analysis'] = submit_stage('llm', _analyze_topic, topic, article_so_far[:ANALYSIS_PREFIX_CHARS], config)
+        if need_images and 'visual_plan' not in prefetched and len(article_so_far) >= BLUEPRINT_PREFIX_CHARS:
+            print(f"⚡ 正文已生成 {len(article_so_far)} 字，提前开始视觉蓝图")
+            prefetched['visual_plan'] = submit_stage('llm', _build_visual_plan, topic, article_so_far[:BLUEPRINT_PREFIX_CHARS], gemini_api_key, gemini_base_url, model_name)
+
+        progress['info'] = {
+            'chars': len(article_so_far),
+            'prompt_tokens': usage.get('promptTokenCount', 0),
+            'output_tokens': usage.get('candidatesTokenCount', 0),
+            'preview': article_so_far[-ARTICLE_PREVIEW_CHARS:]
+        }
+        if on_progress and len(article_so_far) - progress['reported'] >= ARTICLE_PROGRESS_STEP_CHARS:
+            progress['reported'] = len(article_so_far)
+            on_progress(progress['info'])
+
+    # --- 阶段 1：文章正文 ---
+    if 'article' in state:
+        article, grounding_sources = state['article'], state.get('grounding_sources') or []
+        print(f"♻️  复用已生成的文章内容")
+    else:
+        enter_stage('article')
+        print(f"📄 生成文章内容...")
+        print(f"   使用参数: Temperature={temperature}, Top-P={top_p}, 启用搜索={enable_search}")
+        article, grounding_sources = run_stage('llm', generate_article_with_gemini, topic, gemini_api_key, gemini_base_url, model_name, custom_prompt, temperature, top_p, enable_search, stream_article, on_chunk, cache_article)
+        if on_progress and progress['info'] and progress['reported'] < progress['info']['chars']:
+            on_progress(progress['info'])
+        state['article'], state['grounding_sources'] = article, grounding_sources
+        if checkpoint:
+            checkpoint()
 
     article_title = extract_article_title(article)
     print(f"✓ 文章生成完成: 《{article_title}》")
@@ -291,138 +735,46 @@ def execute_single_article_generation(topic, config, user_uploaded_images=None):
     image_slots = compute_image_slots(paragraphs, target_image_count, headings)
     print(f"🖼️  图片插入位置: {image_slots}")
 
-    image_list, images_metadata = [], []
-
-    if enable_image:
-        print(f"\n🖼️  准备生成 {target_image_count} 张图片...")
-        user_image_count = len(user_uploaded_images) if user_uploaded_images else 0
-        need_generate_count = target_image_count - user_image_count
-
-        for i, user_img in enumerate(user_uploaded_images or []):
-            if i < len(image_slots):
-                image_list.append({
-                    'path': user_img.get('path'),
-                    'summary': user_img.get('summary', '配图'),
-                    'insert_line': image_slots[i],  # 使用行号而不是段落索引
-                    'source': 'user_uploaded',
-                    'order': i
-                })
-                images_metadata.append({'source': 'user_uploaded', 'path': user_img.get('path'), 'order': i})
+    # 引用解析只依赖正文和搜索来源，与图片阶段并行执行
+    append_citations = config.get('append_citations', False)
+    citation_future = None
+    if append_citations and grounding_sources and 'cited_article' not in state:
+        print(f"\n📚 后台解析引用链接...")
+        print(f"   引用来源数量: {len(grounding_sources)}")
+        citation_deadline = config.get('citation_deadline_seconds', CITATION_DEADLINE_SECONDS)
+        citation_future = submit_stage('network', format_article_with_citations, article, grounding_sources, citation_deadline)
 
-        if need_generate_count > 0:
-            try:
-                visual_blueprint = generate_visual_blueprint(topic, article, gemini_api_key, gemini_base_url, model_name)
-                visual_prompts = build_visual_prompts(visual_blueprint)
-                image_keyword = derive_keyword_from_blueprint(visual_blueprint)
-            except Exception:
-                visual_blueprint, visual_prompts, image_keyword = None, None, ''
-
-            # 智能主题分析（如果启用）
-            topic_analysis = None
-            gemini_image_settings = get_gemini_image_settings(config)
-            auto_detect_topic = gemini_image_settings.get('auto_detect_topic', True)  # 默认启用
-            if auto_detect_topic:
-                try:
-                    # 使用配置中的摘要模型
-                    analysis_model = config.get('comfyui_summary_model', 'gemini-2.0-flash-exp')
-
-                    print(f"\n🔍 智能主题分析...")
-                    print(f"   主题: {topic}")
-                    print(f"   使用模型: {analysis_model}")
-                    topic_analysis = analyze_topic_for_image_generation(
-                        topic,
-                        article,
-                        gemini_api_key,
-                        gemini_base_url,
-                        analysis_model
-                    )
-                    if topic_analysis:
-                        print(f"✓ 主题分析成功")
-                    else:
-                        print(f"⚠️  主题分析返回None，使用默认参数")
-                except Exception as e:
-                    print(f"⚠️  主题分析失败，使用默认参数")
-                    print(f"   错误详情: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    topic_analysis = None
-            else:
-                print(f"\n💡 智能主题检测已关闭，使用手动配置")
-
-            image_provider = ImageProvider(image_keyword, config, topic, visual_prompts, visual_blueprint, topic_analysis)
-            for i in range(user_image_count, target_image_count):
-                print(f"\n  [{i+1}/{target_image_count}] 获取图片...")
-                slot_index = image_slots[i] if i < len(image_slots) else None
-
-                # 第一张图使用全文主题，其余使用段落主题
-                is_first_image = (i == user_image_count)
-                if is_first_image:
-                    # 第一张图：使用全文主题
-                    para_summary = f"visual representation of {topic}"
-                    print(f"  📰 第一张图使用全文主题")
-                else:
-                    # 其余图片：使用段落主题
-                    para_summary = f"visual representation of {topic}"
-                    if slot_index is not None and slot_index < len(paragraphs):
-                        para_summary = summarize_paragraph_for_image(paragraphs[slot_index]['text'], topic, config)
-                        print(f"  📄 使用段落主题")
-
-                # 第一张图使用增强提示词，让它更惊艳
-                if is_first_image:
-                    # 第一张图增强：添加高质量、电影感、专业摄影等关键词
-                    enhanced_prompt = (
-                        f"stunning masterpiece, award-winning photography, cinematic lighting, "
-                        f"ultra detailed, 8k uhd, professional camera, dramatic composition, "
-                        f"{para_summary}, "
-                        f"high dynamic range, sharp focus, perfect exposure, magazine cover quality"
-                    )
-                    print(f"  🌟 使用增强质量提示词")
-                else:
-                    enhanced_prompt = para_summary
-
-                custom_prompts = {
-                    'positive_prompt': enhanced_prompt,
-                    'negative_prompt': visual_prompts.get('negative_prompt', 'lowres, blurry, watermark') if visual_prompts else 'lowres, blurry, watermark',
-                    'is_first_image': is_first_image  # 标记是否第一张图
-                }
-                image_path, image_source, image_metadata = image_provider.get_image(custom_prompts)
-
-                if image_path:
-                    # 获取对应的插入行号
-                    insert_line = image_slots[i] if i < len(image_slots) else None
-                    image_list.append({
-                        'path': image_path,
-                        'summary': para_summary,
-                        'insert_line': insert_line,  # 使用行号而不是段落索引
-                        'source': image_source,
-                        'order': i
-                    })
-                    images_metadata.append({
-                        'source': image_source,
-                        'path': image_path,
-                        'summary': para_summary,
-                        'insert_line': insert_line,
-                        'order': i,
-                        'metadata': image_metadata
-                    })
-                    print(f"  ✓ 图片 {i+1} 获取成功（插入位置: 第{insert_line}行后）")
+        def _record_citations(future):
+            # 即使图片阶段失败，已解析的引用也保留给重试使用
+            if not future.cancelled() and future.exception() is None:
+                state['cited_article'] = future.result()
+        citation_future.add_done_callback(_record_citations)
 
+    image_list, images_metadata = [], []
+    if enable_image:
+        enter_stage('images')
+        image_list, images_metadata = _prepare_images(topic, article, paragraphs, image_slots, config, user_uploaded_images, state, cancel_token, prefetched)
         print(f"\n✓ 图片准备完成，共 {len(image_list)} 张")
+        if checkpoint:
+            checkpoint()
 
-    # 如果启用引用链接功能，在所有图片处理完成后、生成文档前，添加参考资料
-    append_citations = config.get('append_citations', False)
-    if append_citations and grounding_sources:
-        print(f"\n📚 添加引用链接到文章末尾...")
-        print(f"   引用来源数量: {len(grounding_sources)}")
-        article = format_article_with_citations(article, grounding_sources)
+    # 在所有图片处理完成后、生成文档前，合并参考资料
+    if citation_future is not None or 'cited_article' in state:
+        enter_stage('citations')
+        article = citation_future.result() if citation_future is not None else state['cited_article']
         print(f"✓ 引用链接已添加")
+        if citation_future is not None and checkpoint:
+            state['cited_article'] = article
+            checkpoint()
     elif append_citations and not grounding_sources:
         print(f"\n⚠️  已启用引用功能，但本次生成没有搜索来源")
     else:
         print(f"\n💡 引用功能未启用 (append_citations={append_citations})")
 
+    # --- 阶段 4：文档 ---
+    enter_stage('document')
     print(f"\n📦 生成 Word 文档...")
-    filename = create_word_document(article_title, article, image_list, enable_image, pandoc_path, config)
+    filename = run_stage('document', create_word_document, article_title, article, image_list, enable_image, pandoc_path, config)
     print(f"✓ 文档生成完成: {filename}")
     print(f"\n{'='*60}")
     print(f"✅ 文章《{article_title}》生成成功")
@@ -430,113 +782,229 @@ def execute_single_article_generation(topic, config, user_uploaded_images=None):
 
     return {'success': True, 'topic': topic, 'article_title': article_title, 'filename': filename, 'image_count': len(image_list), 'images_info': images_metadata, 'has_image': len(image_list) > 0}
 
-def execute_generation_task(task_id, topics, config):
-    """为给定的主题列表执行生成，并确保所有主题都有最终状态。"""
+def execute_generation_task(task_id, topics, config, priority=None):
+    """将主题提交到全局调度器执行；每个主题完成后回调记录结果，全部结束后统一核对。"""
     with task_lock:
         task = generation_tasks.get(task_id, {})
         topic_images = task.get('topic_images', {})
+        batch = _active_batches.setdefault(task_id, {'active': set(), 'submitted': set()})
+        batch['active'].update(topics)
+        batch['submitted'].update(topics)
+
+    for topic in topics:
+        _submit_topic(task_id, topic, config, topic_images.get(topic), priority)
+
+def _config_fingerprint(config):
+    """计算影响生成产出的配置指纹，用作检查点索引"""
+    relevant = {key: config.get(key) for key in _CHECKPOINT_CONFIG_KEYS}
+    gemini_image_settings = dict(config.get('gemini_image_settings') or {})
+    gemini_image_settings.pop('api_key', None)
+    relevant['gemini_image_settings'] = gemini_image_settings
+    relevant['comfyui_settings'] = config.get('comfyui_settings') or {}
+    payload = json.dumps(relevant, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+def _load_topic_state(task_id, topic, config_hash):
+    """从本任务的检查点恢复主题的阶段状态，丢弃文件已不存在的图片
+
+    检查点按任务隔离：其他批次中同名主题的正文和图片不会被复用。
+    """
+    state = task_store.load_checkpoint(task_id, topic, config_hash, CHECKPOINT_MAX_AGE) or {}
+    image_results = state.get('image_results') or {}
+    for index, entry in list(image_results.items()):
+        if entry.get('path') and not os.path.exists(entry['path']):
+            image_results.pop(index)
+    if state.get('stage'):
+        print(f"♻️  主题 '{topic}' 找到检查点，将从阶段 '{state['stage']}' 继续")
+    return state
+
+def _save_topic_checkpoint(task_id, topic, config_hash, state):
+    """将主题当前的阶段状态写入本任务的检查点"""
+    task_store.save_checkpoint(task_id, topic, config_hash, dict(state))
+
+def _submit_topic(task_id, topic, config, user_uploaded_images, priority=None, delay=0):
+    """提交单个主题到全局调度器；delay 秒后才开始执行（用于失败退避）"""
+    config_hash = _config_fingerprint(config)
+    with task_lock:
+        state = _topic_states.get((task_id, topic))
+    if state is None:
+        # 内存中没有（首次提交、服务重启或手动重试），尝试从检查点恢复
+        state = _load_topic_state(task_id, topic, config_hash)
+    with task_lock:
+        state = _topic_states.setdefault((task_id, topic), state)
+        cancel_token = _cancel_tokens.setdefault((task_id, topic), CancellationToken())
+    scheduler.submit(
+        task_id,
+        _run_topic,
+        args=(task_id, topic, config, user_uploaded_images, state, config_hash, cancel_token),
+        callback=lambda result, error: _on_topic_finished(task_id, topic, config, user_uploaded_images, result, error),
+        priority=priority,
+        delay=delay,
+        key=topic
+    )
+
+def _run_topic(task_id, topic, config, user_uploaded_images, state, config_hash, cancel_token):
+    """在调度器工作线程中执行单个主题，并推送开始与阶段切换事件"""
+    cancel_token.raise_if_cancelled()
+    publish_task_event(task_id, 'topic_started', {'topic': topic, 'resume_stage': state.get('stage')})
+    return execute_single_article_generation(
+        topic, config, user_uploaded_images, state,
+        checkpoint=lambda: _save_topic_checkpoint(task_id, topic, config_hash, state),
+        on_stage=lambda stage: publish_task_event(task_id, 'stage_changed', {'topic': topic, 'stage': stage}),
+        cancel_token=cancel_token,
+        on_progress=lambda info: _report_article_progress(task_id, topic, info)
+    )
+
+def _report_article_progress(task_id, topic, info):
+    """记录正文流式生成的进度（供任务状态接口展示），并推送事件"""
+    with task_lock:
+        task = generation_tasks.get(task_id)
+        if task is None:
+            return
+        task.setdefault('article_progress', {})[topic] = info
+        version = _touch_task(task)
+        publish_task_event(task_id, 'article_progress', {'topic': topic, 'version': version, **info})
 
-    max_retry_attempts = config.get('max_retry_attempts', 10)
+def _touch_task(task, topics=()):
+    """递增任务版本号，并记录本次发生变化的主题（调用方需持有 task_lock）
 
-    with ThreadPoolExecutor(max_workers=config.get('max_concurrent_tasks', 3)) as single_task_executor:
-        futures = {single_task_executor.submit(execute_single_article_generation, topic, config, topic_images.get(topic)): topic for topic in topics}
-        for future in as_completed(futures):
-            topic = futures[future]
-            try:
-                result = future.result()
-                with task_lock:
-                    task = generation_tasks[task_id]
-
-                    # ✅ 防止重复：检查该主题是否已经成功生成过
-                    existing_topics = {r['topic'] for r in task['results']}
-                    if topic in existing_topics:
-                        print(f"⚠️  警告: 主题 '{topic}' 已经成功生成过，跳过重复结果")
-                        continue
+    版本号取毫秒时间戳与旧版本 +1 中的较大值，服务重启后仍然单调递增。
+    """
+    version = max(task.get('version', 0) + 1, int(time.time() * 1000))
+    task['version'] = version
+    topic_versions = task.setdefault('_topic_versions', {})
+    for topic in topics:
+        topic_versions[topic] = version
+    return version
+
+def _progress_payload(task):
+    """事件中附带的进度信息"""
+    return {
+        'version': task.get('version'),
+        'completed': len(task['results']) + len(task['errors']),
+        'total': task['total'],
+        'progress': task['progress']
+    }
+
+def _compute_retry_delay(retry_count, config):
+    """计算第 retry_count 次重试前的退避时间：指数增长 + 随机抖动"""
+    base = float(config.get('retry_backoff_base', DEFAULT_RETRY_BACKOFF_BASE))
+    max_delay = float(config.get('retry_backoff_max', DEFAULT_RETRY_BACKOFF_MAX))
+    delay = min(max_delay, base * (2 ** max(0, retry_count - 1)))
+    # 抖动：在 [delay/2, delay] 之间随机，避免同一批失败的主题同时重试
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def _on_topic_finished(task_id, topic, config, user_uploaded_images, result, error):
+    """单个主题执行结束的回调：记录结果，失败时按退避时间放入延迟重试队列"""
+    max_retry_attempts = config.get('max_retry_attempts', 10)
+    resubmit = False
+    retry_delay = 0
 
-                    # 添加新结果
-                    task['results'].append(result)
+    with task_lock:
+        task = generation_tasks.get(task_id)
+        if task is None:
+            _topic_states.pop((task_id, topic), None)
+            _cancel_tokens.pop((task_id, topic), None)
+            return
+        state = _topic_states.get((task_id, topic)) or {}
+        cancel_token = _cancel_tokens.get((task_id, topic))
+
+        if error is None:
+            # ✅ 防止重复：检查该主题是否已经成功生成过
+            existing_topics = {r['topic'] for r in task['results']}
+            if topic in existing_topics:
+                print(f"⚠️  警告: 主题 '{topic}' 已经成功生成过，跳过重复结果")
+            else:
+                task['results'].append(result)
+                task_store.save_topic_result(task_id, topic, result)
+                retry_count = task.get('retry_counts', {}).get(topic, 0)
+                if retry_count:
+                    print(f"✓ 主题 '{topic}' 在第 {retry_count} 次重试后生成成功！")
+                else:
                     print(f"✓ 主题 '{topic}' 生成成功并记录")
-
-            except Exception as e:
-                with task_lock:
-                    task = generation_tasks[task_id]
-                    retry_count = task.get('retry_counts', {}).get(topic, 0)
-
-                    # 检查是否需要自动重试
-                    if retry_count < max_retry_attempts:
-                        # 增加重试计数
-                        task['retry_counts'][topic] = retry_count + 1
-                        print(f"\n🔄 主题 '{topic}' 生成失败（第 {retry_count + 1}/{max_retry_attempts} 次尝试），正在自动重试...")
-                        print(f"   错误信息: {str(e)}\n")
-
-                        # 同步重试（不使用多线程，避免重复发布）
-                        retry_success = False
-                        for attempt in range(retry_count + 1, max_retry_attempts + 1):
-                            try:
-                                with task_lock:
-                                    task['retry_counts'][topic] = attempt
-
-                                print(f"🔄 第 {attempt}/{max_retry_attempts} 次尝试生成 '{topic}'...")
-                                result = execute_single_article_generation(topic, config, topic_images.get(topic))
-
-                                # 重试成功
-                                with task_lock:
-                                    task = generation_tasks[task_id]
-                                    existing_topics = {r['topic'] for r in task['results']}
-                                    if topic not in existing_topics:
-                                        task['results'].append(result)
-                                        print(f"✓ 主题 '{topic}' 在第 {attempt} 次尝试后生成成功！")
-                                        retry_success = True
-                                        break
-                                    else:
-                                        print(f"⚠️  警告: 主题 '{topic}' 已经成功生成过，跳过重复结果")
-                                        retry_success = True
-                                        break
-                            except Exception as retry_error:
-                                print(f"✗ 第 {attempt}/{max_retry_attempts} 次尝试失败: {str(retry_error)}")
-                                if attempt < max_retry_attempts:
-                                    print(f"   继续重试...\n")
-                                else:
-                                    print(f"   已达到最大重试次数，标记为失败\n")
-                                    # 达到最大重试次数，记录错误
-                                    with task_lock:
-                                        task = generation_tasks[task_id]
-                                        existing_error_topics = {err['topic'] for err in task['errors']}
-                                        if topic not in existing_error_topics:
-                                            task['errors'].append({
-                                                'topic': topic,
-                                                'error': f"尝试 {max_retry_attempts} 次后仍然失败。最后错误: {str(retry_error)}",
-                                                'retry_count': max_retry_attempts
-                                            })
-                                            print(f"✗ 主题 '{topic}' 已尝试 {max_retry_attempts} 次，最终失败")
+        else:
+            retry_count = task.setdefault('retry_counts', {}).get(topic, 0)
+            cancelled = isinstance(error, TaskCancelledError) or (cancel_token is not None and cancel_token.cancelled)
+
+            # 检查是否需要自动重试：重新排队，不阻塞其他主题（已取消的主题不再重试）
+            if not cancelled and retry_count < max_retry_attempts:
+                task['retry_counts'][topic] = retry_count + 1
+                task_store.save_retry_count(task_id, topic, retry_count + 1)
+                retry_delay = _compute_retry_delay(retry_count + 1, config)
+                print(f"\n🔄 主题 '{topic}' 在阶段 '{state.get('stage', 'unknown')}' 失败（第 {retry_count + 1}/{max_retry_attempts} 次重试），{retry_delay:.1f} 秒后从该阶段继续...")
+                print(f"   错误信息: {str(error)}\n")
+                resubmit = True
+            else:
+                # 已取消或已达到最大重试次数，记录错误
+                if cancelled:
+                    error_message = '任务已取消'
+                elif retry_count > 0:
+                    error_message = f"尝试 {retry_count} 次后仍然失败。最后错误: {str(error)}"
+                else:
+                    error_message = str(error)
+                error_entry = {'topic': topic, 'error': error_message, 'retry_count': retry_count}
+                if cancelled:
+                    error_entry['cancelled'] = True
+                existing_index = next((i for i, err in enumerate(task['errors']) if err['topic'] == topic), None)
+                if existing_index is not None:
+                    task['errors'][existing_index] = error_entry
+                    print(f"✗ 主题 '{topic}' 再次失败，已更新错误记录")
+                else:
+                    task['errors'].append(error_entry)
+                    if cancelled:
+                        print(f"⏹️  主题 '{topic}' 已取消")
                     else:
-                        # 已达到最大重试次数
-                        existing_error_topics = {err['topic'] for err in task['errors']}
-                        if topic in existing_error_topics:
-                            # 更新现有错误记录
-                            for err in task['errors']:
-                                if err['topic'] == topic:
-                                    err['error'] = str(e)
-                                    err['retry_count'] = retry_count
-                                    break
-                            print(f"✗ 主题 '{topic}' 再次失败，已更新错误记录")
-                        else:
-                            # 添加新错误记录
-                            task['errors'].append({'topic': topic, 'error': str(e), 'retry_count': retry_count})
-                            print(f"✗ 主题 '{topic}' 生成失败并记录")
-
-            finally:
-                with task_lock:
-                    task = generation_tasks[task_id]
-                    completed_count = len(task['results']) + len(task['errors'])
-                    task['progress'] = (completed_count / task['total']) * 100 if task['total'] > 0 else 0
-
-    # --- 任务核对机制 ---
+                        print(f"✗ 主题 '{topic}' 生成失败并记录")
+                task_store.save_topic_error(task_id, topic, error_message, retry_count)
+
+        _touch_task(task, [topic])
+        task.get('article_progress', {}).pop(topic, None)
+        if not resubmit:
+            _topic_states.pop((task_id, topic), None)
+            _cancel_tokens.pop((task_id, topic), None)
+        batch = _active_batches.get(task_id)
+        if not resubmit and batch:
+            batch['active'].discard(topic)
+        completed_count = len(task['results']) + len(task['errors'])
+        task['progress'] = (completed_count / task['total']) * 100 if task['total'] > 0 else 0
+        batch_finished = not resubmit and batch is not None and not batch['active']
+
+        # 推送增量事件（在锁内发布，保证与进度变化顺序一致）
+        if resubmit:
+            publish_task_event(task_id, 'topic_retrying', {
+                'topic': topic, 'stage': state.get('stage'), 'error': str(error),
+                'retry_count': task['retry_counts'][topic], 'delay_seconds': round(retry_delay, 1)
+            })
+        elif error is None:
+            publish_task_event(task_id, 'topic_finished', {'topic': topic, 'result': result, **_progress_payload(task)})
+        else:
+            error_entry = next((dict(err) for err in task['errors'] if err['topic'] == topic), None)
+            publish_task_event(task_id, 'topic_failed', {'topic': topic, 'error': error_entry, **_progress_payload(task)})
+
+    # 检查点：成功后删除；失败时保存已完成的阶段，供自动重试和手动重试复用
+    config_hash = _config_fingerprint(config)
+    if error is None:
+        task_store.delete_checkpoint(task_id, topic, config_hash)
+    elif state.get('stage'):
+        _save_topic_checkpoint(task_id, topic, config_hash, state)
+
+    if resubmit:
+        _submit_topic(task_id, topic, config, user_uploaded_images, delay=retry_delay)
+    elif batch_finished:
+        _finalize_generation_task(task_id)
+
+def _finalize_generation_task(task_id):
+    """批次内所有主题结束后核对任务，确保每个主题都有最终状态"""
     with task_lock:
-        task = generation_tasks[task_id]
+        task = generation_tasks.get(task_id)
+        batch = _active_batches.get(task_id)
+        if task is None or batch is None or batch['active']:
+            return
+        _active_batches.pop(task_id, None)
+
+        # --- 任务核对机制 ---
         processed_topics = {r['topic'] for r in task['results']} | {e['topic'] for e in task['errors']}
-        initial_topics_for_this_run = set(topics)
-        missing_topics = initial_topics_for_this_run - processed_topics
+        missing_topics = batch['submitted'] - processed_topics
 
         if missing_topics:
             print(f"核对发现 {len(missing_topics)} 个幽灵任务: {missing_topics}")
@@ -547,10 +1015,10 @@ def execute_generation_task(task_id, topics, config):
                     'error': '任务在执行过程中意外中断或超时',
                     'retry_count': retry_count
                 })
+                task_store.save_topic_error(task_id, topic, '任务在执行过程中意外中断或超时', retry_count)
 
         # ✅ 安全检查：确保没有重复
         unique_success_topics = {r['topic'] for r in task['results']}
-        unique_error_topics = {e['topic'] for e in task['errors']}
 
         if len(task['results']) != len(unique_success_topics):
             print(f"⚠️  警告: 检测到 {len(task['results']) - len(unique_success_topics)} 个重复的成功结果，正在去重...")
@@ -567,27 +1035,154 @@ def execute_generation_task(task_id, topics, config):
         # 重新计算最终进度并检查是否完成
         completed_count = len(task['results']) + len(task['errors'])
         task['progress'] = (completed_count / task['total']) * 100 if task['total'] > 0 else 0
+        _touch_task(task, missing_topics)
+        task['_last_access'] = time.time()
         if completed_count >= task['total']:
             task['status'] = 'completed'
+            task_store.update_task_status(task_id, 'completed')
+            publish_task_event(task_id, 'task_completed', {
+                'status': 'completed', 'results_count': len(task['results']),
+                'errors_count': len(task['errors']), **_progress_payload(task)
+            })
             print(f"✓ 任务完成! 总结果: {len(task['results'])} 成功, {len(task['errors'])} 失败")
             print(f"  成功主题: {sorted([r['topic'] for r in task['results']])}")
             print(f"  失败主题: {sorted([e['topic'] for e in task['errors']])}")
 
-def create_generation_task(topics, topic_images, config):
+    scheduler.forget_batch(task_id)
+    clear_task_events(task_id)
+    _evict_finished_tasks()
+
+def create_generation_task(topics, topic_images, config, priority=0):
+    # 准入控制：排队过多时直接拒绝，抛出 SchedulerBusyError
+    scheduler.check_admission(len(topics), config.get('max_queued_topics', DEFAULT_MAX_QUEUED_TOPICS))
+
     task_id = str(uuid.uuid4())
+    task = {'task_id': task_id, 'status': 'running', 'progress': 0, 'results': [], 'errors': [], 'total': len(topics), 'topic_images': topic_images, 'retry_counts': {}, 'created_at': datetime.now().isoformat()}
     with task_lock:
-        generation_tasks[task_id] = {'status': 'running', 'progress': 0, 'results': [], 'errors': [], 'total': len(topics), 'topic_images': topic_images, 'retry_counts': {}}
-    executor.submit(execute_generation_task, task_id, list(topics), config)
+        _touch_task(task)
+        task['_last_access'] = time.time()
+        generation_tasks[task_id] = task
+    task_store.save_task(task_id, task, list(topics))
+    execute_generation_task(task_id, list(topics), config, priority)
+    _evict_finished_tasks()
     return task_id
 
-def get_task_status(task_id):
+def cancel_generation_task(task_id, topics=None):
+    """取消批次中尚未结束的主题
+
+    排队中和等待重试的主题立即从调度器移除；运行中的主题通过取消令牌
+    在下一个检查点停止（ComfyUI 中已提交的任务会被中断）。
+
+    Args:
+        topics: 要取消的主题列表；为 None 时取消整个批次
+
+    Returns:
+        dict: {'found': 任务是否存在, 'cancelled': 已请求取消的主题, 'dequeued': 直接移除的排队作业数}
+    """
     with task_lock:
-        return generation_tasks.get(task_id, {}).copy()
+        task = generation_tasks.get(task_id)
+        batch = _active_batches.get(task_id)
+        if task is None and batch is None:
+            return {'found': task_store.load_task(task_id) is not None, 'cancelled': [], 'dequeued': 0}
+        active = set(batch['active']) if batch else set()
+        targets = active if topics is None else active & set(topics)
+        for topic in targets:
+            cancel_token = _cancel_tokens.get((task_id, topic))
+            if cancel_token is not None:
+                cancel_token.cancel()
+
+    dequeued = 0
+    if targets:
+        dequeued = scheduler.cancel(task_id, keys=targets, error=TaskCancelledError('任务已取消'))
+        print(f"⏹️  任务 {task_id}: 已请求取消 {len(targets)} 个主题，其中 {dequeued} 个尚未开始")
+    return {'found': True, 'cancelled': sorted(targets), 'dequeued': dequeued}
+
+def _task_view(task, since=None):
+    """生成对外返回的任务副本；指定 since 时只包含该版本之后变化的主题"""
+    view = {key: value for key, value in task.items() if key not in ('results', 'errors') and not key.startswith('_')}
+    view['retry_counts'] = dict(task.get('retry_counts', {}))
+    view['article_progress'] = {topic: dict(info) for topic, info in task.get('article_progress', {}).items()}
+    if since is None:
+        view['results'] = list(task['results'])
+        view['errors'] = list(task['errors'])
+        return view
+
+    topic_versions = task.get('_topic_versions', {})
+    changed = {topic for topic, version in topic_versions.items() if version > since}
+    view['since'] = since
+    view['results'] = [r for r in task['results'] if r['topic'] in changed]
+    view['errors'] = [e for e in task['errors'] if e['topic'] in changed]
+    # 变化后既无结果也无错误的主题（例如被重新排队），客户端应恢复为等待状态
+    finished = {r['topic'] for r in view['results']} | {e['topic'] for e in view['errors']}
+    view['pending_topics'] = sorted(changed - finished)
+    return view
+
+def get_task_version(task_id):
+    """返回任务当前版本号，任务不存在时返回 None"""
+    with task_lock:
+        task = generation_tasks.get(task_id)
+        if task is not None:
+            return task.get('version', 0)
+    task = task_store.load_task(task_id)
+    return task.get('version', 0) if task else None
+
+def get_task_status(task_id, since=None):
+    """获取任务状态；since 为版本号时只返回此后变化的结果和错误"""
+    with task_lock:
+        task = generation_tasks.get(task_id)
+        if task is not None:
+            task['_last_access'] = time.time()
+            task = _task_view(task, since)
+    if task is None:
+        # 内存中没有（例如服务重启后），从持久化存储中读取
+        task = task_store.load_task(task_id)
+        if not task:
+            return {}
+        task = _task_view(task, since)
+    # 附带调度器中的排队深度与等待时间
+    task['queue'] = scheduler.get_batch_stats(task_id)
+    return task
+
+def resume_unfinished_tasks(config=None):
+    """服务启动时恢复未完成的任务，并重新提交尚未生成的主题"""
+    task_store.prune_checkpoints(CHECKPOINT_MAX_AGE)
+    unfinished = task_store.load_unfinished_tasks()
+    if not unfinished:
+        return 0
+
+    config = config if config is not None else load_config()
+    if not config.get('gemini_api_key') or not config.get('pandoc_path'):
+        print(f"⚠️  发现 {len(unfinished)} 个未完成任务，但配置不完整，暂不恢复")
+        return 0
+
+    resumed = 0
+    for task_id, task, pending_topics in unfinished:
+        with task_lock:
+            if task_id in generation_tasks:
+                continue
+            task['_last_access'] = time.time()
+            generation_tasks[task_id] = task
+        if pending_topics:
+            print(f"🔁 恢复任务 {task_id}: 重新提交 {len(pending_topics)} 个未完成主题")
+            execute_generation_task(task_id, pending_topics, config)
+        else:
+            # 所有主题都已有结果，只需补写完成状态
+            with task_lock:
+                task['status'] = 'completed'
+                _touch_task(task)
+            task_store.update_task_status(task_id, 'completed')
+        resumed += 1
+    return resumed
 
 def retry_failed_topics_in_task(task_id, topics_to_retry, config):
     """重试失败的主题"""
     with task_lock:
         task = generation_tasks.get(task_id)
+        if not task and task_id:
+            # 服务重启后内存中没有该任务，尝试从持久化存储中恢复
+            task = task_store.load_task(task_id)
+            if task:
+                generation_tasks[task_id] = task
         if not task:
             print(f"⚠️  任务 {task_id} 不存在，创建新任务")
             new_task_id = str(uuid.uuid4())
@@ -603,8 +1198,25 @@ def retry_failed_topics_in_task(task_id, topics_to_retry, config):
                 'retry_counts': new_retry_counts,
                 'created_at': datetime.now().isoformat()
             }
-            executor.submit(execute_generation_task, new_task_id, topics_to_retry, config)
-            return {'new_task': True, 'task_id': new_task_id}
+            _touch_task(generation_tasks[new_task_id])
+            generation_tasks[new_task_id]['_last_access'] = time.time()
+            task_store.save_task(new_task_id, generation_tasks[new_task_id], list(topics_to_retry))
+        else:
+            new_task_id = None
+
+    if new_task_id:
+        execute_generation_task(new_task_id, topics_to_retry, config)
+        return {'new_task': True, 'task_id': new_task_id}
+
+    with task_lock:
+        task = generation_tasks.get(task_id)
+        if task is None:
+            # 两次加锁之间任务可能已被淘汰出内存，重新从存储中读取
+            task = task_store.load_task(task_id)
+            if not task:
+                return {'error': '任务不存在'}
+            generation_tasks[task_id] = task
+        task['_last_access'] = time.time()
 
         # ✅ 过滤：只重试真正失败的主题（排除已成功的）
         existing_success_topics = {r['topic'] for r in task['results']}
@@ -629,10 +1241,13 @@ def retry_failed_topics_in_task(task_id, topics_to_retry, config):
 
         # 设置任务状态
         task['status'] = 'running'
+        _touch_task(task, actual_failed_topics)
         completed_count = len(task['results']) + len(task['errors'])
         task['progress'] = (completed_count / task['total']) * 100 if task['total'] > 0 else 0
 
+        task_store.mark_topics_pending(task_id, actual_failed_topics, task['retry_counts'])
+        publish_task_event(task_id, 'topics_requeued', {'topics': actual_failed_topics, **_progress_payload(task)})
         print(f"🔄 重试 {len(actual_failed_topics)} 个失败主题: {actual_failed_topics}")
 
-    executor.submit(execute_generation_task, task_id, actual_failed_topics, config)
+    execute_generation_task(task_id, actual_failed_topics, config)
     return {'success': True, 'task_id': task_id}
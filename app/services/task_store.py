@@ -0,0 +1,278 @@
+"""任务持久化存储模块
+
+使用 SQLite（WAL 模式）记录每个批量任务及其主题的执行状态，
+服务重启后可据此恢复未完成的主题，避免已生成的文章被重复计费。
+同时保存每个主题的阶段检查点（正文、搜索来源、视觉蓝图、图片等），
+按任务、主题和配置指纹索引，同一任务内重试时从第一个未完成的阶段继续。
+"""
+
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+from app.config import TASK_STORE_FILE
+
+_store_lock = threading.Lock()
+_connection = None
+
+# 主题状态
+TOPIC_PENDING = 'pending'
+TOPIC_SUCCESS = 'success'
+TOPIC_FAILED = 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    topic_images TEXT,
+    created_at TEXT,
+    updated_at TEXT
+);
+CREATE TABLE IF NOT EXISTS task_topics (
+    task_id TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    retry_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT,
+    PRIMARY KEY (task_id, topic)
+);
+CREATE TABLE IF NOT EXISTS task_checkpoints (
+    task_id TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    config_hash TEXT NOT NULL,
+    state TEXT NOT NULL,
+    updated_at TEXT,
+    PRIMARY KEY (task_id, topic, config_hash)
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status);
+CREATE INDEX IF NOT EXISTS idx_task_topics_state ON task_topics (task_id, state);
+"""
+
+
+def _now():
+    return datetime.now().isoformat()
+
+
+def _get_connection():
+    """获取（必要时初始化）共享的数据库连接，调用方需持有 _store_lock"""
+    global _connection
+    if _connection is None:
+        directory = os.path.dirname(os.path.abspath(TASK_STORE_FILE))
+        os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(TASK_STORE_FILE, check_same_thread=False, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(_SCHEMA)
+        _connection = conn
+    return _connection
+
+
+def _execute(sql, params=()):
+    """执行单条写入语句，失败时只打印错误，不影响生成流程
+
+    params 可以是返回参数元组的函数，参数中的 JSON 序列化错误同样只打印、不抛出。
+    """
+    try:
+        if callable(params):
+            params = params()
+        with _store_lock:
+            _get_connection().execute(sql, params)
+    except Exception as e:
+        print(f"⚠️  任务存储写入失败: {e}")
+
+
+def save_task(task_id, task, topics):
+    """保存新任务及其全部主题（初始状态为 pending）"""
+    now = _now()
+    retry_counts = task.get('retry_counts', {})
+    try:
+        with _store_lock:
+            conn = _get_connection()
+            conn.execute('BEGIN')
+            try:
+                conn.execute(
+                    'INSERT OR REPLACE INTO tasks (task_id, status, total, topic_images, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                    (task_id, task.get('status', 'running'), task.get('total', len(topics)),
+                     json.dumps(task.get('topic_images') or {}, ensure_ascii=False),
+                     task.get('created_at', now), now)
+                )
+                for position, topic in enumerate(topics):
+                    conn.execute(
+                        'INSERT OR REPLACE INTO task_topics (task_id, topic, position, state, retry_count, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                        (task_id, topic, position, TOPIC_PENDING, retry_counts.get(topic, 0), now)
+                    )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+    except Exception as e:
+        print(f"⚠️  任务存储写入失败: {e}")
+
+
+def update_task_status(task_id, status):
+    """更新任务整体状态"""
+    _execute('UPDATE tasks SET status = ?, updated_at = ? WHERE task_id = ?', (status, _now(), task_id))
+
+
+def save_topic_result(task_id, topic, result):
+    """记录主题生成成功的结果"""
+    _execute(
+        'UPDATE task_topics SET state = ?, result = ?, error = NULL, updated_at = ? WHERE task_id = ? AND topic = ?',
+        lambda: (TOPIC_SUCCESS, json.dumps(result, ensure_ascii=False, default=str), _now(), task_id, topic)
+    )
+
+
+def save_topic_error(task_id, topic, error, retry_count):
+    """记录主题最终失败的错误信息"""
+    _execute(
+        'UPDATE task_topics SET state = ?, error = ?, retry_count = ?, updated_at = ? WHERE task_id = ? AND topic = ?',
+        (TOPIC_FAILED, error, retry_count, _now(), task_id, topic)
+    )
+
+
+def save_retry_count(task_id, topic, retry_count):
+    """记录主题的重试次数"""
+    _execute(
+        'UPDATE task_topics SET retry_count = ?, updated_at = ? WHERE task_id = ? AND topic = ?',
+        (retry_count, _now(), task_id, topic)
+    )
+
+
+def mark_topics_pending(task_id, topics, retry_counts=None):
+    """将主题重新标记为待生成（用于手动重试）"""
+    retry_counts = retry_counts or {}
+    now = _now()
+    try:
+        with _store_lock:
+            conn = _get_connection()
+            for topic in topics:
+                conn.execute(
+                    'UPDATE task_topics SET state = ?, error = NULL, retry_count = ?, updated_at = ? WHERE task_id = ? AND topic = ?',
+                    (TOPIC_PENDING, retry_counts.get(topic, 0), now, task_id, topic)
+                )
+            conn.execute('UPDATE tasks SET status = ?, updated_at = ? WHERE task_id = ?', ('running', now, task_id))
+    except Exception as e:
+        print(f"⚠️  任务存储写入失败: {e}")
+
+
+def _to_version(timestamp):
+    """将 ISO 时间转换为毫秒版本号，与内存中任务版本号的取值方式一致"""
+    try:
+        return int(datetime.fromisoformat(timestamp).timestamp() * 1000)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _build_task(task_row, topic_rows):
+    """将数据库记录还原为与内存结构一致的任务字典"""
+    results, errors, retry_counts, topic_versions = [], [], {}, {}
+    for row in topic_rows:
+        retry_counts[row['topic']] = row['retry_count']
+        topic_versions[row['topic']] = _to_version(row['updated_at'])
+        if row['state'] == TOPIC_SUCCESS and row['result']:
+            results.append(json.loads(row['result']))
+        elif row['state'] == TOPIC_FAILED:
+            errors.append({'topic': row['topic'], 'error': row['error'] or '', 'retry_count': row['retry_count']})
+
+    total = task_row['total']
+    completed_count = len(results) + len(errors)
+    return {
+        'task_id': task_row['task_id'],
+        'status': task_row['status'],
+        'total': total,
+        'progress': (completed_count / total) * 100 if total > 0 else 0,
+        'results': results,
+        'errors': errors,
+        'topic_images': json.loads(task_row['topic_images'] or '{}'),
+        'retry_counts': retry_counts,
+        'created_at': task_row['created_at'],
+        'version': max([_to_version(task_row['updated_at'])] + list(topic_versions.values())),
+        '_topic_versions': topic_versions
+    }
+
+
+def load_task(task_id):
+    """按 task_id 加载任务，不存在时返回 None"""
+    try:
+        with _store_lock:
+            conn = _get_connection()
+            task_row = conn.execute('SELECT * FROM tasks WHERE task_id = ?', (task_id,)).fetchone()
+            if task_row is None:
+                return None
+            topic_rows = conn.execute(
+                'SELECT * FROM task_topics WHERE task_id = ? ORDER BY position', (task_id,)
+            ).fetchall()
+    except Exception as e:
+        print(f"⚠️  任务存储读取失败: {e}")
+        return None
+    return _build_task(task_row, topic_rows)
+
+
+def load_unfinished_tasks():
+    """加载所有未完成的任务
+
+    Returns:
+        list: [(task_id, task, pending_topics), ...]
+    """
+    unfinished = []
+    try:
+        with _store_lock:
+            conn = _get_connection()
+            task_rows = conn.execute("SELECT * FROM tasks WHERE status = 'running' ORDER BY created_at").fetchall()
+            for task_row in task_rows:
+                topic_rows = conn.execute(
+                    'SELECT * FROM task_topics WHERE task_id = ? ORDER BY position', (task_row['task_id'],)
+                ).fetchall()
+                pending_topics = [row['topic'] for row in topic_rows if row['state'] == TOPIC_PENDING]
+                unfinished.append((task_row['task_id'], _build_task(task_row, topic_rows), pending_topics))
+    except Exception as e:
+        print(f"⚠️  任务存储读取失败: {e}")
+    return unfinished
+
+
+# --- 阶段检查点 ---
+def save_checkpoint(task_id, topic, config_hash, state):
+    """保存任务中某个主题的阶段检查点（覆盖旧值）"""
+    _execute(
+        'INSERT OR REPLACE INTO task_checkpoints (task_id, topic, config_hash, state, updated_at) VALUES (?, ?, ?, ?, ?)',
+        lambda: (task_id, topic, config_hash, json.dumps(state, ensure_ascii=False, default=str), _now())
+    )
+
+
+def load_checkpoint(task_id, topic, config_hash, max_age_seconds=None):
+    """加载任务中某个主题的阶段检查点，不存在或已过期时返回 None"""
+    try:
+        with _store_lock:
+            row = _get_connection().execute(
+                'SELECT state, updated_at FROM task_checkpoints WHERE task_id = ? AND topic = ? AND config_hash = ?',
+                (task_id, topic, config_hash)
+            ).fetchone()
+    except Exception as e:
+        print(f"⚠️  任务存储读取失败: {e}")
+        return None
+    if row is None:
+        return None
+    if max_age_seconds and row['updated_at'] < (datetime.now() - timedelta(seconds=max_age_seconds)).isoformat():
+        return None
+    try:
+        return json.loads(row['state'])
+    except ValueError:
+        return None
+
+
+def delete_checkpoint(task_id, topic, config_hash):
+    """删除任务中某个主题的阶段检查点（主题成功后调用）"""
+    _execute('DELETE FROM task_checkpoints WHERE task_id = ? AND topic = ? AND config_hash = ?', (task_id, topic, config_hash))
+
+
+def prune_checkpoints(max_age_seconds):
+    """清理超过保留时间的检查点"""
+    cutoff = (datetime.now() - timedelta(seconds=max_age_seconds)).isoformat()
+    _execute('DELETE FROM task_checkpoints WHERE updated_at < ?', (cutoff,))
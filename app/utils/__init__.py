@@ -25,6 +25,10 @@ from .network import (
     download_image_from_url
 )
 
+from .site_cache import (
+    prune_site_cache
+)
+
 __all__ = [
     'allowed_file',
     'generate_safe_filename',
@@ -38,5 +42,6 @@ __all__ = [
     'validate_image_count',
     'validate_style_template',
     'normalize_field',
-    'download_image_from_url'
+    'download_image_from_url',
+    'prune_site_cache'
 ]
@@ -0,0 +1,98 @@
+"""并发控制工具"""
+
+import time
+import threading
+
+
+class ResizableSemaphore:
+    """可在线调整上限的信号量
+
+    与 threading.BoundedSemaphore 不同，调整上限时不会替换对象本身，
+    已被占用的许可仍归还到同一个实例；缩小上限后，新的 acquire 会等待
+    占用数降到新上限以下，运行中的任务不受影响。
+    """
+
+    def __init__(self, limit):
+        self._cond = threading.Condition()
+        self._limit = max(1, int(limit))
+        self._in_use = 0
+
+    @property
+    def limit(self):
+        return self._limit
+
+    @property
+    def in_use(self):
+        return self._in_use
+
+    def acquire(self, blocking=True, timeout=None):
+        """获取一个许可，超时或非阻塞获取失败时返回 False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._in_use >= self._limit:
+                if not blocking:
+                    return False
+                if deadline is None:
+                    self._cond.wait()
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+            self._in_use += 1
+            return True
+
+    def release(self):
+        """归还一个许可"""
+        with self._cond:
+            if self._in_use <= 0:
+                raise ValueError('信号量释放次数超过获取次数')
+            self._in_use -= 1
+            self._cond.notify()
+
+    def resize(self, limit):
+        """调整上限，立即对新的 acquire 生效，不阻塞调用方"""
+        with self._cond:
+            self._limit = max(1, int(limit))
+            self._cond.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+class TaskCancelledError(Exception):
+    """任务已被取消"""
+
+
+class CancellationToken:
+    """协作式取消令牌
+
+    由调用方在各阶段之间、轮询和重试循环中检查；取消后正在进行的
+    单次网络请求不会被打断，但下一次检查时会抛出 TaskCancelledError。
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        """请求取消"""
+        self._event.set()
+
+    def raise_if_cancelled(self):
+        """已取消时抛出 TaskCancelledError"""
+        if self._event.is_set():
+            raise TaskCancelledError('任务已取消')
+
+    def sleep(self, seconds):
+        """可被取消打断的等待，取消时抛出 TaskCancelledError"""
+        if self._event.wait(seconds):
+            raise TaskCancelledError('任务已取消')
@@ -0,0 +1,202 @@
+"""过滤事件日志
+
+log_filtered_event 由各解析线程调用，原实现每条记录都打开、追加、关闭一次日志文件。
+这里改为后台线程写入：
+- 调用方只把记录放入队列，不做文件 IO；队列已满时丢弃并计数
+- 后台线程批量写入，最多每 FLUSH_INTERVAL 秒刷新一次到磁盘（队列空闲时立即刷新），
+  退出时写完队列中剩余的记录
+- 日期变化或单个文件超过 max_bytes 时切换到新文件
+  （文件名沿用 YYYY_MM_DD_NN_gfw_logs.txt，序号递增）
+- format 为 'json' 时写入 JSON Lines（.jsonl），便于直接加载分析
+"""
+
+import os
+import json
+import time
+import queue
+import datetime
+import threading
+
+# 刷新到磁盘的最大间隔（秒）和单批最大条数
+FLUSH_INTERVAL = 1.0
+MAX_BATCH_SIZE = 500
+# 队列容量，超出后丢弃新记录
+MAX_PENDING_EVENTS = 10000
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+LOG_FORMATS = ('text', 'json')
+
+
+class FilterEventLogger:
+    """队列 + 后台线程的过滤事件日志"""
+
+    def __init__(self, log_dir, log_format='text', max_bytes=DEFAULT_MAX_BYTES):
+        self.log_dir = log_dir
+        self.log_format = log_format
+        self.max_bytes = max_bytes
+        self._queue = queue.Queue(maxsize=MAX_PENDING_EVENTS)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = False
+        self._file = None
+        self._file_path = None
+        self._file_date = None
+        self._file_format = None
+        self._file_size = 0
+        self._flushed_at = 0.0
+        self._stats = {'written': 0, 'dropped': 0, 'errors': 0, 'files': 0}
+
+    def configure(self, log_format=None, max_bytes=None):
+        """更新日志格式和单个文件的大小上限，下次写入时生效"""
+        with self._lock:
+            if log_format is not None:
+                self.log_format = log_format if log_format in LOG_FORMATS else 'text'
+            if max_bytes is not None:
+                self.max_bytes = max(0, int(max_bytes))
+
+    def log(self, url, reason, detail):
+        """记录一条过滤事件（不阻塞调用线程）"""
+        if self._stopped:
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((datetime.datetime.now(), url, reason, detail))
+        except queue.Full:
+            with self._lock:
+                self._stats['dropped'] += 1
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None and not self._stopped:
+                self._thread = threading.Thread(target=self._run, name='filter-log', daemon=True)
+                self._thread.start()
+
+    # --- 后台线程 ---
+    def _run(self):
+        while True:
+            try:
+                event = self._queue.get(timeout=FLUSH_INTERVAL)
+            except queue.Empty:
+                self._flush()
+                continue
+            batch = self._drain([event])
+            # None 表示停止：写完它之前的记录后退出
+            stop = batch[-1] is None
+            self._write_batch([item for item in batch if item is not None])
+            if stop:
+                self._flush()
+                return
+            if time.monotonic() - self._flushed_at >= FLUSH_INTERVAL:
+                self._flush()
+
+    def _drain(self, batch):
+        while batch[-1] is not None and len(batch) < MAX_BATCH_SIZE:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _format(self, event, log_format):
+        timestamp, url, reason, detail = event
+        if log_format == 'json':
+            return json.dumps({
+                'time': timestamp.isoformat(timespec='seconds'),
+                'url': url,
+                'reason': reason,
+                'detail': detail
+            }, ensure_ascii=False) + '\n'
+        return f"[{timestamp.strftime('%Y-%m-%d %H:%M:%S')}] Blocked URL: {url} | Reason: {reason} | Detail: {detail}\n"
+
+    def _next_path(self, date_str, extension):
+        """返回该日期下一个未使用的序号对应的路径"""
+        prefix = f'{date_str}_'
+        sequence = 0
+        for name in os.listdir(self.log_dir):
+            if name.startswith(prefix) and '_gfw_logs.' in name:
+                try:
+                    sequence = max(sequence, int(name[len(prefix):].split('_', 1)[0]))
+                except ValueError:
+                    continue
+        return os.path.join(self.log_dir, f'{prefix}{sequence + 1:02d}_gfw_logs.{extension}')
+
+    def _open_for(self, timestamp, log_format, max_bytes):
+        """必要时（首次写入、日期变化、超过大小上限、格式变化）切换日志文件"""
+        date_str = timestamp.strftime('%Y_%m_%d')
+        if (self._file is not None and self._file_date == date_str and self._file_format == log_format
+                and not (max_bytes and self._file_size >= max_bytes)):
+            return
+        self._close_file()
+        os.makedirs(self.log_dir, exist_ok=True)
+        path = self._next_path(date_str, 'jsonl' if log_format == 'json' else 'txt')
+        self._file = open(path, 'a', encoding='utf-8')
+        self._file_size = os.path.getsize(path)
+        self._file_path = path
+        self._file_date = date_str
+        self._file_format = log_format
+        with self._lock:
+            self._stats['files'] += 1
+
+    def _close_file(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except Exception:
+                pass
+            self._file = None
+
+    def _flush(self):
+        self._flushed_at = time.monotonic()
+        if self._file is not None:
+            try:
+                self._file.flush()
+            except Exception as e:
+                print(f"❌ 写入过滤日志时发生错误: {e}")
+
+    def _write_batch(self, batch):
+        if not batch:
+            return
+        with self._lock:
+            log_format, max_bytes = self.log_format, self.max_bytes
+        written = 0
+        try:
+            for event in batch:
+                self._open_for(event[0], log_format, max_bytes)
+                line = self._format(event, log_format)
+                self._file.write(line)
+                self._file_size += len(line.encode('utf-8'))
+                written += 1
+        except Exception as e:
+            print(f"❌ 写入过滤日志时发生错误: {e}")
+            self._close_file()
+            with self._lock:
+                self._stats['errors'] += 1
+        with self._lock:
+            self._stats['written'] += written
+
+    # --- 关闭与统计 ---
+    def close(self, timeout=5):
+        """写完队列中的记录后停止后台线程"""
+        with self._lock:
+            thread = self._thread
+            self._stopped = True
+        if thread is not None and thread.is_alive():
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                pass
+            thread.join(timeout)
+        self._close_file()
+
+    def get_stats(self):
+        """返回日志文件、格式和写入 / 丢弃条数"""
+        with self._lock:
+            return {
+                'format': self.log_format,
+                'max_bytes': self.max_bytes,
+                'current_file': self._file_path,
+                'pending': self._queue.qsize(),
+                **self._stats
+            }
+
@@ -0,0 +1,79 @@
+"""分阶段过滤引擎
+
+过滤规则按执行所需的数据（即成本）分为三个阶段：
+- STAGE_OFFLINE: 只使用已有数据（如搜索结果附带的域名），不发起网络请求
+- STAGE_URL: 已跟随跳转得到真实 URL，尚未下载页面
+- STAGE_CONTENT: 已获取页面标题和网站名称
+
+调用方在进入下一阶段前先执行当前阶段的规则，被拒绝的候选不再付出后续的网络开销。
+每条规则记录检查次数、拒绝次数和累计耗时。
+"""
+
+import time
+import threading
+
+STAGE_OFFLINE = 'offline'
+STAGE_URL = 'url'
+STAGE_CONTENT = 'content'
+STAGES = [STAGE_OFFLINE, STAGE_URL, STAGE_CONTENT]
+
+
+class FilterRule:
+    """一条过滤规则
+
+    check(candidate) 通过时返回 None，拒绝时返回写入过滤日志的细节文本。
+    label 和 message 用于控制台输出，reason 用于过滤日志和统计。
+    """
+
+    def __init__(self, stage, label, reason, message, check):
+        if stage not in STAGES:
+            raise ValueError(f'未知的过滤阶段: {stage}')
+        self.stage = stage
+        self.label = label
+        self.reason = reason
+        self.message = message
+        self.check = check
+
+
+class FilterPipeline:
+    """按阶段执行过滤规则并统计每条规则的拒绝次数和耗时"""
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self._lock = threading.Lock()
+        self._stats = {rule.reason: {'checked': 0, 'rejected': 0, 'seconds': 0.0} for rule in self.rules}
+
+    def run(self, stage, candidate):
+        """执行某一阶段的规则，返回 (拒绝的规则, 细节)，全部通过返回 None"""
+        for rule in self.rules:
+            if rule.stage != stage:
+                continue
+            started = time.perf_counter()
+            detail = rule.check(candidate)
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                stats = self._stats[rule.reason]
+                stats['checked'] += 1
+                stats['seconds'] += elapsed
+                if detail is not None:
+                    stats['rejected'] += 1
+            if detail is not None:
+                return rule, detail
+        return None
+
+    def get_stats(self):
+        """返回每条规则的检查次数、拒绝次数和平均耗时"""
+        with self._lock:
+            snapshot = {reason: dict(stats) for reason, stats in self._stats.items()}
+        report = []
+        for rule in self.rules:
+            stats = snapshot[rule.reason]
+            report.append({
+                'stage': rule.stage,
+                'rule': rule.reason,
+                'checked': stats['checked'],
+                'rejected': stats['rejected'],
+                'total_ms': round(stats['seconds'] * 1000, 3),
+                'avg_ms': round(stats['seconds'] * 1000 / stats['checked'], 4) if stats['checked'] else 0.0
+            })
+        return report
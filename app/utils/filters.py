@@ -6,22 +6,16 @@
 import re
 from urllib.parse import urlparse
 import os
-import datetime
-import opencc
+import atexit
+import threading
+
+from app.utils.keyword_matcher import KeywordFileMatcher
+from app.utils.gfwlist import load_rule_set
+from app.utils.traditional_chinese import contains_traditional_chinese
+from app.utils.filter_log import FilterEventLogger, DEFAULT_MAX_BYTES
 
 # --- 1. 初始化与配置 ---
-# OpenCC 多引擎
-OPENCC_CONVERTERS = []
-try:
-    configs = ['t2s', 'tw2s', 'hk2s']
-    for config in configs:
-        OPENCC_CONVERTERS.append(opencc.OpenCC(config))
-    OPENCC_AVAILABLE = True
-    print(f"✓ OpenCC 多引擎繁体检测系统 ({len(OPENCC_CONVERTERS)}个引擎) 加载成功。")
-except Exception as e:
-    OPENCC_CONVERTERS = []
-    OPENCC_AVAILABLE = False
-    print(f"⚠️ 警告: OpenCC 加载失败 ({e})。")
+# 繁体检测见 traditional_chinese 模块（OpenCC 按需加载）
 
 # 路径配置
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
@@ -31,9 +25,11 @@ TEXT_BLACKLIST_FILE = os.path.join(GFWLIST_DIR, 'text_list.txt')
 LOG_DIR = os.path.join(GFWLIST_DIR, 'logs')
 
 # 状态变量 (仅用于需要缓存的大文件)
-BLACKLISTED_DOMAINS = set()
+GFW_RULES = None
 GFWLIST_LOADED = False
-LOG_FILE_PATH = None
+_gfwlist_lock = threading.Lock()
+KEYWORD_MATCHER = KeywordFileMatcher(TEXT_BLACKLIST_FILE)
+FILTER_LOGGER = FilterEventLogger(LOG_DIR)
 
 # TLD 白名单 和 静态文件后缀
 ALLOWED_TLDS = {'.com', '.cn', '.org', '.com.cn', '.gov', '.gov.cn', '.net'}
@@ -45,13 +41,6 @@ def contains_chinese(text):
     if not text: return False
     return bool(re.search(r'[\u4e00-\u9fa5]', text))
 
-def contains_traditional_chinese(text):
-    if not text or not OPENCC_AVAILABLE: return False
-    for converter in OPENCC_CONVERTERS:
-        if converter.convert(text) != text:
-            return True
-    return False
-
 def is_static_url(url):
     try:
         path = urlparse(url).path
@@ -61,31 +50,15 @@ def is_static_url(url):
 
 def contains_blacklisted_keyword(text):
     """
-    动态检查：每次调用都重新读取 text_list.txt，确保规则实时生效。
+    实时检查：text_list.txt 编译为多模式自动机，文件变化后自动重建，确保规则实时生效。
     """
     if not text:
         return False
-    try:
-        # 每次都重新打开并读取文件，确保实时性
-        with open(TEXT_BLACKLIST_FILE, 'r', encoding='utf-8') as f:
-            for line in f:
-                keyword = line.strip()
-                # 确保关键词非空且不是注释，然后检查是否在文本中
-                if keyword and not keyword.startswith('!') and keyword in text:
-                    return True # 只要找到一个匹配就立即返回
-        return False # 遍历完文件都未找到
-    except FileNotFoundError:
-        # 只有在第一次找不到文件时打印警告，避免刷屏
-        if not hasattr(contains_blacklisted_keyword, 'warned_not_found'):
-            print(f"⚠️ 警告: 关键词黑名单 {TEXT_BLACKLIST_FILE} 未找到，该过滤规则将跳过。")
-            contains_blacklisted_keyword.warned_not_found = True
-        return False
-    except Exception as e:
-        # 只有在第一次发生读取错误时打印警告
-        if not hasattr(contains_blacklisted_keyword, 'warned_error'):
-            print(f"❌ 读取关键词黑名单时发生错误: {e}")
-            contains_blacklisted_keyword.warned_error = True
-        return False
+    return KEYWORD_MATCHER.match(text) is not None
+
+def get_keyword_hit_stats():
+    """返回关键词黑名单中每个关键词的命中次数"""
+    return KEYWORD_MATCHER.get_stats()
 
 # --- 3. 黑名单与白名单加载与检查 ---
 def is_tld_whitelisted(url):
@@ -97,64 +70,52 @@ def is_tld_whitelisted(url):
         return False
 
 def load_gfwlist_blacklist():
-    global BLACKLISTED_DOMAINS, GFWLIST_LOADED
-    if GFWLIST_LOADED: return
-    print(f"🔌 正在加载 GFWList 域名黑名单: {BLACKLIST_FILE}")
-    try:
-        with open(BLACKLIST_FILE, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('!') and not line.startswith('['):
-                    domain = ''
-                    if line.startswith('||'): domain = re.sub(r'[/^*].*$', '', line[2:])
-                    elif line.startswith('|http'):
-                        try: domain = urlparse(line[1:]).netloc
-                        except Exception: continue
-                    else: domain = re.sub(r'[/^*].*$', '', re.sub(r'^[.@]*', '', line))
-                    if domain and '.' in domain: BLACKLISTED_DOMAINS.add(domain)
-        GFWLIST_LOADED = True
-        print(f"✓ GFWList 加载成功，共 {len(BLACKLISTED_DOMAINS)} 条规则。")
-    except FileNotFoundError:
-        print(f"⚠️ 警告: GFWList 黑名单文件 {BLACKLIST_FILE} 未找到。")
-    except Exception as e:
-        print(f"❌ 加载 GFWList 时发生错误: {e}")
+    """加载（必要时编译）GFWList 规则集；并发首次调用时只加载一次，加载失败时下次调用重试"""
+    global GFW_RULES, GFWLIST_LOADED
+    if GFWLIST_LOADED: return GFW_RULES
+    with _gfwlist_lock:
+        if GFWLIST_LOADED: return GFW_RULES
+        print(f"🔌 正在加载 GFWList 域名黑名单: {BLACKLIST_FILE}")
+        try:
+            GFW_RULES, from_snapshot = load_rule_set(BLACKLIST_FILE)
+            source = '快照' if from_snapshot else '规则文件'
+            print(f"✓ GFWList 加载成功（{source}），共 {GFW_RULES.rule_count} 条规则。")
+            # 只有加载成功才标记，失败时下次调用重新尝试
+            GFWLIST_LOADED = True
+        except FileNotFoundError:
+            print(f"⚠️ 警告: GFWList 黑名单文件 {BLACKLIST_FILE} 未找到。")
+        except Exception as e:
+            print(f"❌ 加载 GFWList 时发生错误: {e}")
+    return GFW_RULES
 
 def is_domain_blacklisted(url):
-    if not GFWLIST_LOADED: load_gfwlist_blacklist()
-    if not url or not BLACKLISTED_DOMAINS: return None
-    try:
-        domain = urlparse(url).netloc
-        if not domain: return None
-        parts = domain.split('.')
-        for i in range(len(parts)):
-            sub_domain = '.'.join(parts[i:])
-            if sub_domain in BLACKLISTED_DOMAINS:
-                return sub_domain
-        return None
-    except Exception:
-        return None
+    """返回命中的 GFWList 规则，未命中（或命中 @@ 例外规则）返回 None"""
+    rules = load_gfwlist_blacklist()
+    if not url or rules is None: return None
+    return rules.match(url)
+
+def check_urls_blacklisted(urls):
+    """批量检查 URL，返回 {url: 命中的规则或 None}"""
+    rules = load_gfwlist_blacklist()
+    return {url: (rules.match(url) if rules is not None and url else None) for url in urls}
 
 # --- 4. 日志 ---
-def _get_log_file_path():
-    global LOG_FILE_PATH
-    if LOG_FILE_PATH: return LOG_FILE_PATH
-    os.makedirs(LOG_DIR, exist_ok=True)
-    date_str = datetime.datetime.now().strftime('%Y_%m_%d')
-    sequence = 1
-    while True:
-        filename = f"{date_str}_{sequence:02d}_gfw_logs.txt"
-        path = os.path.join(LOG_DIR, filename)
-        if not os.path.exists(path):
-            LOG_FILE_PATH = path
-            return path
-        sequence += 1
+def configure_filter_log(config):
+    """根据配置更新过滤日志的格式（text / json）和单个文件的大小上限"""
+    FILTER_LOGGER.configure(
+        log_format=config.get('filter_log_format', 'text'),
+        max_bytes=config.get('filter_log_max_bytes', DEFAULT_MAX_BYTES)
+    )
 
 def log_filtered_event(url, reason, detail):
-    try:
-        log_path = _get_log_file_path()
-        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        log_message = f"[{timestamp}] Blocked URL: {url} | Reason: {reason} | Detail: {detail}\n"
-        with open(log_path, 'a', encoding='utf-8') as f:
-            f.write(log_message)
-    except Exception as e:
-        print(f"❌ 写入过滤日志时发生错误: {e}")
+    """记录被过滤的链接，由后台线程批量写入 gfwlist/logs"""
+    FILTER_LOGGER.log(url, reason, detail)
+
+def get_filter_log_stats():
+    """返回过滤日志的当前文件和写入情况"""
+    return FILTER_LOGGER.get_stats()
+
+@atexit.register
+def close_filter_log():
+    """应用退出时写完剩余的过滤日志"""
+    FILTER_LOGGER.close()
@@ -0,0 +1,182 @@
+"""GFWList 规则引擎
+
+把 AdBlock 格式的 gfwlist/list.txt 编译为可快速查询的规则集：
+- 域名锚点（||example.com、.example.com、example.com）存入按标签倒序的字典树，
+  查询时沿主机名从顶级域向下走一遍即可
+- |http://... 前缀规则、带路径的规则挂在对应主机的节点上，主机命中后再匹配 URL
+- 主机名含通配符的规则和 /正则/ 规则单独列出，逐条匹配（数量很少）
+- @@ 开头的例外规则同样编译，命中例外时不视为黑名单
+
+编译结果保存为二进制快照（list.txt.snapshot），规则文件未变化时启动直接加载快照，
+不再解析文本。
+"""
+
+import os
+import re
+import pickle
+from urllib.parse import urlparse
+
+# 快照格式版本，编译逻辑变化时递增
+SNAPSHOT_VERSION = 1
+
+# 字典树节点中存放规则条目的键（主机名标签不会为空）
+_ENTRIES = ''
+
+
+def _wildcard_to_regex(pattern):
+    """AdBlock 通配符（* 和分隔符 ^）转为正则"""
+    parts = []
+    for char in pattern:
+        if char == '*':
+            parts.append('.*')
+        elif char == '^':
+            parts.append(r'(?:[^\w\-.%]|$)')
+        else:
+            parts.append(re.escape(char))
+    return ''.join(parts)
+
+
+def _compile(pattern):
+    return re.compile(pattern, re.IGNORECASE)
+
+
+def _split_host(pattern):
+    """拆出规则开头的主机名部分和剩余部分"""
+    match = re.match(r'([^/^:?]*)(.*)$', pattern)
+    return match.group(1).lower(), match.group(2)
+
+
+class GfwRuleSet:
+    """编译后的 GFWList 规则集"""
+
+    def __init__(self):
+        self.trie = {}
+        # 逐条匹配的规则：(是否例外, 编译后的正则, 原始规则)
+        self.generic = []
+        self.rule_count = 0
+
+    # --- 编译 ---
+    def _add_host_entry(self, host, entry):
+        node = self.trie
+        for label in reversed(host.strip('.').split('.')):
+            node = node.setdefault(label, {})
+        node.setdefault(_ENTRIES, []).append(entry)
+
+    def add_rule(self, line):
+        """编译一条规则，无法识别的规则忽略"""
+        rule = line
+        exception = line.startswith('@@')
+        if exception:
+            line = line[2:]
+        if not line:
+            return
+
+        try:
+            if line.startswith('/') and line.endswith('/') and len(line) > 2:
+                self.generic.append((exception, _compile(line[1:-1]), rule))
+            elif line.startswith('||'):
+                host, rest = _split_host(line[2:])
+                url_regex = _compile(r'^[\w\-]+:/+(?:[^/]+\.)?' + _wildcard_to_regex(line[2:]))
+                if '*' in host or not host:
+                    self.generic.append((exception, url_regex, rule))
+                else:
+                    # (是否例外, 是否要求主机完全一致, URL 正则, 原始规则)
+                    self._add_host_entry(host, (exception, False, url_regex if rest.strip('^/') else None, rule))
+            elif line.startswith('|'):
+                pattern = line[1:]
+                url_regex = _compile('^' + _wildcard_to_regex(pattern))
+                host_part = pattern.split('://', 1)[1].split('/', 1)[0] if '://' in pattern else ''
+                if not host_part or '*' in host_part:
+                    self.generic.append((exception, url_regex, rule))
+                else:
+                    self._add_host_entry(urlparse(pattern).hostname or host_part, (exception, True, url_regex, rule))
+            else:
+                host, rest = _split_host(line.lstrip('.'))
+                if '*' in host or '.' not in host:
+                    self.generic.append((exception, _compile(_wildcard_to_regex(line)), rule))
+                elif rest:
+                    # 带路径或端口的普通规则：主机命中后在 URL 中查找
+                    self._add_host_entry(host, (exception, False, _compile(_wildcard_to_regex(line.lstrip('.'))), rule))
+                else:
+                    self._add_host_entry(host, (exception, False, None, rule))
+        except re.error:
+            return
+        self.rule_count += 1
+
+    @classmethod
+    def parse(cls, path):
+        rule_set = cls()
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('!') and not line.startswith('['):
+                    rule_set.add_rule(line)
+        return rule_set
+
+    # --- 查询 ---
+    def match(self, url):
+        """返回命中的黑名单规则；未命中或命中例外规则时返回 None"""
+        if not url:
+            return None
+        try:
+            host = (urlparse(url).hostname or '').strip('.')
+        except ValueError:
+            return None
+        if not host:
+            return None
+
+        blocked = None
+        labels = host.split('.')
+        node = self.trie
+        last = len(labels) - 1
+        for depth, label in enumerate(reversed(labels)):
+            node = node.get(label)
+            if node is None:
+                break
+            for exception, exact, url_regex, rule in node.get(_ENTRIES, ()):
+                if exact and depth != last:
+                    continue
+                if url_regex is not None and not url_regex.search(url):
+                    continue
+                if exception:
+                    return None
+                if blocked is None:
+                    blocked = rule
+
+        for exception, regex, rule in self.generic:
+            if (exception or blocked is None) and regex.search(url):
+                if exception:
+                    return None
+                blocked = rule
+        return blocked
+
+
+def _source_signature(path):
+    stat = os.stat(path)
+    return (SNAPSHOT_VERSION, stat.st_size, stat.st_mtime_ns)
+
+
+def load_rule_set(path, snapshot_path=None):
+    """加载规则集：快照与规则文件一致时直接读取快照，否则重新编译并写入快照"""
+    snapshot_path = snapshot_path or f'{path}.snapshot'
+    signature = _source_signature(path)
+
+    try:
+        with open(snapshot_path, 'rb') as f:
+            saved_signature, rule_set = pickle.load(f)
+        if saved_signature == signature:
+            return rule_set, True
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"⚠️ GFWList 快照无法读取，将重新编译: {e}")
+
+    rule_set = GfwRuleSet.parse(path)
+    try:
+        temp_path = f'{snapshot_path}.tmp'
+        with open(temp_path, 'wb') as f:
+            pickle.dump((signature, rule_set), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, snapshot_path)
+    except Exception as e:
+        print(f"⚠️ 写入 GFWList 快照失败: {e}")
+    return rule_set, False
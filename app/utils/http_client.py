@@ -0,0 +1,125 @@
+"""共享 HTTP 客户端
+
+所有 Gemini 接口请求都经由这里发出：
+- 按 scheme + host 复用 requests.Session，保持长连接，避免每次请求重新握手
+- 连接池大小与流水线并发匹配，多线程共享同一个连接池
+- 统一的默认超时（连接超时 + 读取超时），调用方仍可按请求覆盖
+- 传输层重试：连接失败（请求尚未发出）按退避自动重试；代理/网关返回的 502/503/504
+  只对 GET 重试。POST（生成内容、图像）在上游可能已经完成，重发会被重复计费，
+  其 5xx 交给自适应并发限制和调用方处理；读取超时同样不重试
+"""
+
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 默认超时：(连接超时, 读取超时)，单位秒
+DEFAULT_TIMEOUT = (10, 60)
+
+# 每个主机的连接池大小（与 LLM/图片阶段线程池的总并发相当）
+POOL_MAXSIZE = 16
+
+# 传输层重试
+TRANSPORT_RETRIES = 2
+TRANSPORT_BACKOFF = 0.5
+RETRY_STATUS_CODES = (502, 503, 504)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class _Retry(Retry):
+    # 429 交给调用方处理（密钥池会切换到其他密钥），传输层只按 Retry-After 重试 503
+    RETRY_AFTER_STATUS_CODES = frozenset([503])
+
+
+def _build_session():
+    """创建带连接池和重试策略的 Session"""
+    retry = _Retry(
+        total=TRANSPORT_RETRIES,
+        connect=TRANSPORT_RETRIES,
+        read=0,
+        status=TRANSPORT_RETRIES,
+        backoff_factor=TRANSPORT_BACKOFF,
+        status_forcelist=RETRY_STATUS_CODES,
+        # 按状态码重试只用于幂等请求；连接失败的重试不受此限制
+        allowed_methods=frozenset(['GET']),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    # 接口调用不需要 Cookie，禁用后多线程共享 Session 更安全
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    return session
+
+
+def get_session(url):
+    """获取 url 所属主机的共享 Session（按需创建）"""
+    parts = urlsplit(url)
+    key = f'{parts.scheme}://{parts.netloc}'.lower()
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _build_session()
+            _sessions[key] = session
+        return session
+
+
+def request(method, url, timeout=None, **kwargs):
+    """通过共享连接池发送请求，未指定 timeout 时使用 DEFAULT_TIMEOUT"""
+    if timeout is None:
+        timeout = DEFAULT_TIMEOUT
+    return get_session(url).request(method, url, timeout=timeout, **kwargs)
+
+
+def release_on_close(response, callback):
+    """流式响应读取完毕（内容迭代结束）或关闭时调用一次 callback
+
+    用于在整个流式传输期间占用并发名额，而不是收到响应头时就归还。
+    """
+    lock = threading.Lock()
+    state = {'released': False}
+    original_close = response.close
+    original_iter_content = response.iter_content
+
+    def release():
+        with lock:
+            if state['released']:
+                return
+            state['released'] = True
+        callback()
+
+    def close():
+        try:
+            original_close()
+        finally:
+            release()
+
+    def iter_content(*args, **kwargs):
+        try:
+            yield from original_iter_content(*args, **kwargs)
+        finally:
+            release()
+
+    response.close = close
+    response.iter_content = iter_content
+    return response
+
+
+def get(url, **kwargs):
+    """GET 请求"""
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    """POST 请求"""
+    return request('POST', url, **kwargs)
+
@@ -0,0 +1,144 @@
+"""多模式关键词匹配
+
+把关键词黑名单编译为 Aho-Corasick 自动机，一次扫描文本即可判断是否命中
+任意关键词，匹配时不再读取文件：
+- KeywordAutomaton: 由关键词列表构建的不可变自动机
+- KeywordFileMatcher: 从规则文件加载自动机，文件的 mtime/inode/大小变化时
+  重新构建并整体替换，规则修改后实时生效；同时统计每个关键词的命中次数
+"""
+
+import os
+import time
+import threading
+from collections import deque
+
+# 两次检查规则文件是否变化的最小间隔（秒）
+RELOAD_CHECK_INTERVAL = 1.0
+
+
+class KeywordAutomaton:
+    """Aho-Corasick 自动机"""
+
+    def __init__(self, keywords):
+        self.keywords = list(dict.fromkeys(k for k in keywords if k))
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [-1]  # 节点（含失败链）上最先结束的关键词下标，-1 表示无
+
+        for index, keyword in enumerate(self.keywords):
+            node = 0
+            for char in keyword:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(-1)
+                node = next_node
+            if self._output[node] == -1:
+                self._output[node] = index
+
+        # 按层构建失败指针
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                if self._output[child] == -1:
+                    self._output[child] = self._output[self._fail[child]]
+
+    def find_first(self, text):
+        """返回文本中最先出现（结束位置最靠前）的关键词，未命中返回 None"""
+        if not text or not self.keywords:
+            return None
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node] != -1:
+                return self.keywords[output[node]]
+        return None
+
+
+class KeywordFileMatcher:
+    """基于规则文件的关键词匹配器，文件变化后自动重建自动机"""
+
+    def __init__(self, path, comment_prefix='!'):
+        self.path = path
+        self.comment_prefix = comment_prefix
+        self._lock = threading.Lock()
+        self._automaton = KeywordAutomaton([])
+        self._signature = None
+        self._checked_at = 0.0
+        self._hits = {}
+        self._missing_warned = False
+
+    def _file_signature(self):
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+
+    def _load(self, signature):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            keywords = [
+                line.strip() for line in f
+                if line.strip() and not line.strip().startswith(self.comment_prefix)
+            ]
+        automaton = KeywordAutomaton(keywords)
+        # 整体替换，匹配中的线程继续使用旧自动机
+        self._automaton = automaton
+        self._signature = signature
+        print(f"✓ 关键词黑名单已加载: {len(automaton.keywords)} 个关键词")
+
+    def refresh(self, force=False):
+        """检查规则文件是否变化，变化时重建自动机"""
+        now = time.monotonic()
+        if not force and now - self._checked_at < RELOAD_CHECK_INTERVAL:
+            return
+        with self._lock:
+            if not force and now - self._checked_at < RELOAD_CHECK_INTERVAL:
+                return
+            self._checked_at = now
+            try:
+                signature = self._file_signature()
+                if force or signature != self._signature:
+                    self._load(signature)
+                self._missing_warned = False
+            except FileNotFoundError:
+                if self._signature is not None or not self._missing_warned:
+                    print(f"⚠️ 警告: 关键词黑名单 {self.path} 未找到，该过滤规则将跳过。")
+                self._automaton = KeywordAutomaton([])
+                self._signature = None
+                self._missing_warned = True
+            except Exception as e:
+                print(f"❌ 读取关键词黑名单时发生错误: {e}")
+
+    def match(self, text):
+        """返回命中的关键词，未命中返回 None"""
+        self.refresh()
+        keyword = self._automaton.find_first(text)
+        if keyword is not None:
+            with self._lock:
+                self._hits[keyword] = self._hits.get(keyword, 0) + 1
+        return keyword
+
+    def get_stats(self):
+        """返回关键词数量和每个关键词的命中次数（按次数降序）"""
+        self.refresh()
+        automaton = self._automaton
+        with self._lock:
+            hits = dict(self._hits)
+        return {
+            'path': self.path,
+            'keyword_count': len(automaton.keywords),
+            'hits': dict(sorted(
+                ((keyword, hits.get(keyword, 0)) for keyword in automaton.keywords),
+                key=lambda item: -item[1]
+            ))
+        }
@@ -8,21 +8,56 @@ import os
 
 from urllib.parse import urlparse
 
-def fetch_real_url_and_title(redirect_url, timeout=10):
+from app.utils.site_cache import get_site_name, put_site_name, get_resolved_url, put_resolved_url, domain_lock
+
+
+def _fetch_homepage_site_name(parsed_url, headers):
+    """请求站点主页并返回清洗后的网站名称，失败时返回空字符串"""
+    site_name = ''
+    try:
+        homepage_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
+        homepage_response = requests.get(homepage_url, headers=headers, timeout=5) # 较短的超时
+        if homepage_response.ok:
+            homepage_soup = BeautifulSoup(homepage_response.content, 'html.parser')
+            if homepage_soup.title and homepage_soup.title.string:
+                site_name = homepage_soup.title.string.strip()
+                # 清理主页标题，可能包含 "首页" 等词
+                for keyword in ['首页', '官网', 'Official Website', '官方网站']:
+                    site_name = site_name.replace(keyword, '').strip(' -|_—')
+    except Exception as e:
+        print(f"  ...获取主页标题失败 ({e})，将回退到备选方案")
+    return site_name
+
+
+def fetch_real_url_and_title(redirect_url, timeout=10, url_filter=None):
     """
     获取重定向链接的真实 URL、页面标题、网站名称和语言。
     优先从站点主页获取网站名称，以获得最高准确性。
+
+    解析结果按跳转链接缓存，网站名称按域名缓存，同一站点的主页只请求一次。
+    url_filter(real_url) 返回 False 时不再下载文章页和主页，直接返回
+    (real_url, '', '', 'unknown')，该结果不写入缓存。
     """
+    cached = get_resolved_url(redirect_url)
+    if cached is not None:
+        if url_filter is not None and not url_filter(cached[0]):
+            return cached[0], '', '', 'unknown'
+        return cached
+
     try:
         # --- 步骤 1: 获取文章页信息 ---
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Accept-Language': 'zh-CN,zh;q=0.9'
         }
-        article_response = requests.get(redirect_url, headers=headers, timeout=timeout, allow_redirects=True)
+        # 先只读取响应头，得到真实 URL 后再决定是否下载正文
+        article_response = requests.get(redirect_url, headers=headers, timeout=timeout, allow_redirects=True, stream=True)
         article_response.raise_for_status()
 
         real_url = article_response.url
+        if url_filter is not None and not url_filter(real_url):
+            article_response.close()
+            return real_url, '', '', 'unknown'
         article_soup = BeautifulSoup(article_response.content, 'html.parser')
 
         # 初始化返回值
@@ -37,19 +72,14 @@ def fetch_real_url_and_title(redirect_url, timeout=10):
             article_title = article_soup.title.string.strip()
 
         # --- 步骤 2: 从主页获取网站名称 (用户建议的绝佳方案) ---
-        try:
-            parsed_url = urlparse(real_url)
-            homepage_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
-            homepage_response = requests.get(homepage_url, headers=headers, timeout=5) # 较短的超时
-            if homepage_response.ok:
-                homepage_soup = BeautifulSoup(homepage_response.content, 'html.parser')
-                if homepage_soup.title and homepage_soup.title.string:
-                    site_name = homepage_soup.title.string.strip()
-                    # 清理主页标题，可能包含 "首页" 等词
-                    for keyword in ['首页', '官网', 'Official Website', '官方网站']:
-                        site_name = site_name.replace(keyword, '').strip(' -|_—')
-        except Exception as e:
-            print(f"  ...获取主页标题失败 ({e})，将回退到备选方案")
+        parsed_url = urlparse(real_url)
+        with domain_lock(parsed_url.netloc):
+            cached_site_name = get_site_name(parsed_url.netloc)
+            if cached_site_name is not None:
+                site_name = cached_site_name
+            else:
+                site_name = _fetch_homepage_site_name(parsed_url, headers)
+                put_site_name(parsed_url.netloc, site_name)
 
         # --- 步骤 3: 备选方案 (如果主页获取失败) ---
         if not site_name:
@@ -76,7 +106,9 @@ def fetch_real_url_and_title(redirect_url, timeout=10):
             if separator in article_title:
                 article_title = article_title.split(separator)[0].strip()
 
-        return real_url, article_title, site_name, lang
+        result = (real_url, article_title, site_name, lang)
+        put_resolved_url(redirect_url, result)
+        return result
 
     except requests.exceptions.RequestException as e:
         print(f"Error fetching URL {redirect_url}: {e}")
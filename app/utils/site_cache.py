@@ -0,0 +1,196 @@
+"""引用来源解析缓存
+
+fetch_real_url_and_title 会为每条引用下载并解析站点主页，只为读取网站名称；
+同一站点（people.com.cn、sina.com.cn 等）在不同文章中反复出现。这里缓存：
+- 按域名缓存清洗后的网站名称（主页没有可用标题时缓存空值，有效期较短）
+- 按跳转链接缓存解析结果（真实 URL、标题、网站名、语言）
+
+内存层之外同时写入 SQLite（site_cache.db），服务重启后仍可命中；内存层按
+最近使用淘汰，最多保留 MEMORY_ENTRIES 条，淘汰的条目仍可从 SQLite 读回。
+"""
+
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from app.config import SITE_CACHE_FILE
+
+# 网站名称有效期；主页无可用标题或请求失败时的空值有效期
+SITE_NAME_TTL = 30 * 24 * 3600
+SITE_NAME_EMPTY_TTL = 6 * 3600
+# 跳转链接解析结果有效期
+RESOLVED_URL_TTL = 7 * 24 * 3600
+# 网站名称和跳转链接两个内存层各自保留的最大条数
+MEMORY_ENTRIES = 2048
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS site_names (
+    domain TEXT PRIMARY KEY,
+    site_name TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS resolved_urls (
+    redirect_url TEXT PRIMARY KEY,
+    real_url TEXT NOT NULL,
+    title TEXT NOT NULL,
+    site_name TEXT NOT NULL,
+    lang TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+"""
+
+_cache_lock = threading.Lock()
+_connection = None
+_site_names = OrderedDict()      # domain -> (site_name, fetched_at)
+_resolved_urls = OrderedDict()   # redirect_url -> ((real_url, title, site_name, lang), fetched_at)
+_domain_locks = {}    # domain -> [Lock, 使用者数]，同一域名的主页只请求一次；无人使用时删除
+
+
+def _get_connection():
+    """获取（必要时初始化）缓存数据库连接，调用方需持有 _cache_lock"""
+    global _connection
+    if _connection is None:
+        directory = os.path.dirname(os.path.abspath(SITE_CACHE_FILE))
+        os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(SITE_CACHE_FILE, check_same_thread=False, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(_SCHEMA)
+        _connection = conn
+    return _connection
+
+
+def _site_name_fresh(site_name, fetched_at, now):
+    return now - fetched_at <= (SITE_NAME_TTL if site_name else SITE_NAME_EMPTY_TTL)
+
+
+def _remember_locked(memory, key, entry):
+    """写入内存层并淘汰最久未使用的条目，调用方需持有 _cache_lock"""
+    memory[key] = entry
+    memory.move_to_end(key)
+    while len(memory) > MEMORY_ENTRIES:
+        memory.popitem(last=False)
+
+
+@contextmanager
+def domain_lock(domain):
+    """持有域名对应的锁，并发解析同一站点时只有一个线程请求主页
+
+    锁按使用者计数，最后一个使用者退出后即删除，不随访问过的域名数增长。
+    """
+    with _cache_lock:
+        entry = _domain_locks.get(domain)
+        if entry is None:
+            entry = _domain_locks[domain] = [threading.Lock(), 0]
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _cache_lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _domain_locks[domain]
+
+
+def get_site_name(domain):
+    """读取缓存的网站名称；未命中或已过期返回 None，空字符串表示主页没有可用名称"""
+    now = time.time()
+    with _cache_lock:
+        entry = _site_names.get(domain)
+        if entry is None:
+            try:
+                entry = _get_connection().execute(
+                    'SELECT site_name, fetched_at FROM site_names WHERE domain = ?', (domain,)
+                ).fetchone()
+            except Exception as e:
+                print(f"⚠️  站点缓存读取失败: {e}")
+                entry = None
+            if entry is not None:
+                _remember_locked(_site_names, domain, tuple(entry))
+        else:
+            _site_names.move_to_end(domain)
+        if entry is None or not _site_name_fresh(entry[0], entry[1], now):
+            return None
+        return entry[0]
+
+
+def put_site_name(domain, site_name):
+    """写入网站名称（可以是空字符串）"""
+    now = time.time()
+    with _cache_lock:
+        _remember_locked(_site_names, domain, (site_name, now))
+        try:
+            _get_connection().execute(
+                'INSERT OR REPLACE INTO site_names (domain, site_name, fetched_at) VALUES (?, ?, ?)',
+                (domain, site_name, now)
+            )
+        except Exception as e:
+            print(f"⚠️  站点缓存写入失败: {e}")
+
+
+def get_resolved_url(redirect_url):
+    """读取跳转链接的解析结果 (real_url, title, site_name, lang)，未命中返回 None"""
+    now = time.time()
+    with _cache_lock:
+        entry = _resolved_urls.get(redirect_url)
+        if entry is None:
+            try:
+                row = _get_connection().execute(
+                    'SELECT real_url, title, site_name, lang, fetched_at FROM resolved_urls WHERE redirect_url = ?',
+                    (redirect_url,)
+                ).fetchone()
+            except Exception as e:
+                print(f"⚠️  站点缓存读取失败: {e}")
+                row = None
+            if row is not None:
+                entry = (tuple(row[:4]), row[4])
+                _remember_locked(_resolved_urls, redirect_url, entry)
+        else:
+            _resolved_urls.move_to_end(redirect_url)
+        if entry is None or now - entry[1] > RESOLVED_URL_TTL:
+            return None
+        return entry[0]
+
+
+def put_resolved_url(redirect_url, result):
+    """写入跳转链接的解析结果"""
+    now = time.time()
+    with _cache_lock:
+        _remember_locked(_resolved_urls, redirect_url, (tuple(result), now))
+        try:
+            _get_connection().execute(
+                'INSERT OR REPLACE INTO resolved_urls (redirect_url, real_url, title, site_name, lang, fetched_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (redirect_url, *result, now)
+            )
+        except Exception as e:
+            print(f"⚠️  站点缓存写入失败: {e}")
+
+
+def prune_site_cache():
+    """删除已过期的条目，返回删除数量"""
+    now = time.time()
+    removed = 0
+    with _cache_lock:
+        for domain, (site_name, fetched_at) in list(_site_names.items()):
+            if not _site_name_fresh(site_name, fetched_at, now):
+                del _site_names[domain]
+        for redirect_url, (_, fetched_at) in list(_resolved_urls.items()):
+            if now - fetched_at > RESOLVED_URL_TTL:
+                del _resolved_urls[redirect_url]
+        try:
+            conn = _get_connection()
+            removed += conn.execute(
+                "DELETE FROM site_names WHERE fetched_at < ? OR (site_name = '' AND fetched_at < ?)",
+                (now - SITE_NAME_TTL, now - SITE_NAME_EMPTY_TTL)
+            ).rowcount
+            removed += conn.execute(
+                'DELETE FROM resolved_urls WHERE fetched_at < ?', (now - RESOLVED_URL_TTL,)
+            ).rowcount
+        except Exception as e:
+            print(f"⚠️  站点缓存清理失败: {e}")
+    return removed
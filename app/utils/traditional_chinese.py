@@ -0,0 +1,143 @@
+"""繁体中文检测
+
+原实现对每个标题、网站名依次执行 t2s、tw2s、hk2s 三次完整的 OpenCC 转换，
+并在导入时就构建三个转换器。这里改为：
+- 从 OpenCC 的字典文件预先计算“可转换字符”集合（按三个转换链的字符字典
+  逐字推算，结果与自身不同的字），单次扫描文本，遇到即返回
+- 词组字典中会按上下文转换（或保持不变）的字归为“需确认字符”，
+  只有文本包含这类字时才调用 OpenCC 做精确转换比较
+- OpenCC 转换器在第一次需要精确比较时才创建
+- 检测结果按文本做 LRU 缓存，重复出现的网站名不再重复检测
+
+结果与原来的三引擎转换比较一致。
+"""
+
+import os
+import threading
+from functools import lru_cache
+
+try:
+    import opencc
+except ImportError:
+    opencc = None
+
+# 原实现使用的三个转换配置，以及各自依次应用的字符字典
+OPENCC_CONFIGS = ['t2s', 'tw2s', 'hk2s']
+CHARACTER_CHAINS = [
+    ['TSCharacters.txt'],
+    ['TWVariantsRev.txt', 'TSCharacters.txt'],
+    ['HKVariantsRev.txt', 'TSCharacters.txt'],
+]
+PHRASE_DICTS = ['TSPhrases.txt', 'TWVariantsRevPhrases.txt', 'HKVariantsRevPhrases.txt']
+
+DETECTION_CACHE_SIZE = 4096
+
+_load_lock = threading.Lock()
+_converters = None
+_char_sets = None
+
+
+def _read_dictionary(path):
+    entries = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if '\t' in line:
+                key, values = line.rstrip('\n').split('\t', 1)
+                entries[key] = values.split(' ')
+    return entries
+
+
+def _get_char_sets():
+    """返回 (可转换字符, 需确认字符)；字典文件不可用时返回 (None, None)"""
+    global _char_sets
+    if _char_sets is not None:
+        return _char_sets
+    with _load_lock:
+        if _char_sets is not None:
+            return _char_sets
+        convertible, ambiguous = set(), set()
+        try:
+            dictionary_dir = os.path.join(os.path.dirname(opencc.__file__), 'dictionary')
+            dictionaries = {
+                name: _read_dictionary(os.path.join(dictionary_dir, name))
+                for chain in CHARACTER_CHAINS for name in chain
+            }
+            changed = {
+                key for table in dictionaries.values()
+                for key, values in table.items() if values != [key]
+            }
+
+            # 词组中按上下文转换的字，或在词组中保持不变的可转换字，需要 OpenCC 确认
+            for name in PHRASE_DICTS:
+                for key, values in _read_dictionary(os.path.join(dictionary_dir, name)).items():
+                    value = values[0]
+                    if len(key) != len(value):
+                        ambiguous.update(key)
+                        continue
+                    for source_char, target_char in zip(key, value):
+                        if source_char != target_char or source_char in changed:
+                            ambiguous.add(source_char)
+
+            # 按转换链逐字推算最终结果（如 媪 -> 媼 -> 媪 实际不变）
+            for char in changed:
+                for chain in CHARACTER_CHAINS:
+                    current = char
+                    for name in chain:
+                        values = dictionaries[name].get(current, [current])
+                        if len(values) > 1 or current in ambiguous:
+                            ambiguous.add(char)
+                        current = values[0]
+                    if current in ambiguous:
+                        ambiguous.add(char)
+                    if current != char:
+                        convertible.add(char)
+            _char_sets = (frozenset(convertible - ambiguous), frozenset(ambiguous))
+        except Exception as e:
+            print(f"⚠️ 警告: 无法读取 OpenCC 字典 ({e})，繁体检测将直接使用 OpenCC 转换。")
+            _char_sets = (None, None)
+        return _char_sets
+
+
+def _get_converters():
+    """按需创建三个 OpenCC 转换器"""
+    global _converters
+    if _converters is not None:
+        return _converters
+    with _load_lock:
+        if _converters is not None:
+            return _converters
+        try:
+            _converters = [opencc.OpenCC(config) for config in OPENCC_CONFIGS]
+            print(f"✓ OpenCC 多引擎繁体检测系统 ({len(_converters)}个引擎) 加载成功。")
+        except Exception as e:
+            print(f"⚠️ 警告: OpenCC 加载失败 ({e})。")
+            _converters = []
+        return _converters
+
+
+@lru_cache(maxsize=DETECTION_CACHE_SIZE)
+def _detect(text):
+    convertible, ambiguous = _get_char_sets()
+    if convertible is not None:
+        need_exact = False
+        for char in text:
+            if char in convertible:
+                return True
+            if char in ambiguous:
+                need_exact = True
+        if not need_exact:
+            return False
+    return any(converter.convert(text) != text for converter in _get_converters())
+
+
+def contains_traditional_chinese(text):
+    """文本中是否含有繁体字（任一 OpenCC 转换会改变文本即视为繁体）"""
+    if not text or opencc is None:
+        return False
+    return _detect(text)
+
+
+def get_detection_cache_info():
+    """返回检测缓存的命中情况"""
+    info = _detect.cache_info()
+    return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'max_size': info.maxsize}
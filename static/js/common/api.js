@@ -16,12 +16,16 @@ class API {
      */
     async request(url, options = {}) {
         const config = {
-            headers: { ...this.defaultHeaders, ...options.headers },
-            ...options
+            ...options,
+            headers: { ...this.defaultHeaders, ...options.headers }
         };
 
         try {
             const response = await fetch(this.baseURL + url, config);
+            // 304：资源未变化，没有响应体
+            if (response.status === 304) {
+                return null;
+            }
             const data = await response.json();
 
             if (!response.ok) {
@@ -194,14 +198,43 @@ class API {
         return this.post('/generate', { topics, topic_images: topicImages });
     }
 
-    async getGenerationStatus(taskId) {
-        return this.get(`/generate/status/${taskId}`);
+    /**
+     * 获取任务状态
+     * @param {string} taskId - 任务 ID
+     * @param {number|null} since - 已知的任务版本号；提供时只返回此后的变化，未变化时返回 null
+     */
+    async getGenerationStatus(taskId, since = null) {
+        if (since === null || since === undefined) {
+            return this.get(`/generate/status/${taskId}`);
+        }
+        return this.request(`/generate/status/${taskId}?since=${since}`, {
+            method: 'GET',
+            headers: { 'If-None-Match': `"${since}"` }
+        });
+    }
+
+    /**
+     * 订阅任务进度推送（Server-Sent Events）
+     * @param {string} taskId - 任务 ID
+     * @returns {EventSource}
+     */
+    streamGenerationStatus(taskId) {
+        return new EventSource(`${this.baseURL}/generate/stream/${taskId}`);
     }
 
     async retryFailedTopics(taskId, topics) {
         return this.post('/generate/retry', { task_id: taskId, topics });
     }
 
+    /**
+     * 取消任务；不传 topics 时取消整个批次
+     */
+    async cancelGeneration(taskId, topics = null) {
+        const payload = { task_id: taskId };
+        if (topics) payload.topics = topics;
+        return this.post('/generate/cancel', payload);
+    }
+
     // 历史记录
     async getHistory() {
         return this.get('/history');
@@ -1,6 +1,6 @@
 /**
  * 任务管理器
- * 负责文章生成任务的创建、轮询、状态更新
+ * 负责文章生成任务的创建、进度订阅（SSE 推送，不可用时回退为轮询）、状态更新
  */
 
 class TaskManager {
@@ -15,9 +15,19 @@ class TaskManager {
         this.batchActions = document.getElementById('batchActions');
         this.retryAllBtn = document.getElementById('retryAllBtn');
         this.discardAllBtn = document.getElementById('discardAllBtn');
+        this.cancelTaskBtn = document.getElementById('cancelTaskBtn');
 
         this.statusInterval = null;
         this.POLL_INTERVAL = 2000;
+        this.eventSource = null;
+        this.streamTask = null;
+        this.pollTask = null;  // 轮询时在本地合并的任务状态（配合 since 增量查询）
+        this.STAGE_LABELS = {
+            article: '正在撰写正文...',
+            images: '正在准备配图...',
+            citations: '正在整理引用...',
+            document: '正在生成 Word 文档...'
+        };
         this.hasScrolledToResults = false;
         this.discardedTopics = new Set();
         this.retryingTopics = new Set();
@@ -29,6 +39,7 @@ class TaskManager {
         this.resultsList.addEventListener('click', (e) => this.handleResultAction(e));
         if (this.retryAllBtn) this.retryAllBtn.addEventListener('click', () => this.handleRetryAll());
         if (this.discardAllBtn) this.discardAllBtn.addEventListener('click', () => this.handleDiscardAll());
+        if (this.cancelTaskBtn) this.cancelTaskBtn.addEventListener('click', () => this.handleCancelTask());
     }
 
     async startGeneration(topics, topicImageMap) {
@@ -62,6 +73,16 @@ class TaskManager {
     }
 
     startPolling(taskId) {
+        this.stopPolling();
+        this.setCancelButtonVisible(true);
+        if (window.EventSource) {
+            this.startStreaming(taskId);
+            return;
+        }
+        this.startIntervalPolling(taskId);
+    }
+
+    startIntervalPolling(taskId) {
         this.stopPolling();
         this.pollStatus(taskId); // 立即执行一次
         this.statusInterval = setInterval(() => this.pollStatus(taskId), this.POLL_INTERVAL);
@@ -72,11 +93,105 @@ class TaskManager {
             clearInterval(this.statusInterval);
             this.statusInterval = null;
         }
+        if (this.eventSource) {
+            this.eventSource.close();
+            this.eventSource = null;
+        }
+        this.streamTask = null;
+        this.pollTask = null;
+    }
+
+    /**
+     * 通过 SSE 接收增量事件；连接失败（如服务器不支持推送）时回退为轮询
+     */
+    startStreaming(taskId) {
+        const source = api.streamGenerationStatus(taskId);
+        this.eventSource = source;
+
+        const on = (event, handler) => source.addEventListener(event, (e) => {
+            if (this.eventSource !== source) return;
+            handler(JSON.parse(e.data));
+        });
+
+        on('snapshot', (task) => {
+            this.streamTask = { ...task, results: [...task.results], errors: [...task.errors] };
+            this.updateUI(this.streamTask);
+            if (task.status === 'completed') {
+                this.stopPolling();
+                this.finalizeTaskUI(task);
+            }
+        });
+        on('topic_started', (data) => this.updateTopicStage(data.topic, data.resume_stage ? `从「${this.STAGE_LABELS[data.resume_stage] || data.resume_stage}」继续...` : '开始生成...'));
+        on('stage_changed', (data) => this.updateTopicStage(data.topic, this.STAGE_LABELS[data.stage] || data.stage));
+        on('article_progress', (data) => this.updateTopicStage(data.topic, this.formatArticleProgress(data)));
+        on('topic_retrying', (data) => this.updateTopicStage(data.topic, `失败，${data.delay_seconds} 秒后第 ${data.retry_count} 次重试...`));
+        on('topic_finished', (data) => this.applyStreamEvent(task => {
+            task.results = task.results.filter(r => r.topic !== data.topic).concat(data.result);
+            task.errors = task.errors.filter(e => e.topic !== data.topic);
+        }));
+        on('topic_failed', (data) => this.applyStreamEvent(task => {
+            task.errors = task.errors.filter(e => e.topic !== data.topic).concat(data.error || { topic: data.topic, error: '', retry_count: 0 });
+        }));
+        on('topics_requeued', (data) => this.applyStreamEvent(task => {
+            task.status = 'running';
+            task.errors = task.errors.filter(e => !data.topics.includes(e.topic));
+        }));
+        on('task_completed', async () => {
+            this.stopPolling();
+            // 结束时拉取一次完整状态，包含服务端核对后的最终结果
+            await this.pollStatus(taskId);
+        });
+
+        source.onerror = () => {
+            if (this.eventSource !== source) return;
+            // CONNECTING 状态由浏览器自动重连（携带 Last-Event-ID）；CLOSED 表示无法建立推送
+            if (source.readyState === EventSource.CLOSED) {
+                console.warn('进度推送不可用，回退为轮询');
+                this.startIntervalPolling(taskId);
+            }
+        };
+    }
+
+    /**
+     * 将 since 增量响应合并到本地任务状态
+     */
+    mergeTaskDelta(previous, delta) {
+        const changed = new Set([
+            ...delta.results.map(r => r.topic),
+            ...delta.errors.map(e => e.topic),
+            ...(delta.pending_topics || [])
+        ]);
+        return {
+            ...delta,
+            results: previous.results.filter(r => !changed.has(r.topic)).concat(delta.results),
+            errors: previous.errors.filter(e => !changed.has(e.topic)).concat(delta.errors)
+        };
+    }
+
+    applyStreamEvent(mutate) {
+        if (!this.streamTask) return;
+        mutate(this.streamTask);
+        this.updateUI(this.streamTask);
+    }
+
+    updateTopicStage(topic, text) {
+        const item = this.resultsList.querySelector(`.result-item.pending[data-topic="${topic}"] .result-info`);
+        if (item) item.textContent = text;
+    }
+
+    formatArticleProgress(info) {
+        const tokens = info.output_tokens ? `，${info.output_tokens} tokens` : '';
+        return `${this.STAGE_LABELS.article} 已生成 ${info.chars} 字${tokens}`;
     }
 
     async pollStatus(taskId) {
         try {
-            const task = await api.getGenerationStatus(taskId);
+            const previous = this.pollTask && this.pollTask.task_id === taskId ? this.pollTask : null;
+            const delta = await api.getGenerationStatus(taskId, previous ? previous.version : null);
+            if (delta === null) return; // 任务未变化（304）
+
+            const task = previous ? this.mergeTaskDelta(previous, delta) : delta;
+            if (this.statusInterval) this.pollTask = task;
             this.updateUI(task);
 
             if (task.status === 'completed') {
@@ -139,6 +254,7 @@ class TaskManager {
 
         this.updateProgress(progress, `生成中... (${completedCount}/${totalCount})`);
 
+        Object.entries(task.article_progress || {}).forEach(([topic, info]) => this.updateTopicStage(topic, this.formatArticleProgress(info)));
         task.results.forEach(result => this.replacePlaceholder(result.topic, this.createSuccessItem(result)));
         filteredErrors.forEach(error => this.replacePlaceholder(error.topic, this.createErrorItem(error, this.retryingTopics.has(error.topic))));
 
@@ -153,6 +269,7 @@ class TaskManager {
     }
 
     finalizeTaskUI(task) {
+        this.setCancelButtonVisible(false);
         // --- 前端安全网机制 ---
         const processedTopics = new Set([...task.results.map(r => r.topic), ...task.errors.map(e => e.topic)]);
         const pendingItems = this.resultsList.querySelectorAll('.result-item.pending');
@@ -329,6 +446,26 @@ class TaskManager {
         }
     }
 
+    async handleCancelTask() {
+        const taskId = this.stateManager.currentTaskId;
+        if (!taskId) return;
+        if (!confirm('确定要取消所有尚未完成的主题吗？已生成的文章会保留。')) return;
+
+        this.cancelTaskBtn.disabled = true;
+        try {
+            const response = await api.cancelGeneration(taskId);
+            toast.info(response.message || '已提交取消请求');
+        } catch (error) {
+            toast.error('取消任务失败: ' + error.message);
+        } finally {
+            this.cancelTaskBtn.disabled = false;
+        }
+    }
+
+    setCancelButtonVisible(visible) {
+        if (this.cancelTaskBtn) this.cancelTaskBtn.style.display = visible ? 'inline-block' : 'none';
+    }
+
     handleDiscardAll() {
         // ... (内容未改变，为简洁省略) ...
         const failedItems = this.resultsList.querySelectorAll('.result-item.error .discard-btn');
@@ -359,6 +496,7 @@ class TaskManager {
     }
 
     resetUI() {
+        this.setCancelButtonVisible(false);
         this.hideProgress();
         this.hideResults();
         this.setGenerateButtonState(false, '开始生成');
@@ -0,0 +1,62 @@
+"""并发控制工具测试：可调整上限的信号量和取消令牌"""
+
+import threading
+
+import pytest
+
+from app.utils.concurrency import ResizableSemaphore, CancellationToken, TaskCancelledError
+
+WAIT = 5
+
+
+def test_semaphore_blocks_at_limit():
+    semaphore = ResizableSemaphore(1)
+    assert semaphore.acquire()
+    assert not semaphore.acquire(blocking=False)
+    assert not semaphore.acquire(timeout=0.01)
+    semaphore.release()
+    assert semaphore.acquire(blocking=False)
+
+
+def test_growing_limit_wakes_waiters():
+    semaphore = ResizableSemaphore(1)
+    semaphore.acquire()
+    acquired = threading.Event()
+    threading.Thread(target=lambda: semaphore.acquire() and acquired.set(), daemon=True).start()
+    assert not acquired.wait(0.1)
+
+    semaphore.resize(2)
+    assert acquired.wait(WAIT)
+    assert semaphore.in_use == 2
+
+
+def test_shrinking_limit_keeps_holders_and_blocks_new_acquires():
+    semaphore = ResizableSemaphore(3)
+    for _ in range(3):
+        semaphore.acquire()
+    semaphore.resize(1)
+    assert semaphore.limit == 1
+    assert semaphore.in_use == 3
+
+    semaphore.release()
+    semaphore.release()
+    assert not semaphore.acquire(blocking=False)
+    semaphore.release()
+    assert semaphore.acquire(blocking=False)
+
+
+def test_release_without_acquire_raises():
+    semaphore = ResizableSemaphore(1)
+    with pytest.raises(ValueError):
+        semaphore.release()
+
+
+def test_cancellation_token_interrupts_sleep():
+    token = CancellationToken()
+    token.raise_if_cancelled()
+    threading.Timer(0.05, token.cancel).start()
+    with pytest.raises(TaskCancelledError):
+        token.sleep(WAIT)
+    assert token.cancelled
+    with pytest.raises(TaskCancelledError):
+        token.raise_if_cancelled()
@@ -0,0 +1,117 @@
+"""自适应并发限制测试：AIMD 上限调整，以及流式响应在读取完毕或关闭前占用名额"""
+
+import io
+
+import pytest
+import requests
+
+from app.services import gemini_limiter
+from app.services.gemini_limiter import AdaptiveLimiter
+from app.utils import http_client
+
+
+def _stream_response(body=b'data: {"a": 1}\n\ndata: {"b": 2}\n', status_code=200):
+    response = requests.Response()
+    response.status_code = status_code
+    response.raw = io.BytesIO(body)
+    return response
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    """替换 text 类接口的限制器，并让 http_client.request 返回预设的响应"""
+    limiter = AdaptiveLimiter('text', initial=4, min_limit=1, max_limit=16)
+    monkeypatch.setattr(gemini_limiter, '_limiters', {'text': limiter})
+    responses = []
+    monkeypatch.setattr(http_client, 'request', lambda method, url, **kwargs: responses.pop(0))
+    limiter.responses = responses
+    return limiter
+
+
+# --- AIMD ---
+def test_concurrent_throttles_decrease_limit_once_per_round():
+    limiter = AdaptiveLimiter('text', initial=8)
+    tickets = [limiter.acquire() for _ in range(4)]
+    for ticket in tickets:
+        limiter.release(ticket, 429)
+    assert limiter.limit == 4
+    assert limiter.stats['decreases'] == 1
+    assert limiter.stats['throttled'] == 4
+
+    # 下调之后才开始的请求再次被限流时继续下调
+    limiter.release(limiter.acquire(), 429)
+    assert limiter.limit == 2
+
+
+def test_server_errors_decrease_limit_gently():
+    limiter = AdaptiveLimiter('text', initial=10)
+    limiter.release(limiter.acquire(), 500)
+    assert limiter.limit == pytest.approx(10 * gemini_limiter.ERROR_DECREASE_FACTOR)
+
+
+def test_limit_never_drops_below_minimum():
+    limiter = AdaptiveLimiter('text', initial=2, min_limit=2)
+    limiter.release(limiter.acquire(), 429)
+    assert limiter.limit == 2
+
+
+def test_saturated_successes_increase_limit_by_about_one_per_round():
+    limiter = AdaptiveLimiter('text', initial=2, max_limit=16)
+    tickets = [limiter.acquire() for _ in range(2)]
+    for ticket in tickets:
+        limiter.release(ticket, 200, measure_latency=False)
+    # 第一个请求开始时未用满并发，只有第二个请求计入增长
+    assert limiter.limit == pytest.approx(2.5)
+
+    limiter.release(limiter.acquire(), 200, measure_latency=False)
+    assert limiter.limit == pytest.approx(2.5)
+
+
+# --- 流式响应占用名额 ---
+def test_streamed_response_holds_slot_until_fully_read(limiter):
+    limiter.responses.append(_stream_response())
+    response = gemini_limiter.limited_request('text', 'POST', 'https://gemini.example', stream=True)
+    assert limiter.in_flight == 1
+
+    lines = list(response.iter_lines())
+    assert lines[0] == b'data: {"a": 1}'
+    assert limiter.in_flight == 0
+    assert limiter.stats['success'] == 1
+
+    # 读取完毕后再关闭不会重复归还
+    response.close()
+    assert limiter.in_flight == 0
+    assert limiter.stats['success'] == 1
+
+
+def test_streamed_response_releases_slot_when_closed_early(limiter):
+    limiter.responses.append(_stream_response())
+    with gemini_limiter.limited_request('text', 'POST', 'https://gemini.example', stream=True) as response:
+        lines = response.iter_lines()
+        next(lines)
+        assert limiter.in_flight == 1
+    assert limiter.in_flight == 0
+    assert limiter.stats['success'] == 1
+
+
+def test_failed_stream_and_plain_requests_release_immediately(limiter):
+    limiter.responses.append(_stream_response(b'{"error": {}}', status_code=429))
+    gemini_limiter.limited_request('text', 'POST', 'https://gemini.example', stream=True)
+    assert limiter.in_flight == 0
+    assert limiter.stats['throttled'] == 1
+
+    limiter.responses.append(_stream_response(b'{}'))
+    gemini_limiter.limited_request('text', 'POST', 'https://gemini.example')
+    assert limiter.in_flight == 0
+    assert limiter.stats['success'] == 1
+
+
+def test_release_on_close_calls_back_exactly_once():
+    calls = []
+    response = http_client.release_on_close(_stream_response(), lambda: calls.append(1))
+    assert calls == []
+
+    list(response.iter_content(chunk_size=4))
+    response.close()
+    response.close()
+    assert calls == [1]
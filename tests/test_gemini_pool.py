@@ -0,0 +1,137 @@
+"""Gemini 密钥池测试：密钥轮换、429 冷却、重试等待时间和图像分组的密钥解析"""
+
+import pytest
+
+from app.services import gemini_pool
+
+BASE_URL = 'https://gemini.example'
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, headers=None, body=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self._body = body or {}
+        self.closed = False
+
+    def json(self):
+        return self._body
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """空的密钥池，并记录每次请求使用的密钥；statuses 中按密钥预设响应"""
+    monkeypatch.setattr(gemini_pool, '_pools', {})
+    sent, statuses = [], {}
+
+    def fake_request(group, method, url, **kwargs):
+        key = url.rsplit('key=', 1)[1]
+        sent.append(key)
+        status, headers = statuses.get(key, (200, {}))
+        return FakeResponse(status, headers)
+
+    monkeypatch.setattr(gemini_pool, 'limited_request', fake_request)
+    return sent, statuses
+
+
+def _configure(**overrides):
+    config = {
+        'gemini_api_key': 'key-a',
+        'gemini_base_url': BASE_URL,
+        'gemini_key_pool': [{'api_key': 'key-b'}]
+    }
+    config.update(overrides)
+    gemini_pool.configure_gemini_pool(config)
+
+
+def _post(api_key='key-a'):
+    return gemini_pool.post_gemini('text', api_key, BASE_URL, '/v1beta/models/m:generateContent', {'contents': []})
+
+
+def _cooldowns(group='text'):
+    return {entry['api_key']: entry['cooldown_seconds'] for entry in gemini_pool.get_gemini_pool_stats()[group]}
+
+
+def test_requests_rotate_across_pooled_keys(pool):
+    sent, _ = pool
+    _configure()
+    for _ in range(4):
+        assert _post().status_code == 200
+    assert sent == ['key-a', 'key-b', 'key-a', 'key-b']
+    assert all(entry['in_flight'] == 0 for entry in gemini_pool.get_gemini_pool_stats()['text'])
+
+
+def test_key_outside_pool_is_sent_directly(pool):
+    sent, _ = pool
+    _configure()
+    assert _post('other-key').status_code == 200
+    assert sent == ['other-key']
+
+
+def test_throttled_key_cools_down_and_request_moves_to_next_key(pool):
+    sent, statuses = pool
+    _configure()
+    statuses['key-a'] = (429, {'Retry-After': '30'})
+
+    assert _post().status_code == 200
+    assert sent == ['key-a', 'key-b']
+    cooldowns = _cooldowns()
+    assert 29 <= cooldowns['***ey-a'] <= 30
+    assert cooldowns['***ey-b'] == 0
+
+    # 冷却期间的请求都交给其他密钥
+    _post()
+    _post()
+    assert sent[2:] == ['key-b', 'key-b']
+
+
+def test_last_key_returns_429_to_caller_when_pool_is_exhausted(pool):
+    sent, statuses = pool
+    _configure()
+    statuses['key-a'] = (429, {})
+    statuses['key-b'] = (429, {})
+
+    assert _post().status_code == 429
+    assert sent == ['key-a', 'key-b']
+    # 没有 Retry-After 时按指数冷却的初始值
+    assert all(0 < seconds <= gemini_pool.COOLDOWN_BASE_SECONDS for seconds in _cooldowns().values())
+
+
+def test_retry_delay_waits_for_earliest_pooled_key(pool):
+    _, statuses = pool
+    _configure()
+    statuses['key-a'] = (429, {'Retry-After': '30'})
+    statuses['key-b'] = (429, {'Retry-After': '10'})
+    response = _post()
+
+    delay = gemini_pool.retry_delay('text', 'key-a', response)
+    assert 9 <= delay <= 10
+
+
+def test_retry_delay_for_unpooled_key_uses_retry_after_or_backoff(pool):
+    _configure()
+    assert gemini_pool.retry_delay('text', 'other-key', FakeResponse(429, {'Retry-After': '7'})) == 7
+    assert gemini_pool.retry_delay('text', 'other-key', FakeResponse(429), attempt=1) == gemini_pool.COOLDOWN_BASE_SECONDS
+    assert gemini_pool.retry_delay('text', 'other-key', FakeResponse(429), attempt=3) == gemini_pool.COOLDOWN_BASE_SECONDS * 4
+    assert gemini_pool.retry_delay('text', 'other-key', FakeResponse(429), attempt=20) == gemini_pool.COOLDOWN_MAX_SECONDS
+
+
+def test_image_group_uses_resolved_image_settings(pool):
+    sent, _ = pool
+    # 未单独配置图像密钥时，图像调用方使用主密钥，密钥池中也必须包含主密钥
+    _configure(gemini_image_key_pool=[{'api_key': 'image-extra'}])
+    image_keys = [entry['api_key'] for entry in gemini_pool.get_gemini_pool_stats()['image']]
+    assert image_keys == ['***ey-a', '***xtra']
+
+    gemini_pool.post_gemini('image', 'key-a', BASE_URL, '/v1beta/models/m:generateContent', {})
+    gemini_pool.post_gemini('image', 'key-a', BASE_URL, '/v1beta/models/m:generateContent', {})
+    assert sent == ['key-a', 'image-extra']
+
+
+def test_image_group_prefers_dedicated_image_key(pool):
+    _configure(gemini_image_settings={'api_key': 'image-key'})
+    image_keys = [entry['api_key'] for entry in gemini_pool.get_gemini_pool_stats()['image']]
+    assert image_keys == ['***-key']
@@ -0,0 +1,107 @@
+"""GFWList 规则引擎测试：域名锚点、前缀规则、例外规则和编译快照的失效"""
+
+import os
+
+import pytest
+
+from app.utils import filters
+from app.utils.gfwlist import GfwRuleSet, load_rule_set
+
+RULES = """[AutoProxy 0.2.9]
+! 注释行
+||blocked.com
+|http://prefix.example.org/path
+.dotted.net
+plain.org/news
+||*.wild.com
+/^https?:\\/\\/[^\\/]+\\.regex\\.cn/
+@@||safe.blocked.com
+@@|http://plain.org/news/ok
+"""
+
+
+@pytest.fixture
+def rule_file(tmp_path):
+    path = tmp_path / 'list.txt'
+    path.write_text(RULES, encoding='utf-8')
+    return path
+
+
+@pytest.fixture
+def rules(rule_file):
+    return GfwRuleSet.parse(str(rule_file))
+
+
+def test_domain_anchor_matches_domain_and_subdomains(rules):
+    assert rules.match('https://blocked.com/') == '||blocked.com'
+    assert rules.match('http://www.blocked.com/a?b=1') == '||blocked.com'
+    assert rules.match('https://notblocked.com/') is None
+    assert rules.match('https://blocked.com.cn/') is None
+
+
+def test_prefix_rule_requires_exact_host_and_url_prefix(rules):
+    assert rules.match('http://prefix.example.org/path/page.html') == '|http://prefix.example.org/path'
+    assert rules.match('https://prefix.example.org/path') is None
+    assert rules.match('http://prefix.example.org/other') is None
+    assert rules.match('http://sub.prefix.example.org/path') is None
+
+
+def test_plain_and_generic_rules(rules):
+    assert rules.match('https://www.dotted.net/') == '.dotted.net'
+    assert rules.match('http://plain.org/news/1.html') == 'plain.org/news'
+    assert rules.match('http://plain.org/sports') is None
+    assert rules.match('https://a.wild.com/') == '||*.wild.com'
+    assert rules.match('https://www.regex.cn/') == r'/^https?:\/\/[^\/]+\.regex\.cn/'
+
+
+def test_exception_rules_override_blacklist(rules):
+    assert rules.match('https://safe.blocked.com/') is None
+    assert rules.match('https://deep.safe.blocked.com/') is None
+    assert rules.match('http://plain.org/news/ok/1') is None
+    assert rules.match('https://other.blocked.com/') == '||blocked.com'
+
+
+def test_invalid_input_is_not_blocked(rules):
+    assert rules.match('') is None
+    assert rules.match('not a url') is None
+    assert rules.rule_count == 8
+
+
+def test_snapshot_is_reused_until_rule_file_changes(rule_file):
+    snapshot = f'{rule_file}.snapshot'
+    rules, from_snapshot = load_rule_set(str(rule_file))
+    assert not from_snapshot and os.path.exists(snapshot)
+    rules, from_snapshot = load_rule_set(str(rule_file))
+    assert from_snapshot
+    assert rules.match('https://blocked.com/') == '||blocked.com'
+
+    # 规则文件变化（大小和修改时间）后快照失效，重新编译
+    rule_file.write_text(RULES + '||newly-blocked.com\n', encoding='utf-8')
+    stat = os.stat(rule_file)
+    os.utime(rule_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    rules, from_snapshot = load_rule_set(str(rule_file))
+    assert not from_snapshot
+    assert rules.match('https://newly-blocked.com/') == '||newly-blocked.com'
+    assert load_rule_set(str(rule_file))[1]
+
+
+def test_corrupt_snapshot_is_rebuilt(rule_file):
+    load_rule_set(str(rule_file))
+    with open(f'{rule_file}.snapshot', 'wb') as f:
+        f.write(b'not a pickle')
+    rules, from_snapshot = load_rule_set(str(rule_file))
+    assert not from_snapshot
+    assert rules.match('https://blocked.com/') == '||blocked.com'
+
+
+def test_failed_load_is_retried(monkeypatch, tmp_path, rule_file):
+    missing = tmp_path / 'missing.txt'
+    monkeypatch.setattr(filters, 'GFW_RULES', None)
+    monkeypatch.setattr(filters, 'GFWLIST_LOADED', False)
+    monkeypatch.setattr(filters, 'BLACKLIST_FILE', str(missing))
+    assert filters.load_gfwlist_blacklist() is None
+    assert not filters.GFWLIST_LOADED
+
+    missing.write_text(RULES, encoding='utf-8')
+    assert filters.is_domain_blacklisted('https://blocked.com/') == '||blocked.com'
+    assert filters.GFWLIST_LOADED
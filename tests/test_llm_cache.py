@@ -0,0 +1,62 @@
+"""LLM 响应缓存测试：磁盘条目上限（内存计数）和清空缓存"""
+
+import sqlite3
+from collections import OrderedDict
+
+import pytest
+
+from app.services import llm_cache
+
+
+@pytest.fixture(autouse=True)
+def memory_cache(monkeypatch):
+    conn = sqlite3.connect(':memory:', check_same_thread=False, isolation_level=None)
+    conn.executescript(llm_cache._SCHEMA)
+    monkeypatch.setattr(llm_cache, '_connection', conn)
+    monkeypatch.setattr(llm_cache, '_memory', OrderedDict())
+    monkeypatch.setattr(llm_cache, '_disk_count', {'entries': None})
+    monkeypatch.setattr(llm_cache, '_settings', {
+        'enabled': True,
+        'ttls': dict(llm_cache.DEFAULT_CACHE_TTLS),
+        'memory_entries': 2,
+        'disk_entries': 3
+    })
+    return conn
+
+
+def _disk_count(conn):
+    return conn.execute('SELECT COUNT(*) FROM llm_cache').fetchone()[0]
+
+
+def test_disk_entries_are_capped_and_counted_in_memory(memory_cache):
+    for index in range(5):
+        llm_cache.put_cached_response('summary', f'key-{index}', {'index': index})
+    assert _disk_count(memory_cache) == 3
+    assert llm_cache.get_llm_cache_stats()['disk_entries'] == 3
+
+    # 覆盖已有条目不增加计数
+    llm_cache.put_cached_response('summary', 'key-4', {'index': 'again'})
+    assert _disk_count(memory_cache) == 3
+    assert llm_cache.get_llm_cache_stats()['disk_entries'] == 3
+
+    # 最早写入的条目被淘汰，其余仍可从磁盘读回
+    assert llm_cache.get_cached_response('summary', 'key-0') is None
+    assert llm_cache.get_cached_response('summary', 'key-2') == {'index': 2}
+
+
+def test_count_starts_from_existing_rows(memory_cache):
+    memory_cache.execute(
+        "INSERT INTO llm_cache (cache_key, call_type, response, created_at, accessed_at) VALUES ('old', 'summary', '{}', 0, 0)"
+    )
+    for index in range(3):
+        llm_cache.put_cached_response('summary', f'key-{index}', {'index': index})
+    assert _disk_count(memory_cache) == 3
+    assert llm_cache.get_cached_response('summary', 'old') is None
+
+
+def test_clear_empties_memory_and_disk(memory_cache):
+    llm_cache.put_cached_response('summary', 'key', {'value': 1})
+    assert llm_cache.clear_llm_cache() == 1
+    assert _disk_count(memory_cache) == 0
+    assert llm_cache.get_llm_cache_stats()['disk_entries'] == 0
+    assert llm_cache.get_cached_response('summary', 'key') is None
@@ -0,0 +1,144 @@
+"""全局调度器测试：批次间轮询、取消排队 / 运行中的作业、取消延迟作业后释放名额"""
+
+import threading
+
+import pytest
+
+from app.services.scheduler import ArticleScheduler, SchedulerBusyError
+
+WAIT = 5
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = ArticleScheduler(max_workers=1, name='test')
+    yield scheduler
+    scheduler.shutdown()
+
+
+def _blocker(scheduler, batch_id='gate'):
+    """提交一个占住唯一工作线程的作业，返回 (已开始, 放行) 两个事件"""
+    started, release = threading.Event(), threading.Event()
+
+    def block():
+        started.set()
+        release.wait(WAIT)
+        return 'blocked'
+
+    scheduler.submit(batch_id, block, key='blocker')
+    assert started.wait(WAIT)
+    return started, release
+
+
+def _recorder(order, done, expected):
+    def record(name):
+        order.append(name)
+        if len(order) == expected:
+            done.set()
+    return record
+
+
+def test_batches_are_served_round_robin(scheduler):
+    _, release = _blocker(scheduler)
+    order, done = [], threading.Event()
+    record = _recorder(order, done, 5)
+    for name in ('a1', 'a2', 'a3'):
+        scheduler.submit('A', record, (name,))
+    for name in ('b1', 'b2'):
+        scheduler.submit('B', record, (name,))
+
+    release.set()
+    assert done.wait(WAIT)
+    assert order == ['a1', 'b1', 'a2', 'b2', 'a3']
+
+
+def test_higher_priority_batch_runs_first(scheduler):
+    _, release = _blocker(scheduler)
+    order, done = [], threading.Event()
+    record = _recorder(order, done, 4)
+    scheduler.submit('low', record, ('low1',))
+    scheduler.submit('low', record, ('low2',))
+    scheduler.submit('high', record, ('high1',), priority=5)
+    scheduler.submit('high', record, ('high2',), priority=5)
+
+    release.set()
+    assert done.wait(WAIT)
+    assert order == ['high1', 'high2', 'low1', 'low2']
+
+
+def test_cancel_removes_queued_job_but_not_running_one(scheduler):
+    callbacks = {}
+    finished = threading.Event()
+    started, release = threading.Event(), threading.Event()
+
+    def running_job():
+        started.set()
+        release.wait(WAIT)
+        return 'done'
+
+    def on_done(key):
+        def callback(result, error):
+            callbacks[key] = (result, error)
+            if key == 'running':
+                finished.set()
+        return callback
+
+    scheduler.submit('batch', running_job, callback=on_done('running'), key='running')
+    assert started.wait(WAIT)
+    scheduler.submit('batch', lambda: 'never', callback=on_done('queued'), key='queued')
+
+    cancelled = RuntimeError('cancelled')
+    # 运行中的作业不会被移除
+    assert scheduler.cancel('batch', keys={'running'}, error=cancelled) == 0
+    assert scheduler.cancel('batch', keys={'queued'}, error=cancelled) == 1
+    assert callbacks['queued'] == (None, cancelled)
+    assert scheduler.get_batch_stats('batch')['queued'] == 0
+
+    release.set()
+    assert finished.wait(WAIT)
+    assert callbacks['running'] == ('done', None)
+
+
+def test_cancelling_delayed_job_releases_capacity(scheduler):
+    errors = []
+    scheduler.submit('retry', lambda: 'late', callback=lambda result, error: errors.append(error), delay=60, key='topic')
+    stats = scheduler.get_batch_stats('retry')
+    assert stats['retry_waiting'] == 1
+    # 延迟作业计入排队上限
+    with pytest.raises(SchedulerBusyError):
+        scheduler.check_admission(1, max_queued=1)
+
+    cancelled = RuntimeError('cancelled')
+    assert scheduler.cancel('retry', error=cancelled) == 1
+    assert errors == [cancelled]
+    assert scheduler.get_batch_stats('retry')['retry_waiting'] == 0
+    scheduler.check_admission(1, max_queued=1)
+
+    # 唯一的工作线程立即可用于其他批次
+    ran = threading.Event()
+    scheduler.submit('other', ran.set)
+    assert ran.wait(WAIT)
+
+
+def test_delayed_job_runs_after_delay(scheduler):
+    results = []
+    done = threading.Event()
+
+    def callback(result, error):
+        results.append((result, error))
+        done.set()
+
+    scheduler.submit('retry', lambda: 'ok', callback=callback, delay=0.05)
+    assert done.wait(WAIT)
+    assert results == [('ok', None)]
+
+
+def test_raising_max_workers_runs_queued_jobs(scheduler):
+    _, release = _blocker(scheduler)
+    ran = threading.Event()
+    scheduler.submit('other', ran.set)
+    assert not ran.wait(0.1)
+
+    scheduler.set_max_workers(2)
+    assert ran.wait(WAIT)
+    release.set()
@@ -0,0 +1,63 @@
+"""引用来源解析缓存测试：内存层条数上限和按需删除的域名锁"""
+
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import pytest
+
+from app.utils import site_cache
+
+
+@pytest.fixture(autouse=True)
+def memory_cache(monkeypatch):
+    conn = sqlite3.connect(':memory:', check_same_thread=False, isolation_level=None)
+    conn.executescript(site_cache._SCHEMA)
+    monkeypatch.setattr(site_cache, '_connection', conn)
+    monkeypatch.setattr(site_cache, '_site_names', OrderedDict())
+    monkeypatch.setattr(site_cache, '_resolved_urls', OrderedDict())
+    monkeypatch.setattr(site_cache, '_domain_locks', {})
+    monkeypatch.setattr(site_cache, 'MEMORY_ENTRIES', 2)
+
+
+def test_memory_layer_evicts_least_recently_used_entries():
+    for index in range(3):
+        site_cache.put_resolved_url(f'https://r/{index}', (f'https://real/{index}', 't', 's', 'zh'))
+    assert list(site_cache._resolved_urls) == ['https://r/1', 'https://r/2']
+
+    # 淘汰的条目仍可从 SQLite 读回，并成为最近使用的条目
+    assert site_cache.get_resolved_url('https://r/0') == ('https://real/0', 't', 's', 'zh')
+    assert list(site_cache._resolved_urls) == ['https://r/2', 'https://r/0']
+
+    site_cache.put_site_name('a.com', 'A')
+    site_cache.put_site_name('b.com', 'B')
+    assert site_cache.get_site_name('a.com') == 'A'
+    site_cache.put_site_name('c.com', '')
+    assert list(site_cache._site_names) == ['a.com', 'c.com']
+    assert site_cache.get_site_name('b.com') == 'B'
+
+
+def test_domain_lock_is_dropped_when_unused():
+    with site_cache.domain_lock('a.com'):
+        assert 'a.com' in site_cache._domain_locks
+    assert site_cache._domain_locks == {}
+
+
+def test_domain_lock_serialises_same_domain():
+    entered, inside = threading.Event(), []
+
+    def worker():
+        with site_cache.domain_lock('a.com'):
+            inside.append('worker')
+        entered.set()
+
+    with site_cache.domain_lock('a.com'):
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        assert not entered.wait(0.1)
+        assert inside == []
+        assert site_cache._domain_locks['a.com'][1] == 2
+    assert entered.wait(5)
+    thread.join(5)
+    assert inside == ['worker']
+    assert site_cache._domain_locks == {}